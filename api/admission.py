@@ -0,0 +1,90 @@
+import asyncio
+import math
+import os
+import time
+
+import redis.exceptions
+from prometheus_client import Counter
+
+from storage.task_queue import CONSUMER_GROUP, LANE_MAX_BACKLOG, TASK_STREAMS
+
+# How long a lane's measured backlog is reused before Redis is asked again
+ADMISSION_SAMPLE_SECONDS = float(os.getenv("ADMISSION_SAMPLE_SECONDS", 1))
+# Retry-After when the workers' drain rate hasn't been measured yet, and the most ever suggested
+DEFAULT_RETRY_AFTER_SECONDS = int(os.getenv("DEFAULT_RETRY_AFTER_SECONDS", 10))
+MAX_RETRY_AFTER_SECONDS = int(os.getenv("MAX_RETRY_AFTER_SECONDS", 60))
+# Weight of the newest measurement in the smoothed drain rate
+DRAIN_RATE_SMOOTHING = 0.3
+
+TASKS_REJECTED = Counter("api_tasks_rejected", "Tasks refused with 429 because their lane was full", ["lane"])
+
+
+class AdmissionController:
+    """
+    Refuses new tasks while their lane's backlog (tasks not yet delivered to a worker, plus tasks
+    delivered but not finished) is at LANE_MAX_BACKLOG, and suggests when to retry from how fast
+    the workers have been draining the lane.
+
+    The backlog is read from Redis at most every ADMISSION_SAMPLE_SECONDS; tasks this process
+    admits in between are counted locally, so a burst can't overshoot the limit.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._locks = {lane: asyncio.Lock() for lane in TASK_STREAMS}
+        # lane -> (sampled_at, backlog, entries_read)
+        self._samples = {}
+        self._admitted_since_sample = dict.fromkeys(TASK_STREAMS, 0)
+        self._drain_rates = {}
+
+    async def _sample(self, lane):
+        stream = TASK_STREAMS[lane]
+        try:
+            groups = await self.redis_client.xinfo_groups(stream)
+        except redis.exceptions.ResponseError:
+            # The stream doesn't exist until the first task is queued
+            return 0, None
+        group = next((group for group in groups if group["name"] == CONSUMER_GROUP), None)
+        if group is None:
+            # No worker has joined yet, so every entry is waiting
+            return await self.redis_client.xlen(stream), None
+        # Redis reports no lag (before 7.0, or after entries were trimmed) when it can't compute it
+        return (group.get("lag") or 0) + group["pending"], group.get("entries-read")
+
+    async def backlog(self, lane: str) -> int:
+        """
+        Returns the estimated number of tasks waiting or running in a lane.
+        """
+        async with self._locks[lane]:
+            now = time.monotonic()
+            previous = self._samples.get(lane)
+            if previous is None or now - previous[0] >= ADMISSION_SAMPLE_SECONDS:
+                backlog, entries_read = await self._sample(lane)
+                if previous and previous[2] is not None and entries_read is not None and entries_read >= previous[2]:
+                    rate = (entries_read - previous[2]) / (now - previous[0])
+                    smoothed = self._drain_rates.get(lane)
+                    self._drain_rates[lane] = (
+                        rate if smoothed is None else DRAIN_RATE_SMOOTHING * rate + (1 - DRAIN_RATE_SMOOTHING) * smoothed
+                    )
+                self._samples[lane] = (now, backlog, entries_read)
+                self._admitted_since_sample[lane] = 0
+            return self._samples[lane][1] + self._admitted_since_sample[lane]
+
+    async def admit(self, lane: str):
+        """
+        Decides whether a new task may be queued on a lane, and counts it if so.
+
+        Returns:
+            None if the task is admitted, otherwise the seconds the client should wait before retrying.
+        """
+        backlog = await self.backlog(lane)
+        excess = backlog - LANE_MAX_BACKLOG[lane] + 1
+        if excess <= 0:
+            self._admitted_since_sample[lane] += 1
+            return None
+
+        TASKS_REJECTED.labels(lane).inc()
+        drain_rate = self._drain_rates.get(lane)
+        if not drain_rate:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(excess / drain_rate)))
@@ -1,23 +1,80 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import List
+
 import uvicorn
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Query, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from backend.pdf_extract import process_pdf
-from storage.s3_utils import s3_client, S3_BUCKET_NAME,generate_presigned_url
+from backend.converter_pool import DEFAULT_INGEST_PROFILE, INGEST_PROFILES
+from backend.dedup_cache import get_dedup_stats
+from backend.document_catalog import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, catalog_version, list_catalog, rebuild_catalog
+from api.admission import AdmissionController
+from api.result_events import ResultNotifier, read_token_events, wait_for_result
+from backend.ingest_jobs import (
+    get_batch_status,
+    get_job_status,
+    shutdown_ingest_pool,
+    start_ingest_pool,
+    submit_ingest_batch,
+    submit_ingest_job,
+)
+from storage.metrics_utils import LATENCY_BUCKETS, StreamBacklogCollector, build_metrics_registry, render_metrics
+from storage.s3_utils import S3_MAX_POOL_CONNECTIONS, get_object_content_hash, object_key_from_url
+from storage.redis_utils import REDIS_MAX_CONNECTIONS, get_async_redis_client, redis_client
+from storage.result_store import decode_result, result_key
+from storage.task_queue import TASK_STREAMS, create_consumer_groups, lane_for_task, new_task_id
+from storage.tracing import Trace, new_trace_id, store_trace_async, trace_breakdown, trace_key
+from prometheus_client import Histogram
 from pydantic import BaseModel
-import redis
-import requests
-import ast
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
+# Configured once here; library modules only log through their loggers
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+# Created in lifespan startup, on the loop that serves requests:
+# the pooled async Redis client used by every request handler,
+async_redis_client = None
+# the completion-event listener used by the long-poll and SSE result endpoints,
+result_notifier = None
+# the admission check of new tasks against their lane's backlog,
+admission = None
+# and the threads that run blocking boto3 calls, one per pooled S3 connection
+s3_executor = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global async_redis_client, result_notifier, admission, s3_executor
+    # Start the ingest workers; each loads docling's models once so the first upload doesn't pay for it
+    started = time.perf_counter()
+    start_ingest_pool()
+    print(f"Ingest pool started with warm DocumentConverters in {time.perf_counter() - started:.2f}s")
+    async_redis_client = get_async_redis_client(max_connections=REDIS_MAX_CONNECTIONS)
+    result_notifier = ResultNotifier(async_redis_client)
+    admission = AdmissionController(async_redis_client)
+    s3_executor = ThreadPoolExecutor(max_workers=S3_MAX_POOL_CONNECTIONS, thread_name_prefix="api-s3")
+    await result_notifier.start()
+    # Lanes get their consumer groups before the first task is queued, so none is skipped
+    await asyncio.to_thread(create_consumer_groups, redis_client)
+    # Seed the document catalog from the bucket the first time, without holding up startup
+    catalog_seed = asyncio.create_task(asyncio.to_thread(rebuild_catalog)) if catalog_version() is None else None
+    yield
+    if catalog_seed:
+        catalog_seed.cancel()
+    await result_notifier.stop()
+    await async_redis_client.aclose()
+    s3_executor.shutdown(wait=False)
+    shutdown_ingest_pool()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,12 +84,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Connect to Redis
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT,password=REDIS_PASSWORD, decode_responses=True)
+# Approximate cap on the length of each task lane's stream; workers also trim entries by age
+TASK_STREAM_MAXLEN = int(os.getenv("TASK_STREAM_MAXLEN", 10000))
+
+# Served on /metrics: this process's and the ingest workers' metrics, plus the backlog of each task lane
+metrics_registry = build_metrics_registry(
+    [StreamBacklogCollector(redis_client, stream) for stream in TASK_STREAMS.values()]
+)
+API_REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "Time to answer an API request, up to the start of the response body",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
 
-# Redis stream keys
-TASK_STREAM = "task_stream"
-RESULT_STREAM = "result_stream"
+# Longest a single /get_result long-poll may wait
+MAX_RESULT_WAIT_SECONDS = 60
+# Most task IDs accepted by one /results batch lookup
+MAX_BATCH_RESULT_IDS = 100
+# Interval between keep-alive comments on the SSE endpoint
+SSE_KEEPALIVE_SECONDS = 15
+# A token stream that sees no entries and no result for this long ends with an "error" event
+SSE_STREAM_IDLE_SECONDS = int(os.getenv("SSE_STREAM_IDLE_SECONDS", 300))
+
+@app.middleware("http")
+async def record_request_time(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Labelled by route template, not the raw path, so task IDs don't create new series
+    route = request.scope.get("route")
+    API_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: request latency, ingestion stages, S3 transfers and the task lanes' backlog.
+    """
+    body, content_type = await asyncio.to_thread(render_metrics, metrics_registry)
+    return Response(content=body, media_type=content_type)
 
 # Request models for summarization and question answering
 class SummarizeRequest(BaseModel):
@@ -45,134 +135,421 @@ class AskQuestionRequest(BaseModel):
     question: str
 
 @app.get("/select_pdfcontent/")
-async def select_pdfcontent():
+async def select_pdfcontent(
+    request: Request,
+    prefix: str = "",
+    cursor: str = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
     """
-    Lists all previously processed PDFs stored in S3, along with their Markdown and image files.
+    Lists previously processed PDFs from the document catalog, one page at a time.
+
+    Filter by name with ?prefix=, and pass the returned next_cursor as ?cursor= for the
+    following page. Responses carry the catalog version as an ETag, so clients can
+    revalidate with If-None-Match and get a 304 when nothing changed.
     """
     try:
-        # Step 1: List objects in the S3 bucket
-        response = s3_client.list_objects_v2(Bucket=S3_BUCKET_NAME)
-
-        # Step 2: Organize files under their respective PDF groups
-        pdf_files = {}
+        # Step 1: Answer 304 if the client already has this version of the catalog
+        etag = f'"{await asyncio.to_thread(catalog_version) or 0}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
 
-        if "Contents" in response:
-            for obj in response["Contents"]:
-                object_key = obj["Key"]
-
-                # Extract top-level PDF folder name
-                parts = object_key.split("/")
-                if len(parts) > 1:
-                    pdf_name = parts[0]  # e.g., "example_pdf"
-
-                    # Group all markdown and images under each PDF name
-                    if pdf_name not in pdf_files:
-                        pdf_files[pdf_name] = {"markdown": None, "images": []}
+        # Step 2: Read one page of catalog entries, grouped by PDF name as before
+        page = await asyncio.to_thread(list_catalog, prefix=prefix, cursor=cursor, limit=limit)
+        pdf_files = {
+            entry["pdf_filename"]: {"markdown": entry["markdown"], "images": entry["images"]}
+            for entry in page["entries"]
+        }
 
-                    if "markdown" in object_key:
-                        pdf_files[pdf_name]["markdown"] = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{object_key}"
-                    elif "images" in object_key:
-                        pdf_files[pdf_name]["images"].append(f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{object_key}")
+        return JSONResponse(
+            content={"processed_pdfs": pdf_files, "next_cursor": page["next_cursor"], "total": page["total"]},
+            headers={"ETag": etag},
+        )
 
-        return {"processed_pdfs": pdf_files}
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
 
+@app.post("/catalog/rebuild")
+async def catalog_rebuild():
+    """
+    Rebuilds the document catalog from the per-document manifests in S3.
+    """
+    try:
+        count = await asyncio.to_thread(rebuild_catalog)
+        return {"status": "rebuilt", "documents": count}
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @app.post("/upload_pdf/")
-async def upload_pdf(file: UploadFile = File(...)):
+async def upload_pdf(file: UploadFile = File(...), profile: str = Form(DEFAULT_INGEST_PROFILE)):
     """
-    Handles PDF file upload, processes it, and stores results in S3.
+    Queues an uploaded PDF for conversion and returns an ingest job id right away.
+    Poll /ingest_status/{job_id} for progress, the resulting S3 URLs and per-stage timings.
+
+    The optional "profile" form field picks how much is extracted: "fast" (text only),
+    "standard" (text and figures) or "full" (text, figures and table structure).
     """
+    if profile not in INGEST_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown profile {profile!r}; expected one of {', '.join(INGEST_PROFILES)}")
+
     try:
         # Step 1: Read the uploaded file content
         file_content = await file.read()
 
-        # Step 2: Call process_pdf with original filename for structured S3 storage
-        result = process_pdf(file_content, file.filename)
+        # Step 2: Hand the conversion to the ingest process pool so the event loop stays free
+        job_id = await asyncio.to_thread(submit_ingest_job, file_content, file.filename, profile)
 
-        # Step 3: Return the S3 URLs and other details
+        # Step 3: Return the job id to poll
         return {
-            "message": result["message"],
-            "markdown_s3_url": result["markdown_s3_url"],  # Markdown URL
-            "image_s3_urls": result["image_s3_urls"],      # List of Image URLs
-            "pdf_filename": result["pdf_filename"],        # Filename without extension (used for grouping)
-            "status": result["status"]
+            "message": "PDF queued for processing",
+            "job_id": job_id,
+            "status": "queued",
+            "profile": profile
         }
 
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/ingest_status/{job_id}")
+async def ingest_status(job_id: str):
+    """
+    Reports an ingest job's status (queued, converting, uploading, done or failed).
+    Once done, the response includes the markdown and image S3 URLs.
+    """
+    job = await asyncio.to_thread(get_job_status, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job
+
+@app.post("/ingest_batch/")
+async def ingest_batch(
+    files: List[UploadFile] = File(None),
+    s3_keys: List[str] = Form(None),
+    profile: str = Form(DEFAULT_INGEST_PROFILE),
+):
+    """
+    Queues many PDFs at once, for backfills: uploaded as repeated "files" parts, given as
+    repeated "s3_keys" fields naming PDFs already in the bucket, or both.
+    Poll /ingest_batch/{batch_id} for per-document progress and throughput.
+
+    Documents are converted in parallel by the ingest workers, and each document's uploads
+    overlap with the conversion of the next one.
+    """
+    try:
+        # Step 1: Read the uploaded files; S3 sources are downloaded by the workers
+        uploads = [(file.filename, await file.read()) for file in files or []]
+        source_keys = [key.strip() for key in s3_keys or [] if key.strip()]
+
+        # Step 2: Queue one ingest job per document under a shared batch id
+        batch_id = await asyncio.to_thread(submit_ingest_batch, uploads, source_keys, profile)
+
+        return {
+            "message": "PDFs queued for processing",
+            "batch_id": batch_id,
+            "documents": len(uploads) + len(source_keys),
+            "status": "queued",
+            "profile": profile
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.get("/ingest_batch/{batch_id}")
+async def ingest_batch_status(batch_id: str):
+    """
+    Reports a batch's per-document status, counts by status, elapsed time, and the documents
+    and pages processed per hour.
+    """
+    batch = await asyncio.to_thread(get_batch_status, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Ingest batch not found")
+    return batch
+
+@app.get("/ingest_cache_stats")
+async def ingest_cache_stats():
+    """
+    Reports hit and miss counts of the content-addressed PDF dedup cache.
+    """
+    try:
+        return await asyncio.to_thread(get_dedup_stats)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+async def run_s3_call(func, *args):
+    """
+    Runs a blocking boto3 call on the S3 threads, so the event loop keeps serving other requests.
+    """
+    return await asyncio.get_running_loop().run_in_executor(s3_executor, partial(func, *args))
+
+async def resolve_document(document_url: str) -> dict:
+    """
+    Turns a document URL into the S3 reference carried by a task instead of the document body.
+    """
+    object_key = object_key_from_url(document_url)
+    if not object_key:
+        raise HTTPException(status_code=400, detail="Document must be a processed file in the S3 bucket.")
+    try:
+        document_hash = await run_s3_call(get_object_content_hash, object_key)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return {"document_key": object_key, "document_hash": document_hash}
+
+async def check_admission(task_type: str):
+    """
+    Refuses a new task with 429 and a Retry-After header while its lane's backlog is full.
+    """
+    lane = lane_for_task(task_type)
+    retry_after = await admission.admit(lane)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many {lane} tasks are waiting; retry in {retry_after} seconds.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+async def enqueue_task(fields: dict, trace: Trace) -> str:
+    """
+    Adds a task to its lane's Redis stream, trimming old entries so the stream stays bounded.
+    The trace id and enqueue time travel with the task so the worker can continue the trace.
+    """
+    lane = lane_for_task(fields["task_type"])
+    task_id = new_task_id()
+    with trace.span("enqueue", lane=lane):
+        await async_redis_client.xadd(
+            TASK_STREAMS[lane],
+            {**fields, "task_id": task_id, "trace_id": trace.trace_id, "enqueued_at": repr(time.time())},
+            maxlen=TASK_STREAM_MAXLEN,
+            approximate=True,
+        )
+    trace.task_id = task_id
+    await store_trace_async(async_redis_client, trace)
+    return task_id
+
+async def record_delivery(task_id: str, started: float, endpoint: str):
+    """
+    Adds a "deliver" span to a task's trace when its result is handed to a client.
+    """
+    trace = Trace("api", task_id=task_id)
+    trace.add_span("deliver", started, time.time(), endpoint=endpoint)
+    try:
+        await store_trace_async(async_redis_client, trace)
+    except Exception as e:
+        # Tracing must never fail the request it describes
+        print(f"Could not record delivery of Task ID {task_id}: {e}")
+
 @app.post("/summarize")
 async def summarize(request: SummarizeRequest):
     try:
-        document_url = request.document_url
-        s3_base_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/"
-        if document_url.startswith(s3_base_url):
-            object_key = document_url.replace(s3_base_url, "")
-            signed_url = generate_presigned_url(object_key)
-            if not signed_url:
-                raise HTTPException(status_code=500, detail="Failed to generate signed URL.")
-            document_url = signed_url
-
-
-        markdown_response = requests.get(document_url)
-        if markdown_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to fetch document content.")
-        
-        markdown_content = markdown_response.text
-
-        # Add summarization task to Redis stream
-        task_id = redis_client.xadd(
-            TASK_STREAM,
+        # Refuse the task up front while the bulk lane is full
+        await check_admission("summarize")
+
+        trace = Trace("api", new_trace_id())
+        with trace.span("resolve_document"):
+            document = await resolve_document(request.document_url)
+
+        # Add summarization task to its lane's Redis stream
+        task_id = await enqueue_task(
             {
                 "task_type": "summarize",
                 "model_name": request.model_name,
-                "document_content": markdown_content,
+                **document,
             },
+            trace,
         )
         return {"status": "Task added", "task_id": task_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding summarization task: {str(e)}")
 
 @app.post("/ask_question")
 async def ask_question(request: AskQuestionRequest):
     try:
-        # Add question answering task to Redis stream
-        task_id = redis_client.xadd(
-            TASK_STREAM,
+        # Refuse the task up front while the interactive lane is full
+        await check_admission("ask_question")
+
+        trace = Trace("api", new_trace_id())
+        with trace.span("resolve_document"):
+            document = await resolve_document(request.document_url)
+
+        # Add question answering task to its lane's Redis stream
+        task_id = await enqueue_task(
             {
                 "task_type": "ask_question",
                 "model_name": request.model_name,
-                "document_content": request.document_url,
                 "question": request.question,
+                **document,
             },
+            trace,
         )
         print(task_id)
         return {"status": "Task added", "task_id": task_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error adding question answering task: {str(e)}")
 
+def format_result(task_id: str, result: str) -> dict:
+    """
+    Converts a stored result into the response returned to clients.
+    """
+    result_data = decode_result(result)
+
+    formatted = {
+        "task_id": task_id,
+        "result": result_data.get("result", "No result available."),
+        "input_tokens": result_data.get("input_tokens", "N/A"),
+        "output_tokens": result_data.get("output_tokens", "N/A"),
+        "cost": result_data.get("cost", "Cost unavailable.")
+    }
+    # Set when the task failed for good and was moved to the dead-letter stream
+    if result_data.get("error"):
+        formatted["error"] = result_data["error"]
+    # The model that answered, which differs from the requested one when a hedged call went to the fallback
+    if result_data.get("served_by"):
+        formatted["served_by"] = result_data["served_by"]
+    if result_data.get("hedge_cost"):
+        formatted["hedge_cost"] = result_data["hedge_cost"]
+    return formatted
+
 @app.get("/get_result/{task_id}")
-async def get_result(task_id: str):
+async def get_result(task_id: str, wait: float = Query(0, ge=0, le=MAX_RESULT_WAIT_SECONDS)):
+    """
+    Returns a task's result. With ?wait=N, holds the request open for up to N seconds
+    and answers as soon as the worker publishes the result.
+    """
+    started = time.time()
     try:
-        # Retrieve the result from Redis stream or cache
-        result = redis_client.hget(RESULT_STREAM, task_id)
+        # Retrieve the result from Redis, waiting for the completion event if asked to
+        result = await wait_for_result(async_redis_client, result_notifier, task_id, wait)
         if not result:
             raise HTTPException(status_code=404, detail="Result not found")
 
         print(f"Retrieved result for Task ID {task_id}: {result}")
-        # Convert Redis string back to dictionary
-        result_data = ast.literal_eval(result)
+        await record_delivery(task_id, started, "get_result")
+        return format_result(task_id, result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving result: {str(e)}")
 
+@app.get("/results")
+async def get_results(ids: str = Query(..., description="Comma-separated task IDs")):
+    """
+    Returns the results of several tasks in one round trip. Tasks that haven't finished
+    (or whose results have expired) are listed under "pending".
+    """
+    task_ids = list(dict.fromkeys(task_id.strip() for task_id in ids.split(",") if task_id.strip()))
+    if not task_ids:
+        raise HTTPException(status_code=400, detail="No task IDs given")
+    if len(task_ids) > MAX_BATCH_RESULT_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_RESULT_IDS} task IDs per request")
+
+    try:
+        stored = await async_redis_client.mget([result_key(task_id) for task_id in task_ids])
         return {
-            "task_id": task_id,
-            "result": result_data.get("result", "No result available."),
-            "input_tokens": result_data.get("input_tokens", "N/A"),
-            "output_tokens": result_data.get("output_tokens", "N/A"),
-            "cost": result_data.get("cost", "Cost unavailable.")
+            "results": [format_result(task_id, result) for task_id, result in zip(task_ids, stored) if result],
+            "pending": [task_id for task_id, result in zip(task_ids, stored) if not result],
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error retrieving result: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving results: {str(e)}")
+
+@app.get("/results/{task_id}/events")
+async def result_events(task_id: str, request: Request):
+    """
+    Server-Sent Events stream that sends a single "result" event the moment the task completes.
+    """
+    started = time.time()
+
+    async def event_stream():
+        while not await request.is_disconnected():
+            result = await wait_for_result(
+                async_redis_client, result_notifier, task_id, SSE_KEEPALIVE_SECONDS
+            )
+            if result:
+                yield f"event: result\ndata: {json.dumps(format_result(task_id, result))}\n\n"
+                await record_delivery(task_id, started, "events")
+                return
+            yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/results/{task_id}/stream")
+async def stream_result(task_id: str, request: Request):
+    """
+    Server-Sent Events stream relaying the answer as the model generates it: "token" events
+    carry text deltas, and a final "result" event carries the full result with token counts and cost.
+    A "reset" event means the task was restarted and the deltas sent so far should be discarded.
+    An "error" event ends the stream when neither tokens nor a result show up for SSE_STREAM_IDLE_SECONDS.
+    """
+    started = time.time()
+
+    async def event_stream():
+        # The result may exist without tokens to tail: cached, written before the client connected,
+        # or outliving its token stream; so it's checked first and again whenever the tokens go quiet
+        result = await async_redis_client.get(result_key(task_id))
+        if result:
+            yield f"event: result\ndata: {json.dumps(format_result(task_id, result))}\n\n"
+            await record_delivery(task_id, started, "stream")
+            return
+        last_id = "0-0"
+        idle_since = time.monotonic()
+        while not await request.is_disconnected():
+            entries, last_id = await read_token_events(async_redis_client, task_id, last_id, SSE_KEEPALIVE_SECONDS)
+            if not entries:
+                result = await async_redis_client.get(result_key(task_id))
+                if result:
+                    yield f"event: result\ndata: {json.dumps(format_result(task_id, result))}\n\n"
+                    await record_delivery(task_id, started, "stream")
+                    return
+                if time.monotonic() - idle_since >= SSE_STREAM_IDLE_SECONDS:
+                    yield f"event: error\ndata: {json.dumps({'detail': 'No tokens or result for this task'})}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            idle_since = time.monotonic()
+            for fields in entries:
+                if "delta" in fields:
+                    yield f"event: token\ndata: {json.dumps({'delta': fields['delta']})}\n\n"
+                elif fields.get("event") == "reset":
+                    yield "event: reset\ndata: {}\n\n"
+                elif fields.get("event") == "done":
+                    result = await async_redis_client.get(result_key(task_id))
+                    if result:
+                        yield f"event: result\ndata: {json.dumps(format_result(task_id, result))}\n\n"
+                        await record_delivery(task_id, started, "stream")
+                    else:
+                        yield f"event: error\ndata: {json.dumps({'detail': 'Result has expired'})}\n\n"
+                    return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/trace/{task_id}")
+async def get_trace(task_id: str):
+    """
+    Returns where the time of one request went: the API's document lookup and enqueue, the wait
+    in the task's lane, the worker's cache lookup, document load and provider calls, and delivery
+    of the result to the client.
+    """
+    try:
+        breakdown = trace_breakdown(task_id, await async_redis_client.lrange(trace_key(task_id), 0, -1))
+        if not breakdown:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return breakdown
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving trace: {str(e)}")
 
 # Run the FastAPI server locally on port 8000
 if __name__ == "__main__":
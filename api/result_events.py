@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import contextmanager
+
+from storage.result_store import result_key
+from storage.task_queue import TASK_EVENTS_CHANNEL_PREFIX, TASK_TOKENS_PREFIX
+
+
+class ResultNotifier:
+    """
+    Listens for task completion events on one shared pub/sub connection and wakes up
+    the requests waiting on those tasks.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._waiters = {}
+        self._listener = None
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{TASK_EVENTS_CHANNEL_PREFIX}*")
+                async for message in pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    task_id = message["channel"][len(TASK_EVENTS_CHANNEL_PREFIX):]
+                    for event in self._waiters.get(task_id, ()):
+                        event.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Result event listener error, resubscribing: {e}")
+                # Wake everyone up so they re-check the result store instead of waiting out a missed event
+                for events in self._waiters.values():
+                    for event in events:
+                        event.set()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    @contextmanager
+    def waiter(self, task_id):
+        """ Registers an event that is set when the task's completion is published """
+        event = asyncio.Event()
+        self._waiters.setdefault(task_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            events = self._waiters.get(task_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._waiters[task_id]
+
+
+async def wait_for_result(redis_client, notifier, task_id, timeout):
+    """
+    Returns the raw stored result of a task, waiting up to ``timeout`` seconds for it to be written.
+
+    Returns None if the result isn't available by then.
+    """
+    with notifier.waiter(task_id) as event:
+        # Checked after registering, so a result written in between isn't missed
+        result = await redis_client.get(result_key(task_id))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while result is None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+            event.clear()
+            result = await redis_client.get(result_key(task_id))
+        return result
+
+
+async def read_token_events(redis_client, task_id, last_id, block_seconds):
+    """
+    Reads the next token stream entries of a task after ``last_id``, blocking up to ``block_seconds``.
+
+    Returns (entries, last_id), where entries are the stream entries' field dicts.
+    """
+    response = await redis_client.xread(
+        {f"{TASK_TOKENS_PREFIX}{task_id}": last_id}, block=int(block_seconds * 1000)
+    )
+    entries = []
+    for _stream_name, messages in response or []:
+        for message_id, fields in messages:
+            entries.append(fields)
+            last_id = message_id
+    return entries, last_id
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+from docling.datamodel.base_models import DocumentStream, InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+IMAGE_RESOLUTION_SCALE = 2.0
+
+# Number of converters (and therefore copies of docling's layout/table models) per pipeline configuration
+CONVERTER_POOL_SIZE = int(os.getenv("CONVERTER_POOL_SIZE", 1))
+
+# Ingestion profiles, from cheapest to most complete
+PROFILE_FAST = "fast"
+PROFILE_STANDARD = "standard"
+PROFILE_FULL = "full"
+INGEST_PROFILES = (PROFILE_FAST, PROFILE_STANDARD, PROFILE_FULL)
+DEFAULT_INGEST_PROFILE = os.getenv("DEFAULT_INGEST_PROFILE", PROFILE_FULL)
+
+logger = logging.getLogger(__name__)
+
+
+def build_text_pdf(pages: list) -> bytes:
+    """
+    Build a minimal, valid PDF with one page per entry of plain Helvetica text.
+
+    Args:
+        pages (list): Page texts; newlines start a new line on the same page.
+
+    Returns:
+        bytes: The encoded PDF document.
+    """
+    page_ids = [4 + 2 * index for index in range(len(pages))]
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, text in zip(page_ids, pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        lines = [
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj"
+            for line in text.splitlines() or [""]
+        ]
+        stream = ("BT /F1 11 Tf 14 TL 72 720 Td " + " T* ".join(lines) + " ET").encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(pdf)
+
+
+# Tiny document converted once per converter so the first real upload doesn't pay for model loading
+WARMUP_PDF = build_text_pdf(["Warm-up page"])
+
+
+def default_pipeline_options() -> PdfPipelineOptions:
+    """
+    Build the pipeline options used for regular PDF uploads.
+
+    Returns:
+        PdfPipelineOptions: Options enabling picture extraction and table structure recognition.
+    """
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
+    pipeline_options.generate_page_images = True
+    pipeline_options.generate_picture_images = True
+    pipeline_options.do_table_structure = True
+    return pipeline_options
+
+
+def profile_pipeline_options(profile: str) -> PdfPipelineOptions:
+    """
+    Build the pipeline options for a named ingestion profile.
+
+    Args:
+        profile (str): ``fast`` (text only: no OCR, tables or images), ``standard`` (text and
+            figures, without table structure or full-page renders) or ``full`` (the default options).
+
+    Returns:
+        PdfPipelineOptions: The options for the profile.
+    """
+    if profile not in INGEST_PROFILES:
+        raise ValueError(f"Unknown ingestion profile {profile!r}; expected one of {', '.join(INGEST_PROFILES)}")
+    if profile == PROFILE_FULL:
+        return default_pipeline_options()
+
+    pipeline_options = PdfPipelineOptions()
+    pipeline_options.generate_page_images = False
+    pipeline_options.do_table_structure = False
+    if profile == PROFILE_FAST:
+        # Relies on the PDF's text layer, so scanned pages come out empty
+        pipeline_options.do_ocr = False
+        pipeline_options.generate_picture_images = False
+    else:
+        pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
+        pipeline_options.generate_picture_images = True
+    return pipeline_options
+
+
+def _sorted_sets(value):
+    # Sets are dumped in string-hash order, which differs between processes; sorting keeps the key stable
+    if isinstance(value, dict):
+        return {key: _sorted_sets(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sorted_sets(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_sorted_sets(item) for item in value), key=str)
+    return value
+
+
+def pipeline_options_key(pipeline_options: PdfPipelineOptions) -> str:
+    """
+    Derive a stable key for a pipeline configuration.
+
+    Args:
+        pipeline_options (PdfPipelineOptions): The docling pipeline options.
+
+    Returns:
+        str: A short hex digest identifying the configuration.
+    """
+    serialized = json.dumps(_sorted_sets(pipeline_options.model_dump()), sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+class ConverterPool:
+    """
+    A bounded pool of DocumentConverter instances sharing one pipeline configuration.
+
+    Converters are created lazily up to ``size`` and handed out one caller at a time,
+    so concurrent uploads wait for a warm converter instead of loading their own models.
+    """
+
+    def __init__(self, pipeline_options: PdfPipelineOptions, size: int = CONVERTER_POOL_SIZE):
+        self.pipeline_options = pipeline_options
+        self.key = pipeline_options_key(pipeline_options)
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _build(self) -> DocumentConverter:
+        started = time.perf_counter()
+        converter = DocumentConverter(
+            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=self.pipeline_options)}
+        )
+        converter.convert(DocumentStream(name="warmup.pdf", stream=BytesIO(WARMUP_PDF)))
+        logger.info(f"Converter for pipeline {self.key} built and warmed in {time.perf_counter() - started:.2f}s")
+        return converter
+
+    def _checkout(self) -> DocumentConverter:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_build = self._created < self.size
+            if can_build:
+                self._created += 1
+
+        if not can_build:
+            # Pool is at capacity: wait for another upload to hand its converter back
+            return self._idle.get()
+
+        try:
+            return self._build()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def acquire(self):
+        """
+        Check out a warm converter for the duration of a ``with`` block.
+
+        Yields:
+            DocumentConverter: A converter that no other caller is using.
+        """
+        converter = self._checkout()
+        try:
+            yield converter
+        finally:
+            self._idle.put(converter)
+
+    def warm_up(self):
+        """
+        Build every converter in the pool ahead of time.
+        """
+        converters = []
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    break
+                self._created += 1
+            try:
+                converters.append(self._build())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        for converter in converters:
+            self._idle.put(converter)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_converter_pool(pipeline_options: PdfPipelineOptions = None) -> ConverterPool:
+    """
+    Return the process-wide converter pool for a pipeline configuration, creating it on first use.
+
+    Args:
+        pipeline_options (PdfPipelineOptions): Options to convert with; defaults to ``default_pipeline_options()``.
+
+    Returns:
+        ConverterPool: The shared pool for these options.
+    """
+    pipeline_options = pipeline_options or default_pipeline_options()
+    key = pipeline_options_key(pipeline_options)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConverterPool(pipeline_options)
+            _pools[key] = pool
+    return pool
+
+
+def warm_converter_pools(pipeline_options_list: list = None):
+    """
+    Build and pre-warm converter pools, typically once at API startup.
+
+    Args:
+        pipeline_options_list (list): Pipeline options to warm; defaults to the regular upload options.
+    """
+    started = time.perf_counter()
+    for pipeline_options in pipeline_options_list or [default_pipeline_options()]:
+        get_converter_pool(pipeline_options).warm_up()
+    logger.info(f"Converter pools warmed in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,131 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from docling.datamodel.pipeline_options import PdfPipelineOptions
+
+from backend.converter_pool import pipeline_options_key
+from storage.redis_utils import redis_client
+from storage.s3_utils import S3_UPLOAD_WORKERS, get_object_metadata, object_key_from_url
+
+# Bump when process_pdf changes what it uploads, so documents processed by older code are converted again
+EXTRACTION_VERSION = "7"
+
+DEDUP_KEY_PREFIX = "pdf_manifest:"
+DEDUP_STATS_KEY = "pdf_dedup:stats"
+# Object metadata naming the PDF (by SHA-256) an output was produced from. Outputs are stored under the
+# PDF's file name, so a different PDF uploaded under the same name overwrites them
+SOURCE_HASH_METADATA = "pdf-sha256"
+
+
+def document_hash(file_content: bytes) -> str:
+    """
+    Compute the content address of an uploaded PDF.
+
+    Args:
+        file_content (bytes): The raw PDF bytes.
+
+    Returns:
+        str: The SHA-256 hex digest of the content.
+    """
+    return hashlib.sha256(file_content).hexdigest()
+
+
+def extraction_version(pipeline_options: PdfPipelineOptions) -> str:
+    """
+    Identify the extraction settings a manifest was produced with.
+
+    Args:
+        pipeline_options (PdfPipelineOptions): The docling pipeline options used for conversion.
+
+    Returns:
+        str: A version string that changes whenever the code version or pipeline options change.
+    """
+    return f"{EXTRACTION_VERSION}-{pipeline_options_key(pipeline_options)}"
+
+
+def _manifest_key(content_hash: str, version: str) -> str:
+    return f"{DEDUP_KEY_PREFIX}{version}:{content_hash}"
+
+
+def manifest_object_keys(manifest: dict) -> list:
+    """
+    List the S3 objects a manifest points at.
+
+    Args:
+        manifest (dict): A manifest stored by ``store_manifest``.
+
+    Returns:
+        list: Object keys of the markdown, its compact variant, the retrieval index and the images.
+    """
+    urls = [manifest.get(field) for field in ("markdown_s3_url", "compact_markdown_s3_url", "index_s3_url")]
+    urls += manifest.get("image_s3_urls", [])
+    return [object_key_from_url(url) for url in urls if url]
+
+
+def outputs_belong_to(manifest: dict, content_hash: str) -> bool:
+    """
+    Check that every object a manifest points at still holds the outputs of the PDF it was stored for.
+
+    Args:
+        manifest (dict): A manifest stored by ``store_manifest``.
+        content_hash (str): SHA-256 of the PDF bytes.
+
+    Returns:
+        bool: False if any object is missing or was overwritten by the outputs of another PDF.
+    """
+    keys = manifest_object_keys(manifest)
+    if not keys or None in keys:
+        return False
+    with ThreadPoolExecutor(max_workers=max(1, min(S3_UPLOAD_WORKERS, len(keys)))) as executor:
+        metadata = list(executor.map(get_object_metadata, keys))
+    return all(entry is not None and entry.get(SOURCE_HASH_METADATA) == content_hash for entry in metadata)
+
+
+def lookup_manifest(content_hash: str, version: str, record_stats: bool = True) -> dict:
+    """
+    Find the manifest of a previously processed copy of the same PDF and count the hit or miss.
+
+    A manifest whose objects no longer hold this PDF's outputs (see ``outputs_belong_to``) is a miss,
+    and is forgotten.
+
+    Args:
+        content_hash (str): SHA-256 of the PDF bytes.
+        version (str): Extraction version from ``extraction_version``.
+        record_stats (bool): Whether to count the lookup in the hit/miss counters.
+
+    Returns:
+        dict: The stored manifest (markdown and image URLs), or None on a miss.
+    """
+    key = _manifest_key(content_hash, version)
+    manifest = redis_client.get(key)
+    manifest = json.loads(manifest) if manifest else None
+    if manifest and not outputs_belong_to(manifest, content_hash):
+        redis_client.delete(key)
+        manifest = None
+    if record_stats:
+        redis_client.hincrby(DEDUP_STATS_KEY, "hits" if manifest else "misses", 1)
+    return manifest
+
+
+def store_manifest(content_hash: str, version: str, manifest: dict):
+    """
+    Remember where the outputs of a processed PDF were uploaded.
+
+    Args:
+        content_hash (str): SHA-256 of the PDF bytes.
+        version (str): Extraction version from ``extraction_version``.
+        manifest (dict): The markdown and image URLs to return for future identical uploads.
+    """
+    redis_client.set(_manifest_key(content_hash, version), json.dumps(manifest))
+
+
+def get_dedup_stats() -> dict:
+    """
+    Read the dedup cache counters.
+
+    Returns:
+        dict: Hit and miss counts since the counters were created.
+    """
+    stats = redis_client.hgetall(DEDUP_STATS_KEY)
+    return {"hits": int(stats.get("hits", 0)), "misses": int(stats.get("misses", 0))}
@@ -0,0 +1,187 @@
+import json
+import logging
+import time
+from io import BytesIO
+
+from storage.redis_utils import redis_client
+from storage.s3_utils import (
+    S3_BUCKET_NAME,
+    download_text,
+    object_key_for_file,
+    s3_client,
+    s3_object_url,
+    upload_fileobj_to_s3,
+)
+
+logger = logging.getLogger(__name__)
+
+# Sorted set of PDF names, all scored 0 so they are ordered (and range-queried) lexicographically
+CATALOG_INDEX_KEY = "pdf_catalog:index"
+# Hash of PDF name -> JSON catalog entry
+CATALOG_ENTRIES_KEY = "pdf_catalog:entries"
+# Incremented on every change; used as the listing's ETag
+CATALOG_VERSION_KEY = "pdf_catalog:version"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def manifest_file_name(pdf_filename: str) -> str:
+    """
+    Name the per-document manifest stored next to a PDF's outputs.
+
+    Args:
+        pdf_filename (str): The PDF name used as the S3 folder.
+
+    Returns:
+        str: The manifest's file name, e.g. ``report_manifest.json``.
+    """
+    return f"{pdf_filename}_manifest.json"
+
+
+def catalog_entry(manifest: dict) -> dict:
+    """
+    Build the catalog entry listed for a processed PDF.
+
+    Args:
+        manifest (dict): The outputs of ``process_pdf`` (markdown, image and index URLs).
+
+    Returns:
+        dict: The entry served by the document listing.
+    """
+    return {
+        "pdf_filename": manifest["pdf_filename"],
+        "markdown": manifest["markdown_s3_url"],
+        "compact_markdown": manifest.get("compact_markdown_s3_url"),
+        "images": manifest.get("image_s3_urls", []),
+        "index": manifest.get("index_s3_url"),
+        "profile": manifest.get("profile"),
+        "processed_at": manifest.get("processed_at"),
+    }
+
+
+def write_document_manifest(manifest: dict, original_filename: str) -> str:
+    """
+    Store a processed PDF's manifest in S3, so the catalog can be rebuilt without listing every object.
+
+    Args:
+        manifest (dict): The outputs of ``process_pdf``.
+        original_filename (str): The uploaded file's name.
+
+    Returns:
+        str: Public URL of the manifest.
+    """
+    pdf_filename = manifest["pdf_filename"]
+    return upload_fileobj_to_s3(
+        BytesIO(json.dumps(manifest).encode("utf-8")),
+        source=pdf_filename,
+        file_name=manifest_file_name(pdf_filename),
+        metadata={"file_type": "manifest", "original_filename": original_filename},
+    )
+
+
+def add_to_catalog(manifest: dict) -> bool:
+    """
+    Add or update a processed PDF in the catalog.
+
+    Args:
+        manifest (dict): The outputs of ``process_pdf``.
+
+    Returns:
+        bool: True if the catalog changed (and its version was bumped).
+    """
+    entry = catalog_entry(manifest)
+    encoded = json.dumps(entry)
+    # Re-adding an unchanged document (e.g. during a rebuild) keeps the version, so clients' ETags stay valid
+    if redis_client.hget(CATALOG_ENTRIES_KEY, entry["pdf_filename"]) == encoded:
+        return False
+
+    pipeline = redis_client.pipeline()
+    pipeline.hset(CATALOG_ENTRIES_KEY, entry["pdf_filename"], encoded)
+    pipeline.zadd(CATALOG_INDEX_KEY, {entry["pdf_filename"]: 0})
+    pipeline.incr(CATALOG_VERSION_KEY)
+    pipeline.execute()
+    return True
+
+
+def catalog_version() -> str:
+    """
+    Read the catalog's version.
+
+    Returns:
+        str: The version counter, or None if the catalog hasn't been built yet.
+    """
+    return redis_client.get(CATALOG_VERSION_KEY)
+
+
+def list_catalog(prefix: str = "", cursor: str = None, limit: int = DEFAULT_PAGE_SIZE) -> dict:
+    """
+    Page through the processed PDFs in name order.
+
+    Args:
+        prefix (str): Only list PDFs whose name starts with this.
+        cursor (str): ``next_cursor`` from the previous page, or None for the first page.
+        limit (int): Maximum entries per page.
+
+    Returns:
+        dict: ``entries`` (catalog entries), ``next_cursor`` (None on the last page) and ``total``
+        (number of PDFs matching the prefix).
+    """
+    # Names are UTF-8, which never contains the byte 0xff, so it bounds every name with the prefix
+    upper = b"[" + prefix.encode("utf-8") + b"\xff" if prefix else "+"
+    prefix_lower = f"[{prefix}" if prefix else "-"
+    lower = prefix_lower
+    if cursor and cursor >= prefix:
+        lower = f"({cursor}"
+
+    names = redis_client.zrangebylex(CATALOG_INDEX_KEY, lower, upper, start=0, num=limit + 1)
+    next_cursor = names[limit - 1] if len(names) > limit else None
+    names = names[:limit]
+
+    entries = []
+    if names:
+        entries = [json.loads(entry) for entry in redis_client.hmget(CATALOG_ENTRIES_KEY, names) if entry]
+    if prefix:
+        total = redis_client.zlexcount(CATALOG_INDEX_KEY, prefix_lower, upper)
+    else:
+        total = redis_client.zcard(CATALOG_INDEX_KEY)
+    return {"entries": entries, "next_cursor": next_cursor, "total": total}
+
+
+def _manifest_for_folder(pdf_filename: str) -> dict:
+    # Documents processed before manifests existed only have their markdown to go by
+    try:
+        return json.loads(download_text(object_key_for_file(pdf_filename, manifest_file_name(pdf_filename))))
+    except s3_client.exceptions.NoSuchKey:
+        pass
+
+    markdown_key = object_key_for_file(pdf_filename, f"{pdf_filename}_with_images.md")
+    try:
+        s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=markdown_key)
+    except s3_client.exceptions.ClientError:
+        return None
+    return {"pdf_filename": pdf_filename, "markdown_s3_url": s3_object_url(markdown_key)}
+
+
+def rebuild_catalog() -> int:
+    """
+    Rebuild the catalog from the bucket's per-document folders and manifests.
+
+    Used to seed the catalog for documents processed before it existed, or after Redis lost it.
+
+    Returns:
+        int: Number of documents in the catalog.
+    """
+    started = time.perf_counter()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    count = 0
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME, Delimiter="/"):
+        for common_prefix in page.get("CommonPrefixes", []):
+            manifest = _manifest_for_folder(common_prefix["Prefix"].rstrip("/"))
+            if manifest:
+                add_to_catalog(manifest)
+                count += 1
+    # Marks the catalog as built even when the bucket is empty
+    redis_client.setnx(CATALOG_VERSION_KEY, 0)
+    logger.info("Document catalog rebuilt with %d documents in %.1fs", count, time.perf_counter() - started)
+    return count
@@ -0,0 +1,348 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from uuid import uuid4
+
+from backend.converter_pool import DEFAULT_INGEST_PROFILE, INGEST_PROFILES, profile_pipeline_options, warm_converter_pools
+from backend.dedup_cache import document_hash, extraction_version, lookup_manifest
+from backend.parallel_convert import convert_page_range, count_pages, plan_page_ranges
+from backend.pdf_extract import clean_pdf_filename, process_pdf
+from storage.redis_utils import redis_client
+from storage.s3_utils import download_bytes
+
+# Number of worker processes converting PDFs in parallel
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+# How long job status records stay in Redis after their last update
+INGEST_JOB_TTL = int(os.getenv("INGEST_JOB_TTL", 24 * 60 * 60))
+# Ingestion profiles whose converters every worker loads at startup; others are loaded on first use
+INGEST_WARM_PROFILES = os.getenv("INGEST_WARM_PROFILES", DEFAULT_INGEST_PROFILE).split(",")
+# Log level of the worker processes; spawned processes don't inherit the parent's logging setup
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Threads per worker process uploading converted documents while the process converts the next one
+INGEST_PUBLISH_THREADS = int(os.getenv("INGEST_PUBLISH_THREADS", 2))
+# Converted documents a worker process may hold waiting for upload before it stops taking new conversions
+INGEST_PUBLISH_BACKLOG = int(os.getenv("INGEST_PUBLISH_BACKLOG", 4))
+# Most documents accepted by one batch
+MAX_BATCH_DOCUMENTS = int(os.getenv("MAX_BATCH_DOCUMENTS", 500))
+
+INGEST_JOB_PREFIX = "ingest_job:"
+INGEST_BATCH_PREFIX = "ingest_batch:"
+
+STATUS_QUEUED = "queued"
+STATUS_CONVERTING = "converting"
+STATUS_UPLOADING = "uploading"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_executor = None
+# Per worker process: the upload threads and the slots bounding their backlog
+_publish_executor = None
+_publish_slots = None
+
+
+def set_job_status(job_id: str, status: str, **fields):
+    """
+    Record the current status of an ingest job in Redis.
+
+    Args:
+        job_id (str): The ingest job id.
+        status (str): One of queued, converting, uploading, done or failed.
+        **fields: Extra fields to store; dicts and lists are JSON-encoded.
+    """
+    record = {"status": status, "updated_at": time.time()}
+    for name, value in fields.items():
+        record[name] = json.dumps(value) if isinstance(value, (dict, list)) else value
+    key = f"{INGEST_JOB_PREFIX}{job_id}"
+    redis_client.hset(key, mapping=record)
+    redis_client.expire(key, INGEST_JOB_TTL)
+
+
+def get_job_status(job_id: str) -> dict:
+    """
+    Look up an ingest job.
+
+    Args:
+        job_id (str): The ingest job id.
+
+    Returns:
+        dict: The job record, or None if the job is unknown or expired.
+    """
+    record = redis_client.hgetall(f"{INGEST_JOB_PREFIX}{job_id}")
+    if not record:
+        return None
+    if "result" in record:
+        record["result"] = json.loads(record["result"])
+    return {"job_id": job_id, **record}
+
+
+def _init_ingest_worker():
+    # Runs once in every worker process, so each one loads docling's models a single time
+    global _publish_executor, _publish_slots
+    logging.basicConfig(level=LOG_LEVEL)
+    _publish_executor = ThreadPoolExecutor(max_workers=INGEST_PUBLISH_THREADS, thread_name_prefix="ingest-publish")
+    _publish_slots = threading.BoundedSemaphore(INGEST_PUBLISH_BACKLOG)
+    warm_converter_pools([profile_pipeline_options(profile.strip()) for profile in INGEST_WARM_PROFILES])
+
+
+def _noop():
+    return None
+
+
+def _run_ingest_job(job_id: str, file_content: bytes, file_name: str, profile: str,
+                    documents: list = None, conversion_seconds: float = None):
+    try:
+        result = process_pdf(
+            file_content,
+            file_name,
+            status_callback=lambda status: set_job_status(job_id, status),
+            documents=documents,
+            profile=profile,
+            conversion_seconds=conversion_seconds,
+        )
+        set_job_status(job_id, STATUS_DONE, result=result)
+    except Exception as e:
+        set_job_status(job_id, STATUS_FAILED, error=str(e))
+
+
+def _run_pipelined_job(job_id: str, file_content: bytes, file_name: str, profile: str, source_key: str = None):
+    # Converts in this worker process, then hands the upload stage to the process's publish threads and
+    # returns, so the worker converts the next document while this one's images and markdown are uploaded
+    try:
+        if source_key:
+            file_content = download_bytes(source_key)
+        documents = None
+        conversion_seconds = None
+        page_count = count_pages(file_content)
+        # Invalid PDFs and already processed ones go straight to process_pdf, which rejects or reuses them
+        if page_count and not lookup_manifest(
+            document_hash(file_content), extraction_version(profile_pipeline_options(profile)), record_stats=False
+        ):
+            set_job_status(job_id, STATUS_CONVERTING, pages=page_count)
+            started = time.perf_counter()
+            documents = [convert_page_range(file_content, clean_pdf_filename(file_name), (1, page_count), profile)]
+            conversion_seconds = time.perf_counter() - started
+    except Exception as e:
+        set_job_status(job_id, STATUS_FAILED, error=str(e))
+        return
+
+    # Blocks while the upload backlog is full, so converted documents can't pile up in memory
+    _publish_slots.acquire()
+
+    def publish():
+        try:
+            _run_ingest_job(job_id, file_content, file_name, profile, documents, conversion_seconds)
+        finally:
+            _publish_slots.release()
+
+    _publish_executor.submit(publish)
+
+
+def _on_job_finished(job_id: str, future):
+    # Covers failures _run_ingest_job can't report itself, e.g. a worker process dying mid-conversion
+    error = future.exception()
+    if error is not None:
+        logging.error(f"Ingest job {job_id} crashed: {error}")
+        set_job_status(job_id, STATUS_FAILED, error=str(error))
+
+
+def _submit_page_ranges(job_id: str, file_content: bytes, file_name: str, profile: str, page_ranges: list):
+    # Converts the ranges on separate workers, then hands the documents to one job that uploads the merged result
+    pdf_filename = clean_pdf_filename(file_name)
+    started = time.perf_counter()
+    futures = [
+        _executor.submit(convert_page_range, file_content, pdf_filename, page_range, profile)
+        for page_range in page_ranges
+    ]
+    remaining = len(futures)
+    lock = threading.Lock()
+
+    def on_range_finished(_future):
+        nonlocal remaining
+        with lock:
+            remaining -= 1
+            if remaining:
+                return
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            logging.error(f"Ingest job {job_id} failed converting a page range: {errors[0]}")
+            set_job_status(job_id, STATUS_FAILED, error=str(errors[0]))
+            return
+        try:
+            documents = [future.result() for future in futures]
+            future = _executor.submit(
+                _run_ingest_job, job_id, file_content, file_name, profile, documents, time.perf_counter() - started
+            )
+            future.add_done_callback(lambda f: _on_job_finished(job_id, f))
+        except RuntimeError as e:  # The pool was shut down in the meantime
+            set_job_status(job_id, STATUS_FAILED, error=str(e))
+
+    set_job_status(job_id, STATUS_CONVERTING, page_ranges=len(page_ranges))
+    for future in futures:
+        future.add_done_callback(on_range_finished)
+
+
+def _submit_pipelined_job(job_id: str, file_content: bytes, file_name: str, profile: str, source_key: str = None):
+    future = _executor.submit(_run_pipelined_job, job_id, file_content, file_name, profile, source_key)
+    future.add_done_callback(lambda f: _on_job_finished(job_id, f))
+
+
+def _check_submission(profile: str):
+    if _executor is None:
+        raise RuntimeError("Ingest pool is not running.")
+    if profile not in INGEST_PROFILES:
+        raise ValueError(f"Unknown ingestion profile {profile!r}; expected one of {', '.join(INGEST_PROFILES)}")
+
+
+def start_ingest_pool():
+    """
+    Start the ingest process pool and wait until every worker has warmed its converters.
+    """
+    global _executor
+    if _executor is not None:
+        return
+    _executor = ProcessPoolExecutor(
+        max_workers=INGEST_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_ingest_worker,
+    )
+    # The pool spawns workers lazily; submitting one no-op per worker starts them all now
+    wait([_executor.submit(_noop) for _ in range(INGEST_WORKERS)])
+
+
+def shutdown_ingest_pool():
+    """
+    Stop the ingest process pool, letting running conversions finish.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def submit_ingest_job(file_content: bytes, file_name: str, profile: str = DEFAULT_INGEST_PROFILE) -> str:
+    """
+    Queue a PDF for conversion and upload in the ingest process pool.
+
+    Args:
+        file_content (bytes): The content of the uploaded PDF file.
+        file_name (str): The original name of the uploaded file.
+        profile (str): Ingestion profile (fast, standard or full).
+
+    Returns:
+        str: The id to poll with ``get_job_status``.
+    """
+    _check_submission(profile)
+    job_id = uuid4().hex
+    set_job_status(job_id, STATUS_QUEUED, file_name=file_name, profile=profile)
+
+    # Large PDFs are split into page ranges converted in parallel, unless they were already processed
+    page_ranges = plan_page_ranges(count_pages(file_content), INGEST_WORKERS)
+    if len(page_ranges) > 1 and not lookup_manifest(
+        document_hash(file_content), extraction_version(profile_pipeline_options(profile)), record_stats=False
+    ):
+        _submit_page_ranges(job_id, file_content, file_name, profile, page_ranges)
+        return job_id
+
+    _submit_pipelined_job(job_id, file_content, file_name, profile)
+    return job_id
+
+
+def submit_ingest_batch(files: list, source_keys: list, profile: str = DEFAULT_INGEST_PROFILE) -> str:
+    """
+    Queue many PDFs for conversion and upload as one batch.
+
+    Every document is its own job: the workers convert as many documents as there are processes
+    and upload each converted document while converting the next one.
+
+    Args:
+        files (list): (file_name, file_content) pairs of uploaded PDFs.
+        source_keys (list): Keys of PDFs already in the S3 bucket; the workers download them.
+        profile (str): Ingestion profile (fast, standard or full) applied to every document.
+
+    Returns:
+        str: The id to poll with ``get_batch_status``.
+    """
+    _check_submission(profile)
+    document_count = len(files) + len(source_keys)
+    if not document_count:
+        raise ValueError("A batch needs at least one PDF or S3 key.")
+    if document_count > MAX_BATCH_DOCUMENTS:
+        raise ValueError(f"At most {MAX_BATCH_DOCUMENTS} documents per batch")
+
+    batch_id = uuid4().hex
+    jobs = [(uuid4().hex, file_name, file_content, None) for file_name, file_content in files]
+    jobs += [(uuid4().hex, os.path.basename(source_key), None, source_key) for source_key in source_keys]
+    for job_id, file_name, _file_content, source_key in jobs:
+        set_job_status(job_id, STATUS_QUEUED, file_name=file_name, profile=profile, batch_id=batch_id,
+                       **({"source_key": source_key} if source_key else {}))
+
+    key = f"{INGEST_BATCH_PREFIX}{batch_id}"
+    redis_client.hset(key, mapping={
+        "job_ids": json.dumps([job[0] for job in jobs]),
+        "profile": profile,
+        "created_at": time.time(),
+    })
+    redis_client.expire(key, INGEST_JOB_TTL)
+
+    for job_id, file_name, file_content, source_key in jobs:
+        _submit_pipelined_job(job_id, file_content, file_name, profile, source_key)
+    return batch_id
+
+
+def get_batch_status(batch_id: str) -> dict:
+    """
+    Report the progress of a batch.
+
+    Args:
+        batch_id (str): The batch id.
+
+    Returns:
+        dict: Per-document status, counts by status, elapsed time and the documents and pages
+        processed per hour so far, or None if the batch is unknown or expired.
+    """
+    record = redis_client.hgetall(f"{INGEST_BATCH_PREFIX}{batch_id}")
+    if not record:
+        return None
+    job_ids = json.loads(record["job_ids"])
+    created_at = float(record["created_at"])
+
+    pipeline = redis_client.pipeline()
+    for job_id in job_ids:
+        pipeline.hgetall(f"{INGEST_JOB_PREFIX}{job_id}")
+
+    documents = []
+    counts = {}
+    pages = 0
+    last_finished = created_at
+    for job_id, job in zip(job_ids, pipeline.execute()):
+        status = job.get("status", "expired")
+        counts[status] = counts.get(status, 0) + 1
+        document = {"job_id": job_id, "file_name": job.get("file_name"), "status": status}
+        if status == STATUS_DONE:
+            result = json.loads(job["result"])
+            document["markdown_s3_url"] = result.get("markdown_s3_url")
+            pages += result.get("stats", {}).get("pages", 0)
+        elif status == STATUS_FAILED:
+            document["error"] = job.get("error")
+        if status in (STATUS_DONE, STATUS_FAILED):
+            last_finished = max(last_finished, float(job["updated_at"]))
+        documents.append(document)
+
+    # Jobs whose records expired count as finished, so an old batch still reads as complete
+    complete = not any(counts.get(status) for status in (STATUS_QUEUED, STATUS_CONVERTING, STATUS_UPLOADING))
+    elapsed = (last_finished if complete else time.time()) - created_at
+    return {
+        "batch_id": batch_id,
+        "profile": record["profile"],
+        "documents": len(job_ids),
+        "complete": complete,
+        "status_counts": counts,
+        "elapsed_s": round(elapsed, 3),
+        "documents_per_hour": round(counts.get(STATUS_DONE, 0) / elapsed * 3600, 1) if elapsed > 0 else None,
+        "pages_per_hour": round(pages / elapsed * 3600, 1) if elapsed > 0 else None,
+        "jobs": documents,
+    }
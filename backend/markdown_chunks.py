@@ -0,0 +1,72 @@
+import re
+
+# A markdown heading starts a new section
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+# Marker process_pdf has docling put between pages (and puts between converted page ranges)
+PAGE_BREAK_MARKER = "<!-- page break -->"
+# Page boundaries, when the markdown was exported with page-break markers
+PAGE_BREAK_PATTERN = re.compile(r"^\s*(<!--\s*page[ _-]?break\s*-->|\f)\s*$", re.IGNORECASE)
+
+
+def split_sections(markdown: str) -> list:
+    """
+    Split docling markdown into sections at headings and page boundaries.
+
+    Args:
+        markdown (str): The markdown document.
+
+    Returns:
+        list: Section texts in document order; each heading stays with the text below it.
+    """
+    sections = []
+    current = []
+    for line in markdown.splitlines():
+        if PAGE_BREAK_PATTERN.match(line):
+            sections.append("\n".join(current))
+            current = []
+            continue
+        if HEADING_PATTERN.match(line) and current:
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    sections.append("\n".join(current))
+    return [section.strip() for section in sections if section.strip()]
+
+
+def _split_oversized(section: str, max_chars: int) -> list:
+    # Fall back to paragraph boundaries, and to hard cuts for a single huge paragraph (e.g. a long table)
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", section):
+        while len(paragraph) > max_chars:
+            cut = paragraph.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip("\n")
+        if paragraph.strip():
+            pieces.append(paragraph)
+    return pieces
+
+
+def chunk_markdown(markdown: str, max_chars: int) -> list:
+    """
+    Pack markdown sections into chunks of at most ``max_chars`` characters.
+
+    Args:
+        markdown (str): The markdown document.
+        max_chars (int): Upper bound on the length of each chunk.
+
+    Returns:
+        list: Chunk texts in document order. Sections are kept whole where they fit.
+    """
+    chunks = []
+    current = ""
+    for section in split_sections(markdown):
+        pieces = [section] if len(section) <= max_chars else _split_oversized(section, max_chars)
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,206 @@
+import os
+import re
+from collections import Counter
+
+from backend.markdown_chunks import PAGE_BREAK_MARKER, PAGE_BREAK_PATTERN
+
+# Bump when compact_markdown changes its output, so stored compact variants are rebuilt
+COMPACTION_VERSION = "2"
+
+# A short standalone line at the top or bottom of this many pages is a running header or footer.
+# Page headers and footers docling recognises are already left out of the markdown at ingest; this
+# catches the ones it misses, in markdown with page-break markers
+RUNNING_LINE_MIN_REPEATS = int(os.getenv("RUNNING_LINE_MIN_REPEATS", 3))
+RUNNING_LINE_MAX_CHARS = 120
+# Blocks at each end of a page that may be a running header or footer; the rest of the page is body text
+RUNNING_LINE_EDGE_BLOCKS = 2
+
+# Image references docling writes with ImageRefMode.REFERENCED, its placeholder comment, and HTML images
+IMAGE_REF_PATTERN = re.compile(r"!\[[^\]]*\]\([^)]*\)|<!--\s*image\s*-->|<img\b[^>]*>", re.IGNORECASE)
+TABLE_ROW_PATTERN = re.compile(r"^\s*\|.*\|\s*$")
+TABLE_SEPARATOR_CELL_PATTERN = re.compile(r"^:?-+:?$")
+# Cells are split on pipes that aren't escaped
+CELL_SPLIT_PATTERN = re.compile(r"(?<!\\)\|")
+# A page number set off at either end of a running footer, e.g. "Annual Report | 12", "Page 3 - Annual Report"
+FOOTER_PAGE_NUMBER_PATTERN = re.compile(
+    r"^(page\s*)?\d{1,3}(\s*of\s*\d+)?\s*[|\-\u2013\u2014\u00b7\u2022:]\s*"
+    r"|\s*[|\-\u2013\u2014\u00b7\u2022:]\s*(page\s*)?\d{1,3}(\s*of\s*\d+)?$"
+)
+# Lines that say they are a page number, e.g. "Page 12", "- Page 12 of 40 -". A bare number may be a year
+# or a value, so it is never taken for one
+PAGE_NUMBER_PATTERN = re.compile(r"^[\W_]*page\s*\d+(\s*(of|/)\s*\d+)?[\W_]*$")
+
+
+def compact_key_for_document(document_key: str) -> str:
+    """
+    Locate the compact variant stored next to a document's markdown.
+
+    Args:
+        document_key (str): Object key of the markdown, e.g. ``report/markdown/report_with_images.md``.
+
+    Returns:
+        str: Object key of the compact variant, e.g. ``report/markdown/report_compact.md``.
+    """
+    pdf_filename = document_key.split("/", 1)[0]
+    return f"{pdf_filename}/markdown/{pdf_filename}_compact.md"
+
+
+def strip_image_refs(markdown: str) -> str:
+    """
+    Remove image references, which carry no text for the model.
+
+    Args:
+        markdown (str): The markdown document.
+
+    Returns:
+        str: The markdown without image references; lines left empty are dropped.
+    """
+    lines = []
+    for line in markdown.splitlines():
+        stripped, removed = IMAGE_REF_PATTERN.subn("", line)
+        if removed:
+            if not stripped.strip():
+                continue
+            stripped = re.sub(r"(?<=\S) {2,}", " ", stripped)
+        lines.append(stripped)
+    return "\n".join(lines)
+
+
+def _normalize_running_line(line: str) -> str:
+    line = re.sub(r"\s+", " ", line.strip().lower())
+    # The page number in a running footer changes from page to page
+    return FOOTER_PAGE_NUMBER_PATTERN.sub(" # ", line).strip()
+
+
+def _is_page_number(line: str) -> bool:
+    return bool(PAGE_NUMBER_PATTERN.match(line.strip().lower()))
+
+
+def _split_pages(markdown: str) -> list:
+    # Blocks of each page, split at page-break markers
+    pages = [[]]
+    for line in markdown.splitlines():
+        if PAGE_BREAK_PATTERN.match(line):
+            pages.append([])
+        else:
+            pages[-1].append(line)
+    return [[block for block in re.split(r"\n\s*\n", "\n".join(page)) if block.strip()] for page in pages]
+
+
+def dedupe_running_lines(markdown: str) -> str:
+    """
+    Remove running headers and footers repeated at the top or bottom of every page.
+
+    Only the first and last RUNNING_LINE_EDGE_BLOCKS blocks of each page, as delimited by
+    page-break markers, are considered. Such a block that is a short standalone line with
+    letters (not a heading or a table row) and occurs at an edge of at least RUNNING_LINE_MIN_REPEATS pages,
+    ignoring a page number set off at its start or end, is kept where it first occurs and
+    dropped elsewhere. Edge lines like "Page 12 of 40" are dropped once that many pages have
+    one. Markdown without page-break markers is returned unchanged.
+
+    Args:
+        markdown (str): The markdown document.
+
+    Returns:
+        str: The markdown without the repeats, with one page-break marker between pages.
+    """
+    pages = _split_pages(markdown)
+    if len(pages) < RUNNING_LINE_MIN_REPEATS:
+        return markdown
+
+    def edge_candidates(blocks):
+        edges = set(range(RUNNING_LINE_EDGE_BLOCKS)) | set(range(len(blocks) - RUNNING_LINE_EDGE_BLOCKS, len(blocks)))
+        for position in sorted(edge for edge in edges if 0 <= edge < len(blocks)):
+            line = blocks[position].strip()
+            # Lines without letters (numbers, years, values) are content however often they repeat
+            if (
+                "\n" not in line and len(line) <= RUNNING_LINE_MAX_CHARS and re.search(r"[^\W\d_]", line)
+                and not line.startswith("#") and not TABLE_ROW_PATTERN.match(line)
+            ):
+                yield position, line
+
+    # Pages each normalized edge line occurs on, and pages with a page number line at an edge
+    pages_with_line = Counter()
+    pages_with_number = 0
+    for blocks in pages:
+        lines = [line for _, line in edge_candidates(blocks)]
+        pages_with_line.update({_normalize_running_line(line) for line in lines if not _is_page_number(line)})
+        pages_with_number += any(_is_page_number(line) for line in lines)
+
+    seen = set()
+    kept_pages = []
+    for blocks in pages:
+        dropped = set()
+        for position, line in edge_candidates(blocks):
+            if _is_page_number(line):
+                if pages_with_number >= RUNNING_LINE_MIN_REPEATS:
+                    dropped.add(position)
+                continue
+            normalized = _normalize_running_line(line)
+            if pages_with_line[normalized] >= RUNNING_LINE_MIN_REPEATS:
+                if normalized in seen:
+                    dropped.add(position)
+                seen.add(normalized)
+        kept_pages.append("\n\n".join(block for position, block in enumerate(blocks) if position not in dropped))
+    return f"\n\n{PAGE_BREAK_MARKER}\n\n".join(kept_pages)
+
+
+def _compact_row(line: str) -> str:
+    cells = [re.sub(r"\s+", " ", cell.strip()) for cell in CELL_SPLIT_PATTERN.split(line.strip()[1:-1])]
+    if all(TABLE_SEPARATOR_CELL_PATTERN.match(cell) for cell in cells):
+        # Keeps the alignment colons, drops the padding dashes
+        cells = [f"{':' if cell.startswith(':') else ''}---{':' if cell.endswith(':') else ''}" for cell in cells]
+    elif not any(cells):
+        return None
+    return f"| {' | '.join(cells)} |"
+
+
+def collapse_tables(markdown: str) -> str:
+    """
+    Strip the padding docling adds to align table columns, and drop rows with no content.
+
+    Args:
+        markdown (str): The markdown document.
+
+    Returns:
+        str: The markdown with one space around each cell and three-dash separators.
+    """
+    lines = []
+    for line in markdown.splitlines():
+        if TABLE_ROW_PATTERN.match(line):
+            line = _compact_row(line)
+            if line is None:
+                continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def collapse_whitespace(markdown: str) -> str:
+    """
+    Remove trailing spaces and runs of blank lines.
+
+    Args:
+        markdown (str): The markdown document.
+
+    Returns:
+        str: The markdown with at most one blank line between blocks.
+    """
+    lines = [line.rstrip() for line in markdown.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def compact_markdown(markdown: str) -> str:
+    """
+    Remove the parts of docling markdown that cost input tokens without adding content.
+
+    Used at ingest to store a compact variant next to the markdown, and by the worker for documents
+    that don't have one, so both produce the same text.
+
+    Args:
+        markdown (str): The markdown document.
+
+    Returns:
+        str: The markdown without image references, running headers and footers, table padding
+        and extra blank lines.
+    """
+    return collapse_whitespace(collapse_tables(dedupe_running_lines(strip_image_refs(markdown))))
@@ -0,0 +1,84 @@
+import logging
+import math
+import os
+from io import BytesIO
+
+import pypdfium2
+from docling.datamodel.base_models import DocumentStream
+from docling_core.types.doc import DoclingDocument
+
+from backend.converter_pool import DEFAULT_INGEST_PROFILE, get_converter_pool, profile_pipeline_options
+
+# PDFs with fewer pages than this are converted in a single pass
+PARALLEL_CONVERT_MIN_PAGES = int(os.getenv("PARALLEL_CONVERT_MIN_PAGES", 40))
+# Smallest page range worth a separate conversion task
+MIN_PAGES_PER_RANGE = int(os.getenv("MIN_PAGES_PER_RANGE", 10))
+
+logger = logging.getLogger(__name__)
+
+
+def count_pages(file_content: bytes) -> int:
+    """
+    Count the pages of a PDF without converting it.
+
+    Args:
+        file_content (bytes): The raw PDF bytes.
+
+    Returns:
+        int: The page count, or None if the PDF can't be opened.
+    """
+    try:
+        pdf = pypdfium2.PdfDocument(file_content)
+    except pypdfium2.PdfiumError:
+        return None
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def plan_page_ranges(page_count: int, workers: int) -> list:
+    """
+    Split a PDF's pages into contiguous ranges to convert in parallel.
+
+    Args:
+        page_count (int): Number of pages in the PDF.
+        workers (int): Number of processes available for conversion.
+
+    Returns:
+        list: 1-based inclusive (first, last) page ranges in page order. A single range means
+        the PDF is small enough to convert in one pass.
+    """
+    if not page_count or page_count < PARALLEL_CONVERT_MIN_PAGES or workers < 2:
+        return [(1, page_count or 1)]
+    range_count = max(1, min(workers, page_count // MIN_PAGES_PER_RANGE))
+    range_size = math.ceil(page_count / range_count)
+    return [(first, min(first + range_size - 1, page_count)) for first in range(1, page_count + 1, range_size)]
+
+
+def convert_page_range(file_content: bytes, pdf_filename: str, page_range: tuple,
+                       profile: str = DEFAULT_INGEST_PROFILE) -> DoclingDocument:
+    """
+    Convert one page range of a PDF with a warm converter from this process's pool.
+
+    Args:
+        file_content (bytes): The raw PDF bytes.
+        pdf_filename (str): The cleaned-up PDF name, used as the document name.
+        page_range (tuple): 1-based inclusive (first, last) pages to convert.
+        profile (str): Ingestion profile selecting the docling pipeline options.
+
+    Returns:
+        DoclingDocument: The converted pages, keeping their original page numbers.
+    """
+    with get_converter_pool(profile_pipeline_options(profile)).acquire() as doc_converter:
+        conv_res = doc_converter.convert(
+            DocumentStream(name=f"{pdf_filename}.pdf", stream=BytesIO(file_content)),
+            page_range=page_range,
+        )
+    document = conv_res.document
+    # Full-page renders are only used during conversion; dropping them keeps the document cheap to
+    # send back to the parent process. Picture crops are kept for the image upload.
+    for page in document.pages.values():
+        page.image = None
+    logger.debug("Converted pages %d-%d of %s", page_range[0], page_range[1], pdf_filename)
+    return document
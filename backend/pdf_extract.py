@@ -1,28 +1,82 @@
-import os
-from uuid import uuid4
+import json
 import logging
+import time
+from io import BytesIO
 from pathlib import Path
-from docling_core.types.doc import ImageRefMode, PictureItem
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import DocumentConverter, PdfFormatOption
+from docling.datamodel.base_models import DocumentStream
+from docling_core.types.doc import ContentLayer, DocItemLabel, ImageRefMode, PictureItem
+from docling_core.types.doc.document import DEFAULT_EXPORT_LABELS
+from prometheus_client import Counter, Histogram
 
-from storage.s3_utils import upload_file_to_s3
+from backend.converter_pool import DEFAULT_INGEST_PROFILE, get_converter_pool, profile_pipeline_options
+from backend.dedup_cache import (
+    SOURCE_HASH_METADATA,
+    document_hash,
+    extraction_version,
+    lookup_manifest,
+    store_manifest,
+)
+from backend.document_catalog import add_to_catalog, write_document_manifest
+from backend.markdown_chunks import PAGE_BREAK_MARKER
+from backend.markdown_compaction import COMPACTION_VERSION, compact_markdown
+from backend.retrieval_index import build_index
+from backend.stage_timer import StageTimer
+from storage.metrics_utils import LATENCY_BUCKETS
+from storage.s3_utils import bulk_upload_images_to_s3, upload_fileobj_to_s3
 
-IMAGE_RESOLUTION_SCALE = 2.0
+# Everything docling exports by default except page furniture
+MARKDOWN_LABELS = DEFAULT_EXPORT_LABELS - {DocItemLabel.PAGE_HEADER, DocItemLabel.PAGE_FOOTER}
 
-def process_pdf(file_content: bytes, file_name: str) -> dict:
+INGEST_STAGE_SECONDS = Histogram(
+    "ingest_stage_seconds", "Time spent in each stage of process_pdf", ["profile", "stage"], buckets=LATENCY_BUCKETS
+)
+INGEST_PAGES = Counter("ingest_pages", "Pages converted by process_pdf", ["profile"])
+INGEST_DOCUMENTS = Counter(
+    "ingest_documents", "PDFs handled by process_pdf, by outcome (processed, cache_hit or failed)", ["profile", "outcome"]
+)
+
+def observe_stages(profile: str, timer: StageTimer):
+    """
+    Export the stages a StageTimer recorded to the ingest_stage_seconds histogram.
+
+    Args:
+        profile (str): Ingestion profile the PDF was processed with.
+        timer (StageTimer): The timer of one process_pdf call.
+    """
+    for stage, seconds in timer.timings.items():
+        INGEST_STAGE_SECONDS.labels(profile, stage).observe(seconds)
+
+def clean_pdf_filename(file_name: str) -> str:
+    """
+    Derive the name a PDF's outputs are stored under in S3.
+
+    Args:
+        file_name (str): The original name of the uploaded file.
+
+    Returns:
+        str: The file name without extension, lowercased, with spaces replaced by underscores.
+    """
+    return Path(file_name).stem.replace(" ", "_").lower()
+
+def process_pdf(file_content: bytes, file_name: str, status_callback=None, documents: list = None,
+                profile: str = DEFAULT_INGEST_PROFILE, conversion_seconds: float = None) -> dict:
     """
     Process a PDF file to extract markdown content and images, and upload them to S3 with a structured naming format.
 
     Args:
         file_content (bytes): The content of the uploaded PDF file.
         file_name (str): The original name of the uploaded file.
+        status_callback (callable): Optional function called with "converting" and "uploading" as processing advances.
+        documents (list): Already converted page ranges of the PDF, in page order; converted here in one pass if omitted.
+        profile (str): Ingestion profile (fast, standard or full) selecting the docling pipeline options.
+        conversion_seconds (float): Time spent converting ``documents`` elsewhere, for the reported stats.
 
     Returns:
-        dict: A dictionary with S3 URLs for the markdown file, extracted images, and status information.
+        dict: A dictionary with S3 URLs for the markdown file, extracted images, status information,
+        and per-stage timings and resident memory changes under "stats".
     """
-    logging.basicConfig(level=logging.DEBUG)
+    report_status = status_callback or (lambda status: None)
+    timer = StageTimer()
 
     try:
         logging.debug("Starting the PDF processing function.")
@@ -34,103 +88,177 @@ def process_pdf(file_content: bytes, file_name: str) -> dict:
         logging.debug("PDF file content validated.")
 
         # Step 2: Create a cleaned-up filename for S3 storage
-        pdf_filename = Path(file_name).stem.replace(" ", "_").lower()  # Convert to lowercase and replace spaces
+        pdf_filename = clean_pdf_filename(file_name)
         logging.debug(f"Structured S3 filename: {pdf_filename}")
 
-        # Step 3: Write the PDF content to a temporary file
-        temp_pdf_path = Path(f"temp_{uuid4().hex[:8]}.pdf")
-        with open(temp_pdf_path, "wb") as temp_file:
-            temp_file.write(file_content)
-        logging.debug(f"Temporary PDF saved to {temp_pdf_path}.")
-
-        # Step 4: Configure pipeline options for image extraction
-        pipeline_options = PdfPipelineOptions()
-        pipeline_options.images_scale = IMAGE_RESOLUTION_SCALE
-        pipeline_options.generate_page_images = True
-        pipeline_options.generate_picture_images = True
-        pipeline_options.do_table_structure = True
-        logging.debug(f"Pipeline options configured: {pipeline_options}")
-
-        # Step 5: Initialize DocumentConverter and convert the PDF
-        logging.debug("Initializing DocumentConverter...")
-        doc_converter = DocumentConverter(
-            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
-        )
-        conv_res = doc_converter.convert(Path(temp_pdf_path))
-        logging.debug("PDF conversion completed successfully.")
+        # Step 3: Return the existing outputs if this exact PDF was already processed with the same settings
+        # and they haven't since been overwritten by another PDF uploaded under the same name
+        converter_pool = get_converter_pool(profile_pipeline_options(profile))
+        content_hash = document_hash(file_content)
+        version = extraction_version(converter_pool.pipeline_options)
+        manifest = lookup_manifest(content_hash, version)
+        timer.lap("dedup")
+        if manifest:
+            logging.debug(f"Dedup cache hit for {content_hash}; reusing {manifest['markdown_s3_url']}")
+            observe_stages(profile, timer)
+            INGEST_DOCUMENTS.labels(profile, "cache_hit").inc()
+            return {
+                **manifest,
+                "status": "success",
+                "message": "PDF already processed; reusing existing S3 objects",
+                "cache_hit": True,
+                "stats": {"profile": profile, **timer.report()}
+            }
 
-        # Step 6: Extract and upload images to S3
-        logging.debug("Extracting images from PDF...")
-        image_s3_urls = []
-        picture_counter = 0
-        for element, _level in conv_res.document.iterate_items():
-            if isinstance(element, PictureItem):
-                picture_counter += 1
-                temp_image_path = f"{Path(temp_pdf_path).stem}-image-{picture_counter}.png"
-                with open(temp_image_path, "wb") as fp:
-                    element.get_image(conv_res.document).save(fp, "PNG")
-                logging.debug(f"Image saved temporarily: {temp_image_path}")
-
-                # Upload the image to S3 under {pdf_filename}/images/
-                image_s3_url = upload_file_to_s3(
-                    file_path=temp_image_path,
-                    source=pdf_filename,  # Store under PDF name
-                    metadata={
-                        "file_type": "image",
-                        "original_filename": file_name
-                    }
+        # Step 4: Check out a warm DocumentConverter from the shared pool and convert the in-memory PDF
+        if documents is None:
+            logging.debug(f"Using converter pool for pipeline {converter_pool.key}")
+            report_status("converting")
+            with converter_pool.acquire() as doc_converter:
+                conv_res = doc_converter.convert(
+                    DocumentStream(name=f"{pdf_filename}.pdf", stream=BytesIO(file_content))
                 )
-                image_s3_urls.append(image_s3_url)
-                logging.debug(f"Image uploaded to S3: {image_s3_url}")
-
-                # Clean up the temporary image file
-                os.remove(temp_image_path)
-                logging.debug(f"Temporary image file deleted: {temp_image_path}")
-
-        # Step 7: Save and upload Markdown content to S3
-        logging.debug("Saving Markdown content...")
-        temp_markdown_path = Path(f"{pdf_filename}_with_images.md")
-        conv_res.document.save_as_markdown(temp_markdown_path, image_mode=ImageRefMode.REFERENCED)
-        logging.debug(f"Markdown content saved temporarily: {temp_markdown_path}")
-
-        # Upload Markdown to S3 under {pdf_filename}/markdown/
-        markdown_s3_url = upload_file_to_s3(
-            file_path=temp_markdown_path,
+            documents = [conv_res.document]
+            timer.lap("convert")
+        else:
+            timer.record("convert", conversion_seconds or 0.0)
+        logging.debug(f"PDF conversion completed successfully ({len(documents)} page ranges).")
+
+        # Step 5: Collect picture images and point the markdown references at their S3 location,
+        # numbering pictures across all page ranges in page order
+        logging.debug("Extracting images from PDF...")
+        pictures = []
+        for document in documents:
+            for element, _level in document.iterate_items():
+                if isinstance(element, PictureItem):
+                    image = element.get_image(document)
+                    if image is None:
+                        continue
+                    image_name = f"{pdf_filename}-image-{len(pictures) + 1}.png"
+                    pictures.append((image_name, image))
+                    if element.image is not None:
+                        # Relative to {pdf_filename}/markdown/, where the markdown is stored
+                        element.image.uri = Path(f"../images/{image_name}")
+        logging.debug(f"Found {len(pictures)} images.")
+        timer.lap("extract_images")
+
+        # Step 6: Encode and upload images to S3 under {pdf_filename}/images/ concurrently
+        report_status("uploading")
+        image_s3_urls = bulk_upload_images_to_s3(
+            pictures,
+            source=pdf_filename,  # Store under PDF name
+            metadata={
+                "file_type": "image",
+                "original_filename": file_name,
+                SOURCE_HASH_METADATA: content_hash  # Lets the dedup cache detect outputs overwritten by another PDF
+            }
+        )
+        logging.debug(f"Uploaded {len(image_s3_urls)} images to S3.")
+        timer.lap("upload_images")
+
+        # Step 7: Render Markdown in memory and upload it to S3 under {pdf_filename}/markdown/, with a marker
+        # at every page boundary (including between page ranges) so chunking can split on pages. Page headers
+        # and footers are left out: they repeat on every page and would be indexed and billed as content
+        markdown_content = f"\n\n{PAGE_BREAK_MARKER}\n\n".join(
+            document.export_to_markdown(
+                image_mode=ImageRefMode.REFERENCED,
+                page_break_placeholder=PAGE_BREAK_MARKER,
+                labels=MARKDOWN_LABELS,
+                included_content_layers={ContentLayer.BODY},
+            )
+            for document in documents
+        )
+        markdown_bytes = markdown_content.encode("utf-8")
+        markdown_hash = document_hash(markdown_bytes)
+        markdown_s3_url = upload_fileobj_to_s3(
+            BytesIO(markdown_bytes),
             source=pdf_filename,  # Store under PDF name
+            file_name=f"{pdf_filename}_with_images.md",
             metadata={
                 "file_type": "markdown",
-                "original_filename": file_name
+                "original_filename": file_name,
+                "content-sha256": markdown_hash,  # Lets consumers cache the body by content
+                SOURCE_HASH_METADATA: content_hash
             }
         )
         logging.debug(f"Markdown uploaded to S3: {markdown_s3_url}")
+        timer.lap("markdown")
 
-        # Step 8: Clean up temporary files
-        os.remove(temp_pdf_path)
-        os.remove(temp_markdown_path)
-        logging.debug("Temporary files cleaned up.")
-
-        # ✅ Ensure the images artifact folder is deleted last
-        artifact_folder = Path(f"{pdf_filename}_with_images_artifacts")  # This is likely the folder being left behind
+        # Step 8: Store the compact variant the worker sends to models next to the markdown: no image
+        # references, running headers and footers docling missed, or table padding, which would be billed as input tokens
+        compact_content = compact_markdown(markdown_content)
+        compact_bytes = compact_content.encode("utf-8")
+        compact_s3_url = upload_fileobj_to_s3(
+            BytesIO(compact_bytes),
+            source=pdf_filename,  # Store under PDF name
+            file_name=f"{pdf_filename}_compact.md",
+            metadata={
+                "file_type": "markdown",
+                "original_filename": file_name,
+                "content-sha256": document_hash(compact_bytes),
+                # Lets the worker check the variant was compacted from this markdown, by this code
+                "source-sha256": markdown_hash,
+                "compaction-version": COMPACTION_VERSION,
+                SOURCE_HASH_METADATA: content_hash
+            }
+        )
+        logging.debug(
+            f"Compact markdown uploaded to S3: {compact_s3_url} "
+            f"({len(compact_bytes)} of {len(markdown_bytes)} bytes)"
+        )
+        timer.lap("compact")
 
-        try:
-            if artifact_folder.exists() and artifact_folder.is_dir():
-                for file in artifact_folder.glob("*"):  # Delete all files first
-                    os.remove(file)
-                os.rmdir(artifact_folder)  # Then delete the folder itself
-                logging.debug(f"Deleted artifact folder: {artifact_folder}")
-        except Exception as e:
-            logging.error(f"Failed to delete artifact folder {artifact_folder}: {e}")
+        # Step 9: Build the retrieval index for question answering from the compact variant and store it
+        # next to the markdown; it is tied to the markdown's hash, which is what tasks refer to
+        index = build_index(compact_content, document_hash=markdown_hash)
+        index_s3_url = upload_fileobj_to_s3(
+            BytesIO(json.dumps(index).encode("utf-8")),
+            source=pdf_filename,  # Store under PDF name
+            file_name=f"{pdf_filename}_index.json",
+            metadata={
+                "file_type": "index",
+                "original_filename": file_name,
+                SOURCE_HASH_METADATA: content_hash
+            }
+        )
+        logging.debug(f"Retrieval index with {len(index['chunks'])} chunks uploaded to S3: {index_s3_url}")
+        timer.lap("index")
 
-        # Step 9: Return success response
-        logging.debug("PDF processing completed successfully.")
-        return {
+        # Step 10: Record the outputs for future identical uploads
+        manifest = {
             "markdown_s3_url": markdown_s3_url,
+            "compact_markdown_s3_url": compact_s3_url,
             "image_s3_urls": image_s3_urls,
+            "index_s3_url": index_s3_url,
             "pdf_filename": pdf_filename,
+            "profile": profile,
+            "processed_at": int(time.time())
+        }
+        store_manifest(content_hash, version, manifest)
+
+        # Step 11: List the document in the catalog served by /select_pdfcontent/ and return success response
+        write_document_manifest(manifest, file_name)
+        add_to_catalog(manifest)
+        timer.lap("catalog")
+        logging.debug("PDF processing completed successfully.")
+        pages = sum(len(document.pages) for document in documents)
+        observe_stages(profile, timer)
+        INGEST_PAGES.labels(profile).inc(pages)
+        INGEST_DOCUMENTS.labels(profile, "processed").inc()
+        return {
+            **manifest,
             "status": "success",
-            "message": "PDF processed and uploaded to S3 successfully"
+            "message": "PDF processed and uploaded to S3 successfully",
+            "cache_hit": False,
+            "stats": {
+                "profile": profile,
+                "markdown_bytes": len(markdown_bytes),
+                "compact_markdown_bytes": len(compact_bytes),
+                **timer.report(pages=pages)
+            }
         }
 
     except Exception as e:
+        INGEST_DOCUMENTS.labels(profile, "failed").inc()
         logging.error(f"Error processing PDF: {e}", exc_info=True)
         raise RuntimeError(f"Error processing PDF: {str(e)}")
\ No newline at end of file
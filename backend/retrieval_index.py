@@ -0,0 +1,122 @@
+import math
+import os
+import re
+from collections import Counter
+
+from backend.markdown_chunks import chunk_markdown
+
+# Size of the retrievable passages
+INDEX_CHUNK_CHARS = int(os.getenv("INDEX_CHUNK_CHARS", 1500))
+INDEX_FORMAT_VERSION = 1
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what when "
+    "where which who why will with how does do did can".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """
+    Split text into lowercase terms for indexing and querying.
+
+    Args:
+        text (str): Text to tokenize.
+
+    Returns:
+        list: Terms in order, without stopwords.
+    """
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def index_key_for_document(document_key: str) -> str:
+    """
+    Locate the index stored next to a document's markdown.
+
+    Args:
+        document_key (str): Object key of the markdown, e.g. ``report/markdown/report_with_images.md``.
+
+    Returns:
+        str: Object key of the index, e.g. ``report/index/report_index.json``.
+    """
+    pdf_filename = document_key.split("/", 1)[0]
+    return f"{pdf_filename}/index/{pdf_filename}_index.json"
+
+
+def build_index(markdown: str, document_hash: str = None, chunk_chars: int = INDEX_CHUNK_CHARS) -> dict:
+    """
+    Build a BM25 inverted index over the chunks of a markdown document.
+
+    Args:
+        markdown (str): The markdown document.
+        document_hash (str): Hash of the markdown, so readers can detect a stale index.
+        chunk_chars (int): Maximum characters per chunk.
+
+    Returns:
+        dict: A JSON-serializable index with the chunk texts, their lengths and the postings lists.
+    """
+    chunks = chunk_markdown(markdown, chunk_chars)
+    postings = {}
+    lengths = []
+    for chunk_id, chunk in enumerate(chunks):
+        terms = tokenize(chunk)
+        lengths.append(len(terms))
+        for term, frequency in Counter(terms).items():
+            postings.setdefault(term, []).append([chunk_id, frequency])
+
+    return {
+        "version": INDEX_FORMAT_VERSION,
+        "document_hash": document_hash,
+        "chunks": chunks,
+        "lengths": lengths,
+        "average_length": sum(lengths) / len(lengths) if lengths else 0.0,
+        "postings": postings,
+    }
+
+
+def search(index: dict, query: str, top_k: int) -> list:
+    """
+    Rank the chunks of an index against a query with BM25.
+
+    Args:
+        index (dict): An index from ``build_index``.
+        query (str): The user's question.
+        top_k (int): Number of chunks to return.
+
+    Returns:
+        list: (chunk_id, score) pairs, best first.
+    """
+    chunk_count = len(index["chunks"])
+    average_length = index["average_length"] or 1.0
+    scores = Counter()
+    for term in set(tokenize(query)):
+        postings = index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+        for chunk_id, frequency in postings:
+            length_norm = 1 - BM25_B + BM25_B * index["lengths"][chunk_id] / average_length
+            scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+    return scores.most_common(top_k)
+
+
+def top_chunks(index: dict, query: str, top_k: int) -> list:
+    """
+    Select the chunks most relevant to a query.
+
+    Args:
+        index (dict): An index from ``build_index``.
+        query (str): The user's question.
+        top_k (int): Number of chunks to return.
+
+    Returns:
+        list: Chunk texts in document order. Falls back to the opening chunks when nothing matches.
+    """
+    ranked = [chunk_id for chunk_id, _score in search(index, query, top_k)]
+    if not ranked:
+        ranked = list(range(min(top_k, len(index["chunks"]))))
+    return [index["chunks"][chunk_id] for chunk_id in sorted(ranked)]
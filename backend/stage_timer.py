@@ -0,0 +1,87 @@
+import os
+import resource
+import time
+
+
+def peak_rss_mb() -> float:
+    """
+    Read the peak resident memory of the current process over its whole lifetime.
+
+    Returns:
+        float: The high-water mark of the process's resident set size in MiB.
+    """
+    # ru_maxrss is in KiB on Linux, where the ingest workers run
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    """
+    Read the resident memory the current process holds right now.
+
+    Returns:
+        float: The process's resident set size in MiB.
+    """
+    # The second field of statm is the resident set in pages (Linux, where the ingest workers run)
+    with open("/proc/self/statm") as statm:
+        resident_pages = int(statm.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class StageTimer:
+    """
+    Records how long each stage of a pipeline took and how much the process's memory grew during it.
+
+    Call ``lap`` at the end of every stage; each lap measures the time and resident memory change
+    since the previous one. Unlike the lifetime peak, the change belongs to this pipeline run
+    (and whatever else the process did at the same time).
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.rss_delta_mb = {}
+        self._started = time.perf_counter()
+        self._lap_started = self._started
+        self._lap_rss_mb = current_rss_mb()
+
+    def lap(self, stage: str):
+        """
+        Close the current stage.
+
+        Args:
+            stage (str): Name the stage is reported under.
+        """
+        now = time.perf_counter()
+        rss_mb = current_rss_mb()
+        self.timings[stage] = round(self.timings.get(stage, 0.0) + now - self._lap_started, 3)
+        self.rss_delta_mb[stage] = round(self.rss_delta_mb.get(stage, 0.0) + rss_mb - self._lap_rss_mb, 1)
+        self._lap_started = now
+        self._lap_rss_mb = rss_mb
+
+    def record(self, stage: str, seconds: float):
+        """
+        Record a stage that ran elsewhere (e.g. in other processes) and start the next stage now.
+
+        Args:
+            stage (str): Name the stage is reported under.
+            seconds (float): How long the stage took.
+        """
+        self.timings[stage] = round(self.timings.get(stage, 0.0) + seconds, 3)
+        self._lap_started = time.perf_counter()
+        self._lap_rss_mb = current_rss_mb()
+
+    def report(self, pages: int = None) -> dict:
+        """
+        Summarize the stages recorded so far.
+
+        Args:
+            pages (int): Number of pages processed, to derive the cost per page.
+
+        Returns:
+            dict: Per-stage seconds and resident memory change, the total, and seconds per page when pages is given.
+        """
+        total = round(sum(self.timings.values()), 3)
+        report = {"timings_s": dict(self.timings), "total_s": total, "rss_delta_mb": dict(self.rss_delta_mb)}
+        if pages:
+            report["pages"] = pages
+            report["seconds_per_page"] = round(total / pages, 4)
+        return report
@@ -0,0 +1,158 @@
+"""
+Load test of one uvicorn worker running the FastAPI backend, against local stand-ins for Redis
+and S3 (see benchmarks/stand_ins.py). No LLM worker runs; tasks just accumulate in the task lanes.
+
+For each concurrency level, that many clients send requests back to back for a fixed time, mixing
+/ask_question (S3 lookup, enqueue and trace), /select_pdfcontent/ (catalog page), /ingest_status
+and /results. The JSON report gives requests/sec, error count and per-endpoint p50/p95/p99 latency
+per level, stamped with the current commit so runs before and after a change can be compared.
+
+The clients and the stand-ins share this process and compete with the API for CPU, so absolute
+numbers are pessimistic; compare runs on the same machine.
+
+Usage:
+    python -m benchmarks.bench_api_load [--concurrency 10 100 300] [--duration 10] [--output report.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_end_to_end import current_commit, seed_corpus
+from benchmarks.stand_ins import percentiles, start_stand_ins
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_api(port: int) -> subprocess.Popen:
+    # A single uvicorn worker, as in the backend's container
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.fastapi_backend:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", "1", "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_for_api(client, server: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"API exited with status {server.returncode}")
+        try:
+            if (await client.get("/ingest_cache_stats")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("API did not start in time")
+
+
+async def run_level(client, concurrency: int, duration: float, document_urls: list, rng: random.Random) -> dict:
+    latencies = {}
+    errors = 0
+    task_ids = []
+
+    def next_request():
+        endpoint = rng.choices(["ask_question", "select_pdfcontent", "ingest_status", "results"], [4, 2, 2, 2])[0]
+        if endpoint == "ask_question":
+            return endpoint, client.post("/ask_question", json={
+                "model_name": "gpt-4o", "document_url": rng.choice(document_urls), "question": "What is this about?",
+            })
+        if endpoint == "select_pdfcontent":
+            return endpoint, client.get("/select_pdfcontent/", params={"limit": 20})
+        if endpoint == "ingest_status":
+            return endpoint, client.get(f"/ingest_status/{rng.getrandbits(64):016x}")
+        ids = ",".join(rng.sample(task_ids, min(len(task_ids), 10))) or "0-0"
+        return endpoint, client.get("/results", params={"ids": ids})
+
+    async def one_client(deadline: float):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            endpoint, request = next_request()
+            started = time.perf_counter()
+            try:
+                response = await request
+            except Exception:
+                errors += 1
+                continue
+            latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+            # Unknown ingest jobs answer 404 by design
+            if response.status_code >= 500 or (response.status_code >= 400 and endpoint != "ingest_status"):
+                errors += 1
+            elif endpoint == "ask_question":
+                task_ids.append(response.json()["task_id"])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_client(started + duration) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    requests = sum(len(values) for values in latencies.values())
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "requests_per_sec": round(requests / elapsed, 1),
+        "latency_s": percentiles([value for values in latencies.values() for value in values]),
+        "latency_by_endpoint_s": {endpoint: percentiles(values) for endpoint, values in sorted(latencies.items())},
+    }
+
+
+async def run_benchmark(args, port: int, document_urls: list) -> list:
+    import httpx
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    server = start_api(port)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await wait_for_api(client, server)
+            rng = random.Random(args.seed)
+            # A short warm-up so connection setup isn't counted in the first level
+            await run_level(client, min(args.concurrency), 1, document_urls, rng)
+            return [
+                await run_level(client, concurrency, args.duration, document_urls, rng)
+                for concurrency in args.concurrency
+            ]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument("--documents", type=int, default=20, help="Documents seeded in the bucket")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    stand_ins = start_stand_ins()
+    # The ingest pool isn't exercised; one worker keeps startup short
+    os.environ["INGEST_WORKERS"] = "1"
+    document_urls = seed_corpus(args.documents, 2)
+
+    levels = asyncio.run(run_benchmark(args, args.port, document_urls))
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "stand_ins": stand_ins,
+        "levels": levels,
+    }
+    if args.output:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measure worker throughput (tasks/sec) against a fake LLM provider as the per-worker
+concurrency setting changes.
+
+The provider is litellm's own ``mock_response`` path wrapped in a fixed sleep, so responses,
+token usage and cost go through the same code as real completions. Redis is fakeredis.
+
+Usage:
+    python -m benchmarks.bench_async_dispatch [--tasks 200] [--latency 0.5] [--concurrency 1 4 16 64]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import fakeredis
+import litellm
+
+from llm_integration import redis_consumer
+from storage.result_store import RESULT_KEY_PREFIX
+from storage.task_queue import INTERACTIVE_LANE, TASK_STREAMS
+
+
+def install_fakes(latency: float) -> fakeredis.FakeServer:
+    server = fakeredis.FakeServer()
+    redis_consumer.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_consumer.get_async_redis_client = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    async def fake_acompletion(**kwargs):
+        await asyncio.sleep(latency)
+        return await litellm.acompletion(**kwargs, mock_response="Fake completion from the benchmark provider.")
+
+    redis_consumer.acompletion = fake_acompletion
+    return server
+
+
+async def run_level(tasks: int, concurrency: int, model_name: str) -> dict:
+    client = redis_consumer.redis_client
+    client.flushall()
+    redis_consumer._model_semaphores.clear()
+    redis_consumer.MODEL_CONCURRENCY_LIMITS[model_name] = concurrency
+
+    redis_consumer.ensure_consumer_group()
+    for index in range(tasks):
+        client.xadd(TASK_STREAMS[INTERACTIVE_LANE], {
+            "task_type": "ask_question",
+            "model_name": model_name,
+            "document_content": f"Benchmark document {index}",
+            "question": "What is this document about?",
+        })
+
+    started = time.perf_counter()
+    worker = asyncio.create_task(redis_consumer.run_async_worker("bench", max_in_flight=concurrency))
+    while sum(1 for _ in client.scan_iter(match=f"{RESULT_KEY_PREFIX}*")) < tasks:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    worker.cancel()
+
+    return {"concurrency": concurrency, "tasks": tasks, "seconds": round(elapsed, 3),
+            "tasks_per_sec": round(tasks / elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake provider latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--model", default="gpt-4o", choices=sorted(redis_consumer.MODEL_API_KEYS))
+    args = parser.parse_args()
+
+    install_fakes(args.latency)
+    report = [asyncio.run(run_level(args.tasks, level, args.model)) for level in args.concurrency]
+    print(json.dumps({"latency_s": args.latency, "levels": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Report the input tokens that markdown compaction saves per document, counted with the tokenizer
+LiteLLM uses for each model the worker can call.
+
+Documents are markdown files given as paths, markdown objects in S3 given by key, or every
+document in the catalog. Without any, a synthetic document in the style docling exports with
+ImageRefMode.REFERENCED is measured: page-break markers, a running header and footer on every
+page that docling didn't label as such, image references, and tables padded to align their columns.
+
+Usage:
+    python -m benchmarks.bench_compaction [paths ...] [--s3-key KEY ...] [--catalog] [--pages 20]
+"""
+import argparse
+import json
+import time
+
+from litellm import token_counter
+
+from backend.markdown_chunks import PAGE_BREAK_MARKER
+from backend.markdown_compaction import compact_markdown
+from llm_integration.redis_consumer import MODEL_API_KEYS
+
+
+def docling_style_markdown(pages: int) -> str:
+    page_texts = []
+    for page in range(1, pages + 1):
+        lines = ["ACME Corporation - Annual Report 2024", f"## {page}. Operations review"]
+        lines += [
+            f"Revenue in segment {page} grew by {3 + page % 7}% on the prior year, driven by new contracts "
+            "and higher volumes in the existing customer base. Margins held steady as input costs eased."
+        ] * 3
+        lines.append(f"![Image](../images/annual_report-image-{page}.png)")
+        if page % 2 == 0:
+            rows = [("Region", "Revenue ($m)", "Notes"), ("North America", "412.5", "Includes one acquisition"),
+                    ("Europe", "288.1", ""), ("Asia Pacific", "97.3", "New office opened in the second half"),
+                    ("", "", "")]
+            widths = [max(len(row[column]) for row in rows) + 8 for column in range(3)]
+            table = [f"| {' | '.join(cell.ljust(width) for cell, width in zip(row, widths))} |" for row in rows]
+            table.insert(1, f"|{'|'.join('-' * (width + 2) for width in widths)}|")
+            lines.append("\n".join(table))
+        lines += ["Confidential - for shareholders only", f"Page {page} of {pages}"]
+        page_texts.append("\n\n".join(lines))
+    return f"\n\n{PAGE_BREAK_MARKER}\n\n".join(page_texts)
+
+
+def load_documents(args) -> list:
+    documents = [(path, open(path, encoding="utf-8").read()) for path in args.paths]
+    if args.s3_key or args.catalog:
+        from backend.document_catalog import list_catalog
+        from storage.s3_utils import download_text, object_key_from_url
+
+        keys = list(args.s3_key)
+        if args.catalog:
+            cursor = None
+            while True:
+                page = list_catalog(cursor=cursor)
+                keys += [object_key_from_url(entry["markdown"]) for entry in page["entries"]]
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+        documents += [(key, download_text(key)) for key in keys]
+    if not documents:
+        documents.append((f"synthetic docling markdown, {args.pages} pages", docling_style_markdown(args.pages)))
+    return documents
+
+
+def count_tokens(model: str, text: str):
+    try:
+        return token_counter(model=model, text=text)
+    except Exception:
+        # Models LiteLLM has no tokenizer or pricing entry for
+        return None
+
+
+def measure(name: str, markdown: str) -> dict:
+    started = time.perf_counter()
+    compact = compact_markdown(markdown)
+    compact_ms = (time.perf_counter() - started) * 1000
+
+    tokens = {}
+    for model_name, api_details in MODEL_API_KEYS.items():
+        original_tokens = count_tokens(api_details["model"], markdown)
+        compact_tokens = count_tokens(api_details["model"], compact)
+        if original_tokens is None or compact_tokens is None:
+            tokens[model_name] = None
+            continue
+        tokens[model_name] = {
+            "original": original_tokens,
+            "compact": compact_tokens,
+            "saved": original_tokens - compact_tokens,
+            "saved_pct": round(100 * (original_tokens - compact_tokens) / max(1, original_tokens), 1),
+        }
+    return {
+        "document": name,
+        "chars": {"original": len(markdown), "compact": len(compact)},
+        "compact_ms": round(compact_ms, 2),
+        "tokens": tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Markdown files to measure")
+    parser.add_argument("--s3-key", action="append", default=[], help="Object key of a markdown document in S3")
+    parser.add_argument("--catalog", action="store_true", help="Measure every document in the catalog")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the synthetic document")
+    args = parser.parse_args()
+
+    report = [measure(name, markdown) for name, markdown in load_documents(args)]
+    print(json.dumps({"documents": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
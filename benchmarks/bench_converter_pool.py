@@ -0,0 +1,82 @@
+"""
+Compare per-upload conversion latency with a fresh DocumentConverter per call (the old
+behaviour) against the warm, shared converter pool.
+
+Usage:
+    python -m benchmarks.bench_converter_pool [path/to/file.pdf] [--iterations 5]
+
+Prints a JSON report with the startup cost, the first-upload latency and the
+steady-state (median of the remaining uploads) latency for both strategies.
+"""
+import argparse
+import json
+import statistics
+import time
+from io import BytesIO
+
+from docling.datamodel.base_models import DocumentStream, InputFormat
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+from backend.converter_pool import build_text_pdf, default_pipeline_options, get_converter_pool, warm_converter_pools
+
+
+def _stream(pdf_bytes: bytes) -> DocumentStream:
+    return DocumentStream(name="benchmark.pdf", stream=BytesIO(pdf_bytes))
+
+
+def _summarize(latencies: list) -> dict:
+    return {
+        "first_upload_s": round(latencies[0], 3),
+        "steady_state_s": round(statistics.median(latencies[1:] or latencies), 3),
+        "uploads": len(latencies),
+    }
+
+
+def bench_cold(pdf_bytes: bytes, iterations: int) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        converter = DocumentConverter(
+            format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=default_pipeline_options())}
+        )
+        converter.convert(_stream(pdf_bytes))
+        latencies.append(time.perf_counter() - started)
+    return {"startup_s": 0.0, **_summarize(latencies)}
+
+
+def bench_pooled(pdf_bytes: bytes, iterations: int) -> dict:
+    started = time.perf_counter()
+    warm_converter_pools()
+    startup = time.perf_counter() - started
+
+    pool = get_converter_pool()
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        with pool.acquire() as converter:
+            converter.convert(_stream(pdf_bytes))
+        latencies.append(time.perf_counter() - started)
+    return {"startup_s": round(startup, 3), **_summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF to convert (defaults to a generated 3-page text PDF)")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as pdf_file:
+            pdf_bytes = pdf_file.read()
+    else:
+        pdf_bytes = build_text_pdf([f"Benchmark page {page}\nLorem ipsum dolor sit amet." for page in range(1, 4)])
+
+    report = {
+        "per_call_converter": bench_cold(pdf_bytes, args.iterations),
+        "warm_pool": bench_pooled(pdf_bytes, args.iterations),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
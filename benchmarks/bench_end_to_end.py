@@ -0,0 +1,281 @@
+"""
+Hermetic end-to-end benchmark of the whole stack: the FastAPI app (in process, with its ingest
+pool), the redis_consumer async worker and process_pdf, against local stand-ins for Redis, S3
+and the LLM providers (see benchmarks/stand_ins.py).
+
+It ingests a synthetic PDF corpus through /upload_pdf/ (or /ingest_batch/ with --batch), then replays a question and summary
+workload through /ask_question and /summarize, and prints a JSON report (or writes it with
+--output) with ingest pages/sec, task throughput, queue wait, p50/p95/p99 latencies and
+per-stage times from each task's trace, stamped with the current commit so runs can be compared.
+
+Ingest needs docling's models (downloaded from Hugging Face on first use). With --tasks-only
+the corpus's markdown and retrieval indexes are uploaded directly, as process_pdf would store
+them, and only the question/summary path is measured.
+
+Usage:
+    python -m benchmarks.bench_end_to_end [--documents 8] [--pages 30] [--questions 5]
+        [--llm-latency 0.5] [--worker-concurrency 16] [--batch] [--tasks-only] [--output report.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+
+from benchmarks.stand_ins import install_fake_llm, percentiles, start_stand_ins
+
+QUESTIONS = [
+    "What is the main topic of this document?",
+    "Which figures are reported for revenue?",
+    "Who are the people mentioned?",
+    "What risks does the document describe?",
+    "What happens in section 2?",
+]
+
+
+def synthetic_corpus(documents: int, pages: int) -> list:
+    from backend.converter_pool import build_text_pdf
+
+    corpus = []
+    for document in range(documents):
+        corpus.append((f"benchmark_document_{document}.pdf", build_text_pdf([
+            f"Document {document}, section {page}\n"
+            + f"Revenue for quarter {page} was {1000 + 37 * page + document} thousand dollars.\n"
+            + "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.\n" * 25
+            for page in range(1, pages + 1)
+        ])))
+    return corpus
+
+
+def seed_corpus(documents: int, pages: int) -> list:
+    # Stores markdown and retrieval indexes the way process_pdf's upload steps do, without converting PDFs
+    from backend.dedup_cache import document_hash
+    from backend.markdown_compaction import COMPACTION_VERSION, compact_markdown
+    from backend.retrieval_index import build_index
+    from storage.s3_utils import upload_fileobj_to_s3
+
+    document_urls = []
+    for document in range(documents):
+        pdf_filename = f"benchmark_document_{document}"
+        markdown = "\n\n".join(
+            f"## Section {page}\n\n"
+            + f"Revenue for quarter {page} was {1000 + 37 * page + document} thousand dollars. "
+            + "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. " * 25
+            for page in range(1, pages + 1)
+        )
+        markdown_bytes = markdown.encode("utf-8")
+        markdown_hash = document_hash(markdown_bytes)
+        document_urls.append(upload_fileobj_to_s3(
+            io.BytesIO(markdown_bytes), pdf_filename, f"{pdf_filename}_with_images.md",
+            metadata={"content-sha256": markdown_hash},
+        ))
+        compact = compact_markdown(markdown)
+        upload_fileobj_to_s3(
+            io.BytesIO(compact.encode("utf-8")), pdf_filename, f"{pdf_filename}_compact.md",
+            metadata={"source-sha256": markdown_hash, "compaction-version": COMPACTION_VERSION},
+        )
+        index = build_index(compact, document_hash=markdown_hash)
+        upload_fileobj_to_s3(
+            io.BytesIO(json.dumps(index).encode("utf-8")), pdf_filename, f"{pdf_filename}_index.json"
+        )
+    return document_urls
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def ingest_corpus(client, corpus: list, profile: str) -> tuple:
+    async def ingest_one(file_name: str, pdf_bytes: bytes):
+        started = time.perf_counter()
+        response = await client.post(
+            "/upload_pdf/", files={"file": (file_name, pdf_bytes, "application/pdf")}, data={"profile": profile}
+        )
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"/ingest_status/{job_id}")).json()
+            if job.get("status") in ("done", "failed"):
+                break
+            await asyncio.sleep(0.1)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Ingest of {file_name} failed: {job.get('error')}")
+        return time.perf_counter() - started, job["result"]
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(ingest_one(file_name, pdf_bytes) for file_name, pdf_bytes in corpus))
+    elapsed = time.perf_counter() - started
+
+    pages = sum(outcome[1].get("stats", {}).get("pages", 0) for outcome in outcomes)
+    report = {
+        "documents": len(corpus),
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2),
+        "job_latency_s": percentiles([outcome[0] for outcome in outcomes]),
+    }
+    return report, [outcome[1]["markdown_s3_url"] for outcome in outcomes]
+
+
+async def ingest_corpus_batch(client, corpus: list, profile: str) -> tuple:
+    started = time.perf_counter()
+    response = await client.post(
+        "/ingest_batch/",
+        files=[("files", (file_name, pdf_bytes, "application/pdf")) for file_name, pdf_bytes in corpus],
+        data={"profile": profile},
+    )
+    response.raise_for_status()
+    batch_id = response.json()["batch_id"]
+    while True:
+        batch = (await client.get(f"/ingest_batch/{batch_id}")).json()
+        if batch["complete"]:
+            break
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+
+    failed = [job for job in batch["jobs"] if job["status"] != "done"]
+    if failed:
+        raise RuntimeError(f"Ingest of {failed[0]['file_name']} failed: {failed[0].get('error')}")
+    report = {
+        "documents": len(corpus),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(batch["pages_per_hour"] / 3600, 2),
+        "documents_per_hour": batch["documents_per_hour"],
+    }
+    return report, [job["markdown_s3_url"] for job in batch["jobs"]]
+
+
+async def run_tasks(client, document_urls: list, questions: int, model_name: str, queue_waits: list) -> dict:
+    async def run_one(endpoint: str, payload: dict):
+        started = time.perf_counter()
+        response = await client.post(endpoint, json=payload)
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+        while True:
+            result = await client.get(f"/get_result/{task_id}", params={"wait": 30})
+            if result.status_code == 200:
+                return task_id, time.perf_counter() - started
+            if result.status_code != 404:
+                result.raise_for_status()
+
+    workload = []
+    for document_url in document_urls:
+        workload.append(("/summarize", {"document_url": document_url, "model_name": model_name}))
+        for index in range(questions):
+            workload.append(("/ask_question", {
+                "document_url": document_url, "model_name": model_name, "question": QUESTIONS[index % len(QUESTIONS)],
+            }))
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(run_one(endpoint, payload) for endpoint, payload in workload))
+    elapsed = time.perf_counter() - started
+
+    # Per-stage breakdown from each task's trace (see /trace/{task_id})
+    stages = {}
+    for task_id, _latency in outcomes:
+        trace = await client.get(f"/trace/{task_id}")
+        if trace.status_code == 200:
+            for stage, seconds in trace.json()["stages_s"].items():
+                stages.setdefault(stage, []).append(seconds)
+    return {
+        "tasks": len(workload),
+        "seconds": round(elapsed, 3),
+        "tasks_per_sec": round(len(workload) / elapsed, 2),
+        "queue_wait_s": percentiles(queue_waits),
+        "latency_s": percentiles([latency for _task_id, latency in outcomes]),
+        "stages_s": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+    }
+
+
+async def run_benchmark(args) -> dict:
+    import httpx
+
+    from api import fastapi_backend
+    from llm_integration import redis_consumer
+
+    install_fake_llm(redis_consumer, args.llm_latency)
+
+    # Queue wait: from the enqueue time encoded in the task id to the worker picking the task up
+    queue_waits = []
+    process_task = redis_consumer.process_task
+
+    async def timed_process_task(task):
+        queue_waits.append(time.time() - int(task["id"].split("-")[0]) / 1000)
+        return await process_task(task)
+
+    redis_consumer.process_task = timed_process_task
+
+    # The worker gets its own event loop in a daemon thread, as it would run in its own process.
+    # It is never cancelled: cancelling redis-py's asyncio client in the middle of a blocking
+    # XREADGROUP can leave the task unable to finish, which would hang asyncio.run on exit.
+    threading.Thread(
+        target=asyncio.run,
+        args=(redis_consumer.run_async_worker("benchmark", max_in_flight=args.worker_concurrency),),
+        daemon=True,
+    ).start()
+
+    app = fastapi_backend.app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            if args.tasks_only:
+                ingest, document_urls = None, await asyncio.to_thread(seed_corpus, args.documents, args.pages)
+            else:
+                ingest, document_urls = await (ingest_corpus_batch if args.batch else ingest_corpus)(
+                    client, synthetic_corpus(args.documents, args.pages), args.profile
+                )
+            tasks = await run_tasks(client, document_urls, args.questions, args.model, queue_waits)
+
+    return {"ingest": ingest, "tasks": tasks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=30, help="Pages per synthetic document")
+    parser.add_argument("--profile", default="full", help="Ingestion profile used for uploads")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per document, plus one summary")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Median fake provider latency in seconds")
+    parser.add_argument("--worker-concurrency", type=int, default=16)
+    parser.add_argument("--ingest-workers", type=int, default=2)
+    parser.add_argument("--batch", action="store_true", help="Ingest the corpus with one /ingest_batch/ request")
+    parser.add_argument("--tasks-only", action="store_true", help="Seed the corpus directly instead of ingesting PDFs")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="Show the stack's own logging")
+    args = parser.parse_args()
+
+    stand_ins = start_stand_ins()
+    os.environ["INGEST_WORKERS"] = str(args.ingest_workers)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        results = asyncio.run(run_benchmark(args))
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+        "stand_ins": stand_ins,
+        **results,
+    }
+    if args.output:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
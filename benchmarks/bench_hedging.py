@@ -0,0 +1,128 @@
+"""
+Measure question latency against a primary model with a slow tail, without hedging and with
+hedging to a fallback model, and what the hedged requests cost.
+
+The fake primary answers most requests quickly but a share of them very slowly; the fake fallback
+is a little slower than the primary's typical request but never stalls. Warm-up questions fill
+the primary's latency histogram before the measured run. Redis is fakeredis.
+
+Usage:
+    python -m benchmarks.bench_hedging [--questions 200] [--rate 20] [--slow-share 0.03]
+        [--fast 0.2] [--slow 3] [--fallback-latency 0.3]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import fakeredis
+import litellm
+
+from benchmarks.stand_ins import percentiles
+from llm_integration import hedging, redis_consumer
+from storage.result_store import decode_result, result_key
+from storage.task_queue import INTERACTIVE_LANE, TASK_STREAMS, new_task_id
+
+
+def install_fakes(args):
+    server = fakeredis.FakeServer()
+    redis_consumer.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_consumer.get_async_redis_client = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    primary_model = redis_consumer.MODEL_API_KEYS[args.model]["model"]
+
+    async def fake_acompletion(**kwargs):
+        if kwargs["model"] == primary_model:
+            await asyncio.sleep(args.slow if random.random() < args.slow_share else args.fast)
+        else:
+            await asyncio.sleep(args.fallback_latency)
+        return await litellm.acompletion(**kwargs, mock_response="Fake completion from the benchmark provider.")
+
+    redis_consumer.acompletion = fake_acompletion
+
+
+async def run_mode(mode: str, args) -> dict:
+    client = redis_consumer.redis_client
+    client.flushall()
+    hedging._thresholds.clear()
+    redis_consumer._model_semaphores.clear()
+    redis_consumer.HEDGE_FALLBACK_MODELS.clear()
+    if mode == "hedged":
+        redis_consumer.HEDGE_FALLBACK_MODELS[args.model] = args.fallback
+
+    enqueued, finished = {}, {}
+    write_result = redis_consumer.write_result
+
+    def timed_write_result(task_id, result_data):
+        write_result(task_id, result_data)
+        finished[task_id] = time.time()
+
+    redis_consumer.write_result = timed_write_result
+
+    def enqueue(index):
+        task_id = new_task_id()
+        enqueued[task_id] = time.time()
+        client.xadd(TASK_STREAMS[INTERACTIVE_LANE], {
+            "task_type": "ask_question",
+            "task_id": task_id,
+            "model_name": args.model,
+            "enqueued_at": repr(time.time()),
+            # Distinct documents, so questions aren't answered from the result cache
+            "document_content": f"Benchmark document {mode} {index}",
+            "question": "What is this document about?",
+        })
+
+    redis_consumer.ensure_consumer_group()
+    worker = asyncio.create_task(redis_consumer.run_async_worker("bench"))
+    random.seed(args.seed)
+    for index in range(args.warmup):
+        enqueue(f"warmup-{index}")
+        await asyncio.sleep(1 / args.rate)
+    while len(finished) < args.warmup:
+        await asyncio.sleep(0.05)
+    enqueued.clear()
+    finished.clear()
+
+    started = time.perf_counter()
+    for index in range(args.questions):
+        enqueue(index)
+        await asyncio.sleep(1 / args.rate)
+    while len(finished) < args.questions:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    worker.cancel()
+    redis_consumer.write_result = write_result
+
+    results = [decode_result(client.get(result_key(task_id))) for task_id in enqueued]
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "latency_s": percentiles([finished[task_id] - at for task_id, at in enqueued.items()]),
+        "served_by_fallback": sum(1 for result in results if result.get("served_by") == args.fallback),
+        "hedged": sum(result.get("hedged_calls", 0) for result in results),
+        "cost": f"${sum(result['cost_value'] for result in results):.6f}",
+        "hedge_cost": f"${sum(float(result.get('hedge_cost', '$0')[1:]) for result in results):.6f}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=60, help="Questions answered before measuring, to fill the histogram")
+    parser.add_argument("--rate", type=float, default=20, help="Questions queued per second")
+    parser.add_argument("--slow-share", type=float, default=0.03, help="Share of primary requests that stall")
+    parser.add_argument("--fast", type=float, default=0.2, help="Primary latency in seconds")
+    parser.add_argument("--slow", type=float, default=3, help="Primary latency of stalled requests in seconds")
+    parser.add_argument("--fallback-latency", type=float, default=0.3)
+    parser.add_argument("--model", default="gpt-4o", choices=sorted(redis_consumer.MODEL_API_KEYS))
+    parser.add_argument("--fallback", default="deepseek", choices=sorted(redis_consumer.MODEL_API_KEYS))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    install_fakes(args)
+    report = [asyncio.run(run_mode(mode, args)) for mode in ("off", "hedged")]
+    print(json.dumps({"config": vars(args), "modes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
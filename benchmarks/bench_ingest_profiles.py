@@ -0,0 +1,72 @@
+"""
+Compare the conversion cost of the ingestion profiles (fast / standard / full) on one PDF.
+
+Each profile runs in a fresh process, so the reported peak memory belongs to that profile
+alone. Converters are warmed before timing, like the ingest pool does.
+
+Usage:
+    python -m benchmarks.bench_ingest_profiles [path/to/file.pdf] [--pages 20] [--iterations 3]
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from docling.datamodel.base_models import DocumentStream
+
+from backend.converter_pool import INGEST_PROFILES, build_text_pdf, get_converter_pool, profile_pipeline_options
+from backend.stage_timer import peak_rss_mb
+
+
+def bench_profile(profile: str, pdf_bytes: bytes, iterations: int) -> dict:
+    pool = get_converter_pool(profile_pipeline_options(profile))
+    started = time.perf_counter()
+    pool.warm_up()
+    warm_up = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        with pool.acquire() as converter:
+            conv_res = converter.convert(DocumentStream(name="benchmark.pdf", stream=BytesIO(pdf_bytes)))
+        latencies.append(time.perf_counter() - started)
+
+    pages = len(conv_res.document.pages)
+    convert = statistics.median(latencies)
+    return {
+        "profile": profile,
+        "warm_up_s": round(warm_up, 2),
+        "convert_s": round(convert, 3),
+        "seconds_per_page": round(convert / pages, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF to convert (defaults to a generated text PDF)")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the generated PDF")
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as pdf_file:
+            pdf_bytes = pdf_file.read()
+    else:
+        pdf_bytes = build_text_pdf([
+            f"Benchmark page {page}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 30
+            for page in range(1, args.pages + 1)
+        ])
+
+    report = []
+    for profile in INGEST_PROFILES:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            report.append(executor.submit(bench_profile, profile, pdf_bytes, args.iterations).result())
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
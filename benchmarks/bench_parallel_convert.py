@@ -0,0 +1,74 @@
+"""
+Measure conversion throughput (pages/sec) of one large PDF as the number of worker processes
+converting its page ranges goes up. One worker is the single-pass path.
+
+Each worker process warms its converters before timing starts, like the ingest pool does, so
+the numbers show steady-state conversion rather than model loading.
+
+Usage:
+    python -m benchmarks.bench_parallel_convert [path/to/file.pdf] [--pages 200] [--workers 1 2 4 8]
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from backend.converter_pool import build_text_pdf, warm_converter_pools
+from backend.parallel_convert import MIN_PAGES_PER_RANGE, convert_page_range, count_pages, plan_page_ranges
+
+
+def _noop():
+    return None
+
+
+def bench_workers(pdf_bytes: bytes, page_count: int, workers: int) -> dict:
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=warm_converter_pools,
+    ) as executor:
+        wait([executor.submit(_noop) for _ in range(workers)])
+
+        page_ranges = plan_page_ranges(page_count, workers)
+        started = time.perf_counter()
+        documents = list(executor.map(convert_page_range, [pdf_bytes] * len(page_ranges),
+                                      ["benchmark"] * len(page_ranges), page_ranges))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "workers": workers,
+        "page_ranges": len(page_ranges),
+        "pages_converted": sum(len(document.pages) for document in documents),
+        "seconds": round(elapsed, 2),
+        "pages_per_sec": round(page_count / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF to convert (defaults to a generated text PDF)")
+    parser.add_argument("--pages", type=int, default=200, help="Pages of the generated PDF")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as pdf_file:
+            pdf_bytes = pdf_file.read()
+    else:
+        pdf_bytes = build_text_pdf([
+            f"Benchmark page {page}\n" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 30
+            for page in range(1, args.pages + 1)
+        ])
+    page_count = count_pages(pdf_bytes)
+
+    report = {
+        "pages": page_count,
+        "min_pages_per_range": MIN_PAGES_PER_RANGE,
+        "levels": [bench_workers(pdf_bytes, page_count, workers) for workers in args.workers],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure question latency while a burst of bulk summaries is being processed, with every task in
+one lane (first come, first served, as with the single task_stream) against questions on the
+interactive lane.
+
+Each summary is split into several chunk calls; the fake provider answers every call after a fixed
+delay, and the model's concurrency limit is the bottleneck. Redis is fakeredis.
+
+Usage:
+    python -m benchmarks.bench_priority_lanes [--summaries 40] [--questions 50] [--question-rate 5]
+        [--latency 0.2] [--model-concurrency 8]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import fakeredis
+import litellm
+
+from benchmarks.stand_ins import percentiles
+from llm_integration import redis_consumer
+from storage.task_queue import BULK_LANE, INTERACTIVE_LANE, TASK_STREAMS, new_task_id
+
+
+def install_fakes(latency: float, chunk_chars: int):
+    server = fakeredis.FakeServer()
+    redis_consumer.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_consumer.get_async_redis_client = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    # Small chunks so each summary makes several provider calls without huge documents
+    redis_consumer.chunk_chars_for_model = lambda model: chunk_chars
+
+    async def fake_acompletion(**kwargs):
+        await asyncio.sleep(latency)
+        return await litellm.acompletion(**kwargs, mock_response="Fake completion from the benchmark provider.")
+
+    redis_consumer.acompletion = fake_acompletion
+
+
+async def run_mode(mode: str, args) -> dict:
+    client = redis_consumer.redis_client
+    client.flushall()
+    redis_consumer._model_semaphores.clear()
+    redis_consumer.MODEL_CONCURRENCY_LIMITS[args.model] = args.model_concurrency
+
+    enqueued, finished = {}, {}
+    write_result = redis_consumer.write_result
+
+    def timed_write_result(task_id, result_data):
+        write_result(task_id, result_data)
+        finished[task_id] = time.time()
+
+    redis_consumer.write_result = timed_write_result
+
+    def enqueue(task_type: str, lane: str, **fields):
+        task_id = new_task_id()
+        enqueued[task_id] = (task_type, time.time())
+        client.xadd(TASK_STREAMS[lane], {
+            "task_type": task_type,
+            "task_id": task_id,
+            "model_name": args.model,
+            "enqueued_at": repr(time.time()),
+            **fields,
+        })
+
+    redis_consumer.ensure_consumer_group()
+    document = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (args.chunks * args.chunk_chars // 57)
+    for index in range(args.summaries):
+        # Distinct documents, so summaries aren't answered from the result cache
+        enqueue("summarize", BULK_LANE, document_content=f"Document {index}. {document}")
+
+    started = time.perf_counter()
+    worker = asyncio.create_task(redis_consumer.run_async_worker("bench"))
+    question_lane = INTERACTIVE_LANE if mode == "lanes" else BULK_LANE
+    for index in range(args.questions):
+        enqueue("ask_question", question_lane,
+                document_content=f"Question document {index}", question="What is this document about?")
+        await asyncio.sleep(1 / args.question_rate)
+    while len(finished) < args.summaries + args.questions:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    worker.cancel()
+    redis_consumer.write_result = write_result
+
+    def latencies(task_type):
+        return [finished[task_id] - at for task_id, (kind, at) in enqueued.items() if kind == task_type]
+
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "question_latency_s": percentiles(latencies("ask_question")),
+        "summary_latency_s": percentiles(latencies("summarize")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--summaries", type=int, default=40)
+    parser.add_argument("--chunks", type=int, default=4, help="Chunk calls per summary, before the final call")
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--question-rate", type=float, default=5, help="Questions queued per second")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake provider latency in seconds")
+    parser.add_argument("--model-concurrency", type=int, default=8)
+    parser.add_argument("--model", default="gpt-4o", choices=sorted(redis_consumer.MODEL_API_KEYS))
+    args = parser.parse_args()
+
+    install_fakes(args.latency, args.chunk_chars)
+    report = [asyncio.run(run_mode(mode, args)) for mode in ("single_lane", "lanes")]
+    print(json.dumps({"config": vars(args), "modes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
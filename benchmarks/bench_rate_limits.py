@@ -0,0 +1,126 @@
+"""
+Measure how a burst of tasks fares against a provider that enforces a requests-per-minute quota
+and answers 429 beyond it, with two workers sharing the quota.
+
+Modes:
+    no_retry  a 429 fails the task at once (the behaviour before retries)
+    retry     429s are retried with jittered exponential backoff
+    limiter   retries, plus the shared Redis token bucket keeping requests under the quota
+
+The report gives completed and failed (dead-lettered) tasks, the 429s the provider sent, and the
+achieved request rate against the quota. Redis is fakeredis with Lua support.
+
+Usage:
+    python -m benchmarks.bench_rate_limits [--tasks 150] [--rpm 1200] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import fakeredis
+import litellm
+
+from llm_integration import rate_limits, redis_consumer
+from storage.task_queue import INTERACTIVE_LANE, TASK_STREAMS, new_task_id
+
+
+class FakeProvider:
+    """ Answers after a fixed delay, or with a 429 once its own per-minute quota (with a 2 s burst) is used up """
+
+    def __init__(self, rpm: int, latency: float):
+        self.rate = rpm / 60
+        self.capacity = self.rate * 2
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.latency = latency
+        self.accepted = 0
+        self.rejected = 0
+
+    async def acompletion(self, **kwargs):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.level < 1:
+            self.rejected += 1
+            raise litellm.RateLimitError(message="Rate limit reached", llm_provider="openai", model=kwargs["model"])
+        self.level -= 1
+        self.accepted += 1
+        await asyncio.sleep(self.latency)
+        return await litellm.acompletion(**kwargs, mock_response="Fake completion from the benchmark provider.")
+
+
+async def run_mode(mode: str, args) -> dict:
+    server = fakeredis.FakeServer()
+    redis_consumer.redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_consumer.get_async_redis_client = lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    redis_consumer._model_semaphores.clear()
+    redis_consumer.MODEL_CONCURRENCY_LIMITS[args.model] = args.model_concurrency
+    redis_consumer.LLM_MAX_ATTEMPTS = 1 if mode == "no_retry" else args.max_attempts
+    redis_consumer.MODEL_RPM_LIMITS.clear()
+    if mode == "limiter":
+        redis_consumer.MODEL_RPM_LIMITS[args.model] = args.rpm
+    rate_limits._token_bucket = None
+    provider = FakeProvider(args.rpm, args.latency)
+    redis_consumer.acompletion = provider.acompletion
+
+    finished = {}
+    write_result = redis_consumer.write_result
+
+    def timed_write_result(task_id, result_data):
+        write_result(task_id, result_data)
+        finished[task_id] = "failed" if result_data.get("error") else "completed"
+
+    redis_consumer.write_result = timed_write_result
+
+    client = redis_consumer.redis_client
+    redis_consumer.ensure_consumer_group()
+    for index in range(args.tasks):
+        client.xadd(TASK_STREAMS[INTERACTIVE_LANE], {
+            "task_type": "ask_question",
+            "task_id": new_task_id(),
+            "model_name": args.model,
+            "document_content": f"Benchmark document {index}",
+            "question": "What is this document about?",
+        })
+
+    started = time.perf_counter()
+    workers = [asyncio.create_task(redis_consumer.run_async_worker(f"bench-{index}")) for index in range(2)]
+    while len(finished) < args.tasks:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.cancel()
+    redis_consumer.write_result = write_result
+
+    completed = sum(1 for outcome in finished.values() if outcome == "completed")
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "completed": completed,
+        "failed": args.tasks - completed,
+        "provider_429s": provider.rejected,
+        "accepted_per_minute": round(provider.accepted / elapsed * 60, 1),
+        "quota_per_minute": args.rpm,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=150)
+    parser.add_argument("--rpm", type=int, default=1200, help="Provider quota in requests per minute")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake provider latency in seconds")
+    parser.add_argument("--model-concurrency", type=int, default=16)
+    parser.add_argument("--max-attempts", type=int, default=8)
+    parser.add_argument("--model", default="gpt-4o", choices=sorted(redis_consumer.MODEL_API_KEYS))
+    args = parser.parse_args()
+
+    # Short backoff and bucket burst so a run takes seconds; the provider allows a 2 s burst
+    rate_limits.LLM_RETRY_BASE_SECONDS = 0.25
+    rate_limits.RATE_LIMIT_BURST_SECONDS = 1
+    report = [asyncio.run(run_mode(mode, args)) for mode in ("no_retry", "retry", "limiter")]
+    print(json.dumps({"config": vars(args), "modes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare end-to-end answer latency when clients poll /get_result every 5 seconds (the old
+frontend) against long-polling on the worker's completion events.
+
+A fake LLM finishes each task after a log-normally distributed delay, writes the result and
+publishes the completion event exactly like the worker. Redis is fakeredis.
+
+Usage:
+    python -m benchmarks.bench_result_delivery [--tasks 200] [--median-latency 3] [--poll-interval 5]
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import fakeredis
+
+from api.result_events import ResultNotifier, wait_for_result
+from storage.result_store import RESULT_TTL_SECONDS, encode_result, result_key
+from storage.task_queue import TASK_EVENTS_CHANNEL_PREFIX
+
+
+def percentile(values: list, pct: int) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+async def fake_llm(client, task_id: str, latency: float):
+    await asyncio.sleep(latency)
+    result_data = {"result": "fake", "input_tokens": 1, "output_tokens": 1}
+    await client.set(result_key(task_id), encode_result(result_data), ex=RESULT_TTL_SECONDS)
+    await client.publish(f"{TASK_EVENTS_CHANNEL_PREFIX}{task_id}", "done")
+
+
+async def polling_client(client, task_id: str, interval: float):
+    while not await client.get(result_key(task_id)):
+        await asyncio.sleep(interval)
+
+
+async def long_poll_client(client, notifier, task_id: str, wait: float):
+    while not await wait_for_result(client, notifier, task_id, wait):
+        pass
+
+
+async def run_mode(mode: str, latencies: list, poll_interval: float) -> dict:
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    notifier = ResultNotifier(client)
+    await notifier.start()
+    await asyncio.sleep(0.1)  # Let the listener subscribe
+
+    async def one_task(index: int, latency: float):
+        task_id = f"{mode}-{index}"
+        started = time.perf_counter()
+        waiter = (
+            polling_client(client, task_id, poll_interval) if mode == "poll"
+            else long_poll_client(client, notifier, task_id, 25)
+        )
+        await asyncio.gather(fake_llm(client, task_id, latency), waiter)
+        return time.perf_counter() - started
+
+    end_to_end = await asyncio.gather(*(one_task(index, latency) for index, latency in enumerate(latencies)))
+    await notifier.stop()
+
+    overhead = [total - latency for total, latency in zip(end_to_end, latencies)]
+    return {
+        "mode": mode,
+        "p50_s": round(percentile(end_to_end, 50), 3),
+        "p99_s": round(percentile(end_to_end, 99), 3),
+        "delivery_overhead_p50_s": round(percentile(overhead, 50), 3),
+        "delivery_overhead_p99_s": round(percentile(overhead, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--median-latency", type=float, default=3.0, help="Median fake LLM latency in seconds")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    latencies = [args.median_latency * rng.lognormvariate(0, 0.5) for _ in range(args.tasks)]
+    report = [asyncio.run(run_mode(mode, latencies, args.poll_interval)) for mode in ("poll", "long_poll")]
+    print(json.dumps({"tasks": args.tasks, "median_llm_latency_s": args.median_latency, "modes": report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
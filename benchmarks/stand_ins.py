@@ -0,0 +1,92 @@
+"""
+Local stand-ins for the services the stack binds to at import time: a fakeredis server on a
+TCP port, a moto S3 server and a fake LiteLLM provider with configurable latency.
+
+``start_stand_ins`` must run before any project module is imported, because those modules
+create their Redis and S3 clients from the environment at import. The stand-ins listen on
+real sockets, so spawned ingest processes reach them through the same environment.
+"""
+import asyncio
+import logging
+import os
+import random
+import statistics
+import threading
+
+import boto3
+import fakeredis
+from moto.server import ThreadedMotoServer
+
+FAKE_COMPLETION = "Fake completion from the benchmark provider."
+
+
+def start_redis() -> int:
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+    server.daemon_threads = True  # Open client connections must not keep the benchmark from exiting
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def start_s3() -> str:
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # One access log line per S3 request otherwise
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    return f"http://{host}:{port}"
+
+
+def start_stand_ins(bucket: str = "benchmark-bucket") -> dict:
+    """
+    Start Redis and S3 stand-ins and point the stack's environment variables at them.
+
+    Returns:
+        dict: The Redis port, S3 endpoint and bucket name.
+    """
+    redis_port = start_redis()
+    s3_endpoint = start_s3()
+
+    os.environ.update({
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "S3_ENDPOINT_URL": s3_endpoint,
+        "S3_BUCKET_NAME": bucket,
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        # Use litellm's bundled model prices instead of fetching them
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    })
+    os.environ.pop("REDIS_PASSWORD", None)  # The fake server has no AUTH
+
+    boto3.client("s3", endpoint_url=s3_endpoint, region_name="us-east-1").create_bucket(Bucket=bucket)
+    return {"redis_port": redis_port, "s3_endpoint": s3_endpoint, "bucket": bucket}
+
+
+def install_fake_llm(redis_consumer, median_latency: float, sigma: float = 0.3, seed: int = 7):
+    """
+    Replace the worker's LiteLLM calls with litellm's ``mock_response`` after a log-normally
+    distributed delay, so responses, streaming, token usage and cost go through the real code paths.
+    """
+    import litellm  # Imported here, after start_stand_ins has set LITELLM_LOCAL_MODEL_COST_MAP
+
+    rng = random.Random(seed)
+
+    async def fake_acompletion(**kwargs):
+        await asyncio.sleep(median_latency * rng.lognormvariate(0, sigma))
+        return await litellm.acompletion(**kwargs, mock_response=FAKE_COMPLETION)
+
+    redis_consumer.acompletion = fake_acompletion
+
+
+def percentiles(values: list) -> dict:
+    """
+    Summarize latencies in seconds as p50/p95/p99 and max.
+    """
+    if not values:
+        return {}
+    if len(values) == 1:
+        return {"p50": round(values[0], 4), "p95": round(values[0], 4), "p99": round(values[0], 4),
+                "max": round(values[0], 4)}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": round(cuts[49], 4), "p95": round(cuts[94], 4), "p99": round(cuts[98], 4),
+            "max": round(max(values), 4)}
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 import os
 import time
 
@@ -25,6 +26,12 @@ if "answer_text" not in st.session_state:
     st.session_state["answer_text"] = ""
 if "question_input_key" not in st.session_state:
     st.session_state["question_input_key"] = 0 
+if "catalog_cursors" not in st.session_state:
+    st.session_state["catalog_cursors"] = [None]  # Cursor of each catalog page visited; the last is the current page
+if "catalog_pages" not in st.session_state:
+    st.session_state["catalog_pages"] = {}
+if "catalog_prefix" not in st.session_state:
+    st.session_state["catalog_prefix"] = ""
 
 # === Function to reset session state when switching tabs or selecting a new document ===
 def reset_session():
@@ -36,6 +43,76 @@ def reset_session():
     st.session_state["last_active_document"] = None
     st.session_state["question_input_key"] += 1  # Change input key to force UI refresh
 
+# === Functions to browse the document catalog ===
+def reset_catalog_pages():
+    """Go back to the first page when the search changes."""
+    st.session_state["catalog_cursors"] = [None]
+
+def fetch_processed_pdfs(prefix, cursor):
+    """Fetch one page of the document catalog, revalidating the copy from earlier reruns with its ETag."""
+    cached = st.session_state["catalog_pages"].get((prefix, cursor))
+    headers = {"If-None-Match": cached["etag"]} if cached and cached["etag"] else {}
+    response = requests.get(
+        f"{BASE_URL}/select_pdfcontent/",
+        params={"prefix": prefix, "cursor": cursor, "limit": 50},
+        headers=headers
+    )
+    if response.status_code == 304:
+        return cached["data"]
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    st.session_state["catalog_pages"][(prefix, cursor)] = {"etag": response.headers.get("ETag"), "data": data}
+    return data
+
+# === Functions to fetch LLM results ===
+STREAM_RESULT_SECONDS = 150  # Keep-alives keep the read timeout from firing, so the stream gets its own deadline
+
+def stream_result(task_id, placeholder):
+    """Render the answer token by token as the worker generates it; returns the final result or None."""
+    text = ""
+    event = None
+    deadline = time.monotonic() + STREAM_RESULT_SECONDS
+    try:
+        with requests.get(f"{BASE_URL}/results/{task_id}/stream", stream=True, timeout=(5, 60)) as response:
+            if response.status_code != 200:
+                return None
+            for line in response.iter_lines(decode_unicode=True):
+                if time.monotonic() > deadline:
+                    return None
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[len("data:"):].strip())
+                    if event == "token":
+                        text += data["delta"]
+                        placeholder.markdown(text)
+                    elif event == "reset":
+                        # The task was restarted; its answer is streamed again from the start
+                        text = ""
+                        placeholder.markdown(text)
+                    elif event == "result":
+                        return data
+                    elif event == "error":
+                        return None
+                elif not line:
+                    event = None
+    except requests.RequestException:
+        pass
+    return None
+
+def wait_for_result(task_id):
+    """Long-poll: the API answers as soon as the worker publishes the result."""
+    for _ in range(6):
+        result_response = requests.get(
+            f"{BASE_URL}/get_result/{task_id}", params={"wait": 25}, timeout=40
+        )
+        if result_response.status_code == 200:
+            return result_response.json()
+        elif result_response.status_code != 404:
+            time.sleep(5)  # Back off on errors; a 404 just means the wait timed out
+    return None
+
 # === File Selection (Upload or Select Processed PDF) ===
 st.markdown("### Upload a New PDF or Select a Processed PDF")
 
@@ -54,6 +131,16 @@ selected_document_url = None
 if selected_tab == "New PDF":
     st.markdown("#### Upload New PDF")
     uploaded_file = st.file_uploader("Choose a PDF file", type=["pdf"], key="pdf_upload")
+    ingest_profile = st.selectbox(
+        "Processing profile:",
+        ["full", "standard", "fast"],
+        format_func=lambda profile: {
+            "full": "Full (text, figures and tables)",
+            "standard": "Standard (text and figures)",
+            "fast": "Fast (text only)"
+        }[profile],
+        key="ingest_profile"
+    )
 
     if uploaded_file and st.button("Process PDF"):
         st.write("Processing your PDF...")
@@ -62,12 +149,33 @@ if selected_tab == "New PDF":
         reset_session()
 
         files = {"file": uploaded_file}
-        response = requests.post(f"{BASE_URL}/upload_pdf/", files=files)
+        response = requests.post(f"{BASE_URL}/upload_pdf/", files=files, data={"profile": ingest_profile})
 
         if response.status_code == 200:
-            data = response.json()
-            st.success("PDF processed successfully!")
-            st.session_state["active_document_url"] = data['markdown_s3_url']
+            job_id = response.json().get("job_id")
+            ingest_status = st.empty()
+
+            # Conversion runs in the background; poll the ingest job until it finishes
+            job = {}
+            for _ in range(300):
+                status_response = requests.get(f"{BASE_URL}/ingest_status/{job_id}")
+                if status_response.status_code == 200:
+                    job = status_response.json()
+                    if job.get("status") in ("done", "failed"):
+                        break
+                    ingest_status.markdown(f"**Status:** {job.get('status', 'queued')}")
+                time.sleep(2)
+            ingest_status.empty()
+
+            if job.get("status") == "done":
+                st.success("PDF processed successfully!")
+                st.session_state["active_document_url"] = job["result"]["markdown_s3_url"]
+                stats = job["result"].get("stats")
+                if stats:
+                    with st.expander("Processing Time & Memory"):
+                        st.json(stats)
+            else:
+                st.error(f"Failed to process PDF! Error: {job.get('error', 'Timed out waiting for processing.')}")
         else:
             st.error(f"Failed to process PDF! Error: {response.text}")
 
@@ -75,9 +183,10 @@ if selected_tab == "New PDF":
 elif selected_tab == "Processed PDF":
     st.markdown("#### Select a Previously Processed PDF")
 
-    response = requests.get(f"{BASE_URL}/select_pdfcontent/")
-    if response.status_code == 200:
-        processed_pdfs = response.json().get("processed_pdfs", {})
+    st.text_input("Search by name:", key="catalog_prefix", on_change=reset_catalog_pages)
+    catalog_page = fetch_processed_pdfs(st.session_state["catalog_prefix"], st.session_state["catalog_cursors"][-1])
+    if catalog_page is not None:
+        processed_pdfs = catalog_page.get("processed_pdfs", {})
         markdown_files = {
             os.path.basename(pdf_info["markdown"]): pdf_info["markdown"]
             for pdf_info in processed_pdfs.values()
@@ -96,6 +205,21 @@ elif selected_tab == "Processed PDF":
             st.session_state["active_document_url"] = markdown_files[selected_name]
             st.write(f"Selected Markdown file: {selected_name}")
 
+        # Page through the catalog
+        previous_column, next_column = st.columns(2)
+        previous_column.button(
+            "Previous page",
+            disabled=len(st.session_state["catalog_cursors"]) == 1,
+            on_click=lambda: st.session_state["catalog_cursors"].pop()
+        )
+        next_column.button(
+            "Next page",
+            disabled=not catalog_page.get("next_cursor"),
+            on_click=lambda: st.session_state["catalog_cursors"].append(catalog_page["next_cursor"])
+        )
+    else:
+        st.error("Failed to load the processed PDFs.")
+
 # === Choose LLM Model (Triggers Reset Like Document Selection) ===
 st.markdown("### Choose an LLM Model")
 
@@ -164,19 +288,23 @@ if st.button("Summarize Document"):
             output_tokens = None
             cost = None
 
-            for _ in range(30):
-                result_response = requests.get(f"{BASE_URL}/get_result/{task_id}")
-                if result_response.status_code == 200:
-                    result_data = result_response.json()
-                    summary = result_data.get("result", "No summary available.")
-                    input_tokens = result_data.get("input_tokens", "N/A")
-                    output_tokens = result_data.get("output_tokens", "N/A")
-                    cost = result_data.get("cost", "Cost unavailable.")
-                    break
-                else:
-                    time.sleep(5)
+            # Show the summary as it is generated, falling back to long-polling
+            summary_placeholder = st.empty()
+            result_data = stream_result(task_id, summary_placeholder) or wait_for_result(task_id)
+            summary_placeholder.empty()
+            if not result_data:
+                st.error("Timed out waiting for the summary; please try again.")
+            elif result_data.get("error"):
+                st.error(f"The summary could not be generated: {result_data['error']}")
+            if result_data:
+                summary = result_data.get("result", "No summary available.")
+                input_tokens = result_data.get("input_tokens", "N/A")
+                output_tokens = result_data.get("output_tokens", "N/A")
+                cost = result_data.get("cost", "Cost unavailable.")
 
             st.session_state["summary_text"] = summary
+            st.session_state["summary_served_by"] = result_data.get("served_by") if result_data else None
+            st.session_state["summary_hedge_cost"] = result_data.get("hedge_cost") if result_data else None
             st.session_state["input_tokens"] = input_tokens
             st.session_state["output_tokens"] = output_tokens
             st.session_state["summary_cost"] = cost
@@ -194,6 +322,13 @@ if st.button("Summarize Document"):
                 st.markdown(f"**Total Cost:** {st.session_state['summary_cost']}")
                 st.markdown(f"**Input Tokens (Prompt):** {st.session_state['input_tokens']}")
                 st.markdown(f"**Output Tokens (Completion):** {st.session_state['output_tokens']}")
+                if st.session_state["summary_served_by"]:
+                    st.markdown(f"**Served By:** {st.session_state['summary_served_by']}")
+                if st.session_state["summary_hedge_cost"]:
+                    st.markdown(f"**Hedge Cost (included in total):** {st.session_state['summary_hedge_cost']}")
+        elif response.status_code == 429:
+            st.warning(f"The service is busy summarizing other documents. Please try again in {response.headers.get('Retry-After', 'a few')} seconds.")
+            summary_status.empty()
         else:
             st.error(f"Failed to generate summary: {response.text}")
             summary_status.empty()
@@ -228,19 +363,23 @@ if st.button("Get Answer"):
             output_tokens = None
             cost = None
 
-            for _ in range(30):
-                result_response = requests.get(f"{BASE_URL}/get_result/{task_id}")
-                if result_response.status_code == 200:
-                    result_data = result_response.json()
-                    answer_result = result_data.get("result", "No answer found.")
-                    input_tokens = result_data.get("input_tokens", "N/A")
-                    output_tokens = result_data.get("output_tokens", "N/A")
-                    cost = result_data.get("cost", "Cost unavailable.")
-                    break  
-                else:
-                    time.sleep(5)
+            # Show the answer as it is generated, falling back to long-polling
+            answer_placeholder = st.empty()
+            result_data = stream_result(task_id, answer_placeholder) or wait_for_result(task_id)
+            answer_placeholder.empty()
+            if not result_data:
+                st.error("Timed out waiting for the answer; please try again.")
+            elif result_data.get("error"):
+                st.error(f"The question could not be answered: {result_data['error']}")
+            if result_data:
+                answer_result = result_data.get("result", "No answer found.")
+                input_tokens = result_data.get("input_tokens", "N/A")
+                output_tokens = result_data.get("output_tokens", "N/A")
+                cost = result_data.get("cost", "Cost unavailable.")
 
             st.session_state["answer_text"] = answer_result
+            st.session_state["qa_served_by"] = result_data.get("served_by") if result_data else None
+            st.session_state["qa_hedge_cost"] = result_data.get("hedge_cost") if result_data else None
             st.session_state["qa_input_tokens"] = input_tokens
             st.session_state["qa_output_tokens"] = output_tokens
             st.session_state["qa_cost"] = cost
@@ -252,6 +391,12 @@ if st.button("Get Answer"):
                 st.markdown(f"**Total Cost:** {st.session_state['qa_cost']}")
                 st.markdown(f"**Input Tokens (Prompt):** {st.session_state['qa_input_tokens']}")
                 st.markdown(f"**Output Tokens (Completion):** {st.session_state['qa_output_tokens']}")
+                if st.session_state["qa_served_by"]:
+                    st.markdown(f"**Served By:** {st.session_state['qa_served_by']}")
+                if st.session_state["qa_hedge_cost"]:
+                    st.markdown(f"**Hedge Cost (included in total):** {st.session_state['qa_hedge_cost']}")
 
+        elif response.status_code == 429:
+            st.warning(f"The service is busy answering other questions. Please try again in {response.headers.get('Retry-After', 'a few')} seconds.")
         else:
             st.error(f"Failed to get answer: {response.text}")
\ No newline at end of file
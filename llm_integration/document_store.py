@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from backend.markdown_compaction import COMPACTION_VERSION, compact_key_for_document, compact_markdown
+from backend.retrieval_index import index_key_for_document
+from storage.s3_utils import S3_BUCKET_NAME, S3_BYTES, download_text, s3_client
+
+# Markdown bodies kept in process memory, bounded by total characters
+DOCUMENT_MEMORY_CACHE_CHARS = int(os.getenv("DOCUMENT_MEMORY_CACHE_CHARS", 64 * 1024 * 1024))
+# On-disk cache shared by the worker processes of one container
+DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR", "/tmp/document_cache")
+DOCUMENT_DISK_CACHE_BYTES = int(os.getenv("DOCUMENT_DISK_CACHE_MB", 1024)) * 1024 * 1024
+# Parsed retrieval indexes kept in memory
+INDEX_MEMORY_CACHE_ENTRIES = int(os.getenv("INDEX_MEMORY_CACHE_ENTRIES", 64))
+# Documents without an index are re-checked after this long
+MISSING_INDEX_RETRY_SECONDS = 300
+
+_memory_cache = OrderedDict()
+_memory_cache_chars = 0
+_index_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_id(document_key, document_hash):
+    # Content-addressed when a hash is known, so an overwritten object is never served stale
+    return hashlib.sha256(f"{document_key}:{document_hash or ''}".encode("utf-8")).hexdigest()
+
+
+def _remember(cache_id, content):
+    global _memory_cache_chars
+    with _lock:
+        if cache_id in _memory_cache:
+            _memory_cache.move_to_end(cache_id)
+            return
+        _memory_cache[cache_id] = content
+        _memory_cache_chars += len(content)
+        while _memory_cache_chars > DOCUMENT_MEMORY_CACHE_CHARS and len(_memory_cache) > 1:
+            _, evicted = _memory_cache.popitem(last=False)
+            _memory_cache_chars -= len(evicted)
+
+
+def _recall(cache_id):
+    with _lock:
+        content = _memory_cache.get(cache_id)
+        if content is not None:
+            _memory_cache.move_to_end(cache_id)
+        return content
+
+
+def _read_disk(cache_id):
+    path = os.path.join(DOCUMENT_CACHE_DIR, f"{cache_id}.md")
+    try:
+        with open(path, "r", encoding="utf-8") as cached_file:
+            content = cached_file.read()
+        os.utime(path)  # Mark as recently used for eviction
+        return content
+    except FileNotFoundError:
+        return None
+
+
+def _write_disk(cache_id, content):
+    os.makedirs(DOCUMENT_CACHE_DIR, exist_ok=True)
+    path = os.path.join(DOCUMENT_CACHE_DIR, f"{cache_id}.md")
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as cached_file:
+        cached_file.write(content)
+    os.replace(temp_path, path)  # Atomic, so concurrent readers never see a partial file
+
+    entries = [entry for entry in os.scandir(DOCUMENT_CACHE_DIR) if entry.name.endswith(".md")]
+    total_bytes = sum(entry.stat().st_size for entry in entries)
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        if total_bytes <= DOCUMENT_DISK_CACHE_BYTES:
+            break
+        try:
+            total_bytes -= entry.stat().st_size
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _load_cached(cache_id, document_key, fetch):
+    # From the memory cache, the disk cache or fetch(), in that order
+    content = _recall(cache_id)
+    if content is not None:
+        return content
+
+    content = _read_disk(cache_id)
+    if content is None:
+        content = fetch()
+        try:
+            _write_disk(cache_id, content)
+        except OSError as e:
+            print(f"Could not cache document {document_key} on disk: {e}")
+
+    _remember(cache_id, content)
+    return content
+
+
+def _download_compact(document_key, document_hash):
+    # The variant stored at ingest, if it was compacted from this markdown by the current code
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=compact_key_for_document(document_key))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    metadata = response.get("Metadata", {})
+    if metadata.get("compaction-version") != COMPACTION_VERSION:
+        return None
+    if document_hash and metadata.get("source-sha256") != document_hash:
+        return None
+    body = response["Body"].read()
+    S3_BYTES.labels("download", "markdown").inc(len(body))
+    return body.decode("utf-8")
+
+
+def load_compact_document(document_key, document_hash=None):
+    """
+    Returns the compact variant of a markdown body, which is what models are sent: the one stored at ingest,
+    or, for documents ingested before compaction (or by an older version of it), the markdown compacted here
+    """
+    def fetch():
+        content = _download_compact(document_key, document_hash)
+        if content is None:
+            # Only the compact variant is cached; the full markdown isn't needed again
+            content = compact_markdown(download_text(document_key))
+        return content
+
+    cache_id = _cache_id(compact_key_for_document(document_key), f"{document_hash or ''}:{COMPACTION_VERSION}")
+    return _load_cached(cache_id, document_key, fetch)
+
+
+def load_index(document_key, document_hash=None):
+    """ Returns the retrieval index built at ingest for a document, or None if it has none (or a stale one) """
+    cache_id = _cache_id(document_key, document_hash)
+    with _lock:
+        cached = _index_cache.get(cache_id)
+        if cached is not None:
+            index, loaded_at = cached
+            if index is not None or time.time() - loaded_at < MISSING_INDEX_RETRY_SECONDS:
+                _index_cache.move_to_end(cache_id)
+                return index
+
+    try:
+        index = json.loads(download_text(index_key_for_document(document_key)))
+    except s3_client.exceptions.NoSuchKey:
+        index = None
+    if index is not None and document_hash and index.get("document_hash") != document_hash:
+        # Built from a different version of the markdown
+        index = None
+
+    with _lock:
+        _index_cache[cache_id] = (index, time.time())
+        _index_cache.move_to_end(cache_id)
+        while len(_index_cache) > INDEX_MEMORY_CACHE_ENTRIES:
+            _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,104 @@
+import os
+import time
+
+# A hedged request is also sent to the fallback model once the primary hasn't answered within this
+# percentile of its recent latency, so roughly (100 - HEDGE_PERCENTILE)% of requests are duplicated
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", 95))
+# Requests aren't hedged until the primary has this many recent latency samples
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))
+# Latency samples are counted per window; thresholds are computed over the last HEDGE_WINDOWS windows
+LATENCY_KEY_PREFIX = "llm_latency:"
+HEDGE_WINDOW_SECONDS = int(os.getenv("HEDGE_WINDOW_SECONDS", 60))
+HEDGE_WINDOWS = int(os.getenv("HEDGE_WINDOWS", 10))
+# How long a worker reuses a computed threshold before reading the histogram from Redis again
+HEDGE_REFRESH_SECONDS = float(os.getenv("HEDGE_REFRESH_SECONDS", 10))
+# How long "too few samples" is reused, kept short so hedging starts soon after a cold start
+HEDGE_COLD_REFRESH_SECONDS = float(os.getenv("HEDGE_COLD_REFRESH_SECONDS", 1))
+
+# Upper bounds of the latency buckets: 50 ms growing by 25% per bucket up to 10 minutes, so a
+# percentile read from its bucket's upper bound is at most 25% above the true value
+LATENCY_BUCKETS = [round(0.05 * 1.25 ** index, 4) for index in range(43)]
+
+# (model, kind) -> (expires_at, seconds or None)
+_thresholds = {}
+
+
+def _window_key(model_name: str, kind: str, window: int) -> str:
+    return f"{LATENCY_KEY_PREFIX}{model_name}:{kind}:{window}"
+
+
+def record_latency(redis_client, model_name: str, kind: str, seconds: float):
+    """
+    Count one provider latency in the model's histogram, shared by every worker through Redis.
+
+    Args:
+        redis_client: A synchronous Redis client.
+        model_name (str): The model that was called.
+        kind (str): "first_token" for streamed requests, "response" for the others.
+        seconds (float): The latency.
+    """
+    bucket = next((bound for bound in LATENCY_BUCKETS if seconds <= bound), LATENCY_BUCKETS[-1])
+    key = _window_key(model_name, kind, int(time.time() // HEDGE_WINDOW_SECONDS))
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hincrby(key, str(bucket), 1)
+    pipe.expire(key, HEDGE_WINDOW_SECONDS * (HEDGE_WINDOWS + 1))
+    pipe.execute()
+
+
+def latency_percentile(redis_client, model_name: str, kind: str, percentile: float):
+    """
+    Estimate a percentile of the model's recent latency from its histogram.
+
+    The estimate is the upper bound of the bucket the percentile falls in, never below the true
+    value, so no more than (100 - percentile)% of requests take longer.
+
+    Args:
+        redis_client: A synchronous Redis client.
+        model_name (str): The model.
+        kind (str): "first_token" or "response".
+        percentile (float): The percentile, from 0 to 100.
+
+    Returns:
+        float: The latency in seconds, or None with fewer than HEDGE_MIN_SAMPLES samples.
+    """
+    current = int(time.time() // HEDGE_WINDOW_SECONDS)
+    pipe = redis_client.pipeline(transaction=False)
+    for window in range(current - HEDGE_WINDOWS + 1, current + 1):
+        pipe.hgetall(_window_key(model_name, kind, window))
+    counts = {}
+    for histogram in pipe.execute():
+        for bucket, count in histogram.items():
+            counts[float(bucket)] = counts.get(float(bucket), 0) + int(count)
+
+    total = sum(counts.values())
+    if total < max(1, HEDGE_MIN_SAMPLES):
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for bound in sorted(counts):
+        seen += counts[bound]
+        if seen >= rank:
+            return bound
+    return max(counts)
+
+
+def hedge_delay(redis_client, model_name: str, kind: str):
+    """
+    Pick how long to wait for the model before hedging a request to its fallback.
+
+    Args:
+        redis_client: A synchronous Redis client.
+        model_name (str): The primary model.
+        kind (str): "first_token" or "response".
+
+    Returns:
+        float: HEDGE_PERCENTILE of the model's recent latency in seconds, or None while too few
+        samples have been recorded to hedge.
+    """
+    cached = _thresholds.get((model_name, kind))
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
+    delay = latency_percentile(redis_client, model_name, kind, HEDGE_PERCENTILE)
+    refresh = HEDGE_REFRESH_SECONDS if delay is not None else min(HEDGE_REFRESH_SECONDS, HEDGE_COLD_REFRESH_SECONDS)
+    _thresholds[(model_name, kind)] = (time.monotonic() + refresh, delay)
+    return delay
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import random
+
+import litellm
+
+RATE_LIMIT_KEY_PREFIX = "rate_limit:"
+# Bucket size in seconds of quota: how much of a minute's quota may go out in one burst
+RATE_LIMIT_BURST_SECONDS = float(os.getenv("RATE_LIMIT_BURST_SECONDS", 10))
+# Attempts per provider call, including the first, before the task is given up on
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 5))
+# Exponential backoff between attempts: up to BASE * 2^(attempt - 1) seconds, at most MAX, with full jitter
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 1))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", 30))
+
+# Provider errors worth retrying: quota, timeouts, connection failures and 5xx responses
+TRANSIENT_ERRORS = (
+    litellm.RateLimitError,
+    litellm.APIConnectionError,  # Includes litellm.Timeout
+    litellm.ServiceUnavailableError,
+    litellm.InternalServerError,
+    asyncio.TimeoutError,
+)
+
+# Takes a cost from one or more token buckets at once, all or nothing. Each bucket is a hash of
+# its level and last update, refilled continuously from the elapsed time. Returns 0 when the cost
+# was taken, otherwise the milliseconds until every bucket would hold enough. With FORCE set the
+# cost is always applied, so the level may go negative (or up, for a refund), and 0 is returned.
+# KEYS: bucket keys. ARGV: FORCE, then capacity, refill per ms and cost for each bucket.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local force = ARGV[1] == '1'
+local levels = {}
+local wait_ms = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[3 * i - 1])
+    local refill_per_ms = tonumber(ARGV[3 * i])
+    local cost = math.min(tonumber(ARGV[3 * i + 1]), capacity)
+    local bucket = redis.call('HMGET', key, 'level', 'updated_ms')
+    local level = tonumber(bucket[1]) or capacity
+    local updated_ms = tonumber(bucket[2]) or now_ms
+    level = math.min(capacity, level + math.max(0, now_ms - updated_ms) * refill_per_ms)
+    levels[i] = level - cost
+    if not force and level < cost then
+        wait_ms = math.max(wait_ms, math.ceil((cost - level) / refill_per_ms))
+    end
+end
+if wait_ms > 0 then
+    return wait_ms
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[3 * i - 1])
+    local refill_per_ms = tonumber(ARGV[3 * i])
+    redis.call('HSET', key, 'level', tostring(levels[i]), 'updated_ms', now_ms)
+    -- A bucket left alone refills completely; it can then be dropped and recreated full
+    redis.call('PEXPIRE', key, math.ceil(capacity / refill_per_ms) + 1000)
+end
+return 0
+"""
+
+_token_bucket = None
+
+
+def _bucket_args(limits: dict, costs: dict) -> tuple:
+    keys, args = [], []
+    for name, per_minute in limits.items():
+        keys.append(name)
+        capacity = max(1.0, per_minute * RATE_LIMIT_BURST_SECONDS / 60)
+        args += [capacity, per_minute / 60000, costs[name]]
+    return keys, args
+
+
+def take_quota(redis_client, model_name: str, limits: dict, costs: dict, force: bool = False) -> float:
+    """
+    Take a request's cost from a model's rate-limit buckets, shared by every worker through Redis.
+
+    Args:
+        redis_client: A synchronous Redis client.
+        model_name (str): The model the request goes to.
+        limits (dict): Per-minute quota per bucket name, e.g. {"requests": 500, "tokens": 30000}.
+        costs (dict): Cost per bucket name; negative costs give quota back.
+        force (bool): Apply the costs even if the buckets don't hold enough, e.g. to settle the
+            difference between estimated and actual token usage.
+
+    Returns:
+        float: 0 if the cost was taken, otherwise the seconds to wait before trying again.
+    """
+    global _token_bucket
+    if _token_bucket is None:
+        _token_bucket = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+    keys, args = _bucket_args(limits, costs)
+    wait_ms = _token_bucket(
+        keys=[f"{RATE_LIMIT_KEY_PREFIX}{model_name}:{key}" for key in keys],
+        args=["1" if force else "0"] + args,
+        client=redis_client,
+    )
+    return wait_ms / 1000
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Tell whether a failed provider call may succeed if tried again.
+
+    Args:
+        error (Exception): The error the call raised.
+
+    Returns:
+        bool: True for rate limits, timeouts, connection errors and server errors.
+    """
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def retry_delay(attempt: int, error: Exception = None) -> float:
+    """
+    Pick how long to wait before retrying a failed provider call.
+
+    Args:
+        attempt (int): The number of the attempt that failed, from 1.
+        error (Exception): The error it raised; a Retry-After header in its response is honored.
+
+    Returns:
+        float: Seconds to wait: the provider's Retry-After plus a little jitter if it sent one,
+        otherwise exponential backoff with full jitter.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "litellm_response_headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        retry_after = None
+    if retry_after is not None:
+        return min(LLM_RETRY_MAX_SECONDS, retry_after) + random.uniform(0, LLM_RETRY_BASE_SECONDS)
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
@@ -1,13 +1,44 @@
 import redis
-from litellm import completion, completion_cost
+from litellm import acompletion, completion_cost, cost_per_token, stream_chunk_builder, token_counter
 from dotenv import load_dotenv
+import asyncio
+import multiprocessing
 import os
-from flask import Flask
+import random
+import socket
+from flask import Flask, Response, jsonify
+from prometheus_client import Counter, Histogram
 import threading
 import time
 
 import redis.exceptions
 
+from backend.markdown_compaction import compact_markdown
+from backend.retrieval_index import top_chunks
+from llm_integration.document_store import load_compact_document, load_index
+from llm_integration.hedging import hedge_delay, record_latency
+from llm_integration.rate_limits import LLM_MAX_ATTEMPTS, is_transient, retry_delay, take_quota
+from llm_integration.result_cache import cache_key, content_hash, get_cache_stats, get_cached_result, store_cached_result
+from llm_integration.scheduling import LaneScheduler, PrioritySemaphore
+from llm_integration.summarizer import chunk_chars_for_model, summarize_document
+from storage.metrics_utils import LATENCY_BUCKETS, StreamBacklogCollector, build_metrics_registry, render_metrics
+from storage.redis_utils import get_async_redis_client, get_redis_client
+from storage.result_store import RESULT_TTL_SECONDS, encode_result, result_key
+from storage.task_queue import (
+    BULK_LANE,
+    CONSUMER_GROUP,
+    DEAD_LETTER_MAXLEN,
+    DEAD_LETTER_STREAM,
+    LANE_WEIGHTS,
+    LANES_BY_PRIORITY,
+    TASK_EVENTS_CHANNEL_PREFIX,
+    TASK_STREAMS,
+    TASK_TOKENS_PREFIX,
+    create_consumer_groups,
+    lane_priority,
+)
+from storage.tracing import Span, Trace, new_trace_id, store_trace
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -15,16 +46,20 @@ app = Flask(__name__)
 @app.route("/")
 def health_check():
     return "LLM Consumer Running", 200
+
+@app.route("/cache_stats")
+def cache_stats():
+    return jsonify(get_cache_stats(redis_client)), 200
+
+@app.route("/metrics")
+def metrics():
+    """ Prometheus metrics of all worker processes in this container, plus the task lanes' backlog """
+    body, content_type = render_metrics(metrics_registry)
+    return Response(body, mimetype=content_type)
  
 def start_flask_server():
     """ Starts a dummy Flask server to keep Cloud Run alive """
     app.run(host="0.0.0.0", port=8080)
- 
-threading.Thread(target=start_flask_server).start()
-
-REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
 
 MODEL_API_KEYS = {
     "gpt-4o": {"model": "gpt-4o", "api_key": os.getenv("OPENAI_API_KEY")},  
@@ -34,109 +69,895 @@ MODEL_API_KEYS = {
     "grok": {"model": "xai/grok-2-1212", "api_key": os.getenv("GROK_API_KEY")},  
 }
 
+def parse_model_settings(env_name, cast=int):
+    """ Parses per-model overrides such as "gpt-4o=32,claude=8" from an environment variable """
+    settings = {}
+    for item in os.getenv(env_name, "").split(","):
+        if "=" in item:
+            model_name, value = item.split("=", 1)
+            settings[model_name.strip()] = cast(value.strip())
+    return settings
+
+# Maximum in-flight provider requests per model, shared by all tasks in one worker process
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", 8))
+MODEL_CONCURRENCY_LIMITS = {model_name: DEFAULT_MODEL_CONCURRENCY for model_name in MODEL_API_KEYS}
+MODEL_CONCURRENCY_LIMITS.update(parse_model_settings("MODEL_CONCURRENCY_OVERRIDES"))
+
+# Provider quotas per model, e.g. MODEL_RPM_LIMITS="gpt-4o=500" and MODEL_TPM_LIMITS="gpt-4o=30000",
+# enforced across all workers through token buckets in Redis; models without one aren't limited
+MODEL_RPM_LIMITS = parse_model_settings("MODEL_RPM_LIMITS")
+MODEL_TPM_LIMITS = parse_model_settings("MODEL_TPM_LIMITS")
+# Completion tokens assumed for a request until its actual usage is known
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("EXPECTED_OUTPUT_TOKENS", 500))
+
+# Opt-in hedging: fallback model per primary model, e.g. HEDGE_FALLBACK_MODELS="gpt-4o=claude". A request the primary
+# hasn't answered within HEDGE_PERCENTILE (llm_integration.hedging) of its recent latency is sent to the fallback too;
+# the first answer wins and the other request is cancelled
+HEDGE_FALLBACK_MODELS = {
+    primary: fallback
+    for primary, fallback in parse_model_settings("HEDGE_FALLBACK_MODELS", str).items()
+    if primary in MODEL_API_KEYS and fallback in MODEL_API_KEYS and fallback != primary
+}
+
 # Connect to Redis
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT,password=REDIS_PASSWORD, decode_responses=True)
+redis_client = get_redis_client()
+
+# Lane of each task stream; tasks are read from the streams in storage.task_queue
+STREAM_LANES = {stream: lane for lane, stream in TASK_STREAMS.items()}
+# The bulk lane's stream is the one all tasks were queued on before consumer groups were introduced;
+# its entries from back then are acknowledged without being run again
+LEGACY_TASK_STREAM = TASK_STREAMS[BULK_LANE]
+# Per-task streams of generated token deltas (TASK_TOKENS_PREFIX) are relayed to clients by the API
+TASK_TOKENS_TTL_SECONDS = 600
+# Deltas are batched into one stream entry until this many characters or seconds have accumulated
+TOKEN_FLUSH_CHARS = 32
+TOKEN_FLUSH_SECONDS = 0.05
+
+# Unique per worker process; pending tasks of a dead consumer are reclaimed by the others
+CONSUMER_NAME = os.getenv("CONSUMER_NAME", f"{socket.gethostname()}-{os.getpid()}")
+# Number of consumer processes started by this container
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 1))
+# Tasks delivered but not acknowledged for this long are taken over from their consumer
+CLAIM_IDLE_MS = int(os.getenv("CLAIM_IDLE_MS", 5 * 60 * 1000))
+CLAIM_INTERVAL_SECONDS = int(os.getenv("CLAIM_INTERVAL_SECONDS", 30))
+# Stale entries taken over per XAUTOCLAIM call
+CLAIM_BATCH_SIZE = 10
+# A running task re-claims its own entry this often, so a long summary isn't taken over while it is still running
+TASK_HEARTBEAT_SECONDS = float(os.getenv("TASK_HEARTBEAT_SECONDS", CLAIM_IDLE_MS / 3000))
+# A task taken over after this many deliveries (its workers kept dying mid-task) is dead-lettered instead
+TASK_MAX_DELIVERIES = int(os.getenv("TASK_MAX_DELIVERIES", 3))
+# Stream entries older than this are trimmed (MINID) so Redis memory stays flat
+TASK_STREAM_RETENTION_MS = int(os.getenv("TASK_STREAM_RETENTION_MS", 24 * 60 * 60 * 1000))
+# "sync" handles one task at a time; "async" keeps up to ASYNC_MAX_IN_FLIGHT tasks running concurrently
+WORKER_MODE = os.getenv("WORKER_MODE", "sync")
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", 64))
+# In-flight slots of an async worker that only interactive tasks may take, so a burst of bulk
+# tasks can't leave none free for the next question
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", 8))
+# Number of retrieved chunks sent to the model with a question
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 6))
+
+# Served on /metrics together with the backlog of each task lane and the dead-letter stream's length
+metrics_registry = build_metrics_registry(
+    [StreamBacklogCollector(redis_client, stream) for stream in [*TASK_STREAMS.values(), DEAD_LETTER_STREAM]]
+)
+TASK_QUEUE_WAIT_SECONDS = Histogram(
+    "task_queue_wait_seconds", "Time from a task being queued to a worker starting it", ["task_type"],
+    buckets=LATENCY_BUCKETS,
+)
+TASK_SECONDS = Histogram(
+    "task_seconds", "Time to process one task, from start to stored result", ["task_type"], buckets=LATENCY_BUCKETS
+)
+TASKS = Counter(
+    "tasks", "Tasks handled by the worker, by outcome (success, cached, invalid or error)", ["task_type", "outcome"]
+)
+LLM_RETRIES = Counter("llm_retries", "Provider calls retried after a transient error", ["model", "error"])
+LLM_HEDGES = Counter(
+    "llm_hedges", "Requests also sent to the fallback model, by which of the two answered first", ["model", "winner"]
+)
+LLM_QUOTA_WAIT_SECONDS = Histogram(
+    "llm_quota_wait_seconds", "Time waiting for the model's shared rate-limit buckets to cover a request", ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Duration of one provider request, excluding the wait for a concurrency slot", ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_SLOT_WAIT_SECONDS = Histogram(
+    "llm_slot_wait_seconds", "Time waiting for a free slot under the model's concurrency limit", ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Time from sending a streamed request to its first token", ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("llm_tokens", "Tokens billed by providers", ["model", "direction"])
+LLM_COST_DOLLARS = Counter("llm_cost_dollars", "Provider cost in US dollars", ["model"])
+
+_model_semaphores = {}
+_event_loop = None
+
+def get_model_semaphore(model_name):
+    """ Returns the semaphore capping concurrent requests to one model; interactive requests get free slots first """
+    semaphore = _model_semaphores.get(model_name)
+    if semaphore is None:
+        semaphore = PrioritySemaphore(MODEL_CONCURRENCY_LIMITS.get(model_name, DEFAULT_MODEL_CONCURRENCY))
+        _model_semaphores[model_name] = semaphore
+    return semaphore
+
+class StreamInterruptedError(Exception):
+    """ A streamed response failed after some of its tokens were relayed; retrying would send them twice """
+
+async def stream_completion(model_name, api_details, messages, task_id, race=None):
+    """
+    Streams a completion, appending token deltas to the task's token stream.
+    Returns the assembled response and the seconds to its first token (None if it had no content).
+    In a hedged call, the first request to produce a token claims the token stream; the other is cancelled.
+    """
+    token_key = f"{TASK_TOKENS_PREFIX}{task_id}"
+    chunks = []
+    pending = ""
+    last_flush = time.monotonic()
+    started = time.perf_counter()
+    first_token = True
+    time_to_first_token = None
+
+    async def flush():
+        nonlocal pending, last_flush
+        if pending:
+            await asyncio.to_thread(redis_client.xadd, token_key, {"delta": pending})
+            await asyncio.to_thread(redis_client.expire, token_key, TASK_TOKENS_TTL_SECONDS)
+            pending = ""
+        last_flush = time.monotonic()
+
+    response_stream = await acompletion(
+        model=api_details["model"],
+        messages=messages,
+        api_key=api_details["api_key"],
+        stream=True,
+        stream_options={"include_usage": True},
+        drop_params=True,
+    )
+    try:
+        async for chunk in response_stream:
+            chunks.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token:
+                    if race and not race.claim(model_name):
+                        # The other request of the hedged call is already streaming its answer
+                        raise asyncio.CancelledError()
+                    time_to_first_token = time.perf_counter() - started
+                    LLM_TIME_TO_FIRST_TOKEN_SECONDS.labels(model_name).observe(time_to_first_token)
+                    first_token = False
+                pending += chunk.choices[0].delta.content
+            if len(pending) >= TOKEN_FLUSH_CHARS or time.monotonic() - last_flush >= TOKEN_FLUSH_SECONDS:
+                await flush()
+    except Exception as e:
+        if first_token:
+            raise
+        raise StreamInterruptedError(f"The response stream failed part way through: {e}") from e
+    finally:
+        # A request that stops reading mid-stream (the cancelled side of a hedged call, or a failure)
+        # would otherwise hold its HTTP connection until the stream is garbage collected
+        if hasattr(response_stream, "aclose"):
+            await response_stream.aclose()
+    await flush()
+
+    # Rebuilds a regular response, including token usage, so cost is recorded as for non-streamed calls
+    return stream_chunk_builder(chunks, messages=messages), time_to_first_token
+
+def model_quota_limits(model_name):
+    """ Returns the per-minute request and token quotas configured for a model, by bucket name """
+    limits = {}
+    if model_name in MODEL_RPM_LIMITS:
+        limits["requests"] = MODEL_RPM_LIMITS[model_name]
+    if model_name in MODEL_TPM_LIMITS:
+        limits["tokens"] = MODEL_TPM_LIMITS[model_name]
+    return limits
+
+def estimate_tokens(model_name, messages):
+    """ Estimates a request's token usage before sending it: its prompt plus EXPECTED_OUTPUT_TOKENS """
+    return token_counter(model=MODEL_API_KEYS[model_name]["model"], messages=messages) + EXPECTED_OUTPUT_TOKENS
+
+async def wait_for_quota(model_name, limits, costs):
+    """ Waits until the model's shared rate-limit buckets cover a request's costs and takes them; returns the seconds waited """
+    started = time.perf_counter()
+    while True:
+        try:
+            wait = await asyncio.to_thread(take_quota, redis_client, model_name, limits, costs)
+        except redis.exceptions.RedisError as e:
+            # The limiter can't coordinate without Redis; send the request rather than fail the task
+            print(f"Rate limiter unavailable for {model_name}: {e}")
+            break
+        if not wait:
+            break
+        # A little jitter so workers waiting on the same bucket don't all retry at once
+        await asyncio.sleep(wait + random.uniform(0, min(wait, 0.1)))
+    waited = time.perf_counter() - started
+    LLM_QUOTA_WAIT_SECONDS.labels(model_name).observe(waited)
+    return waited
+
+async def settle_tokens(model_name, limits, tokens):
+    """ Corrects the model's token bucket by the difference between estimated and actual usage """
+    try:
+        await asyncio.to_thread(
+            take_quota, redis_client, model_name, {"tokens": limits["tokens"]}, {"tokens": tokens}, True
+        )
+    except redis.exceptions.RedisError as e:
+        print(f"Rate limiter unavailable for {model_name}: {e}")
+
+async def request_model(model_name, messages, stream_to=None, trace=None, priority=0, race=None):
+    """
+    Sends one completion request, waiting for a free slot under the model's concurrency limit and,
+    if the model has quotas, for its shared rate-limit buckets to cover the request.
+    Rate limits, timeouts and server errors are retried up to LLM_MAX_ATTEMPTS times with jittered
+    exponential backoff; the slot is kept meanwhile, so a struggling provider gets fewer requests.
+    With stream_to set to a task id, token deltas are streamed to that task's token stream as they arrive.
+    With a trace, each attempt is recorded in it as an "llm_call" span.
+    Waiting requests with a lower priority value (the task's lane priority) get a free slot first.
+    With a race, the request is one of the two of a hedged call.
+    """
+    api_details = MODEL_API_KEYS[model_name]
+    limits = model_quota_limits(model_name)
+    waiting = time.perf_counter()
+    async with get_model_semaphore(model_name).slot(priority):
+        slot_wait = time.perf_counter() - waiting
+        LLM_SLOT_WAIT_SECONDS.labels(model_name).observe(slot_wait)
+        for attempt in range(1, LLM_MAX_ATTEMPTS + 1):
+            costs = {"requests": 1}
+            if "tokens" in limits:
+                costs["tokens"] = await asyncio.to_thread(estimate_tokens, model_name, messages)
+            quota_wait = await wait_for_quota(model_name, limits, costs) if limits else 0.0
+            attributes = {
+                "model": model_name,
+                "streamed": bool(stream_to),
+                "slot_wait_s": round(slot_wait, 6),
+                "quota_wait_s": round(quota_wait, 6),
+                "attempt": attempt,
+            }
+            span = trace.span("llm_call", **attributes) if trace else Span("llm_call", "worker", **attributes)
+            try:
+                with LLM_REQUEST_SECONDS.labels(model_name).time(), span:
+                    if race:
+                        race.sent.add(model_name)
+                    latency = None
+                    if stream_to:
+                        response, latency = await stream_completion(model_name, api_details, messages, stream_to, race)
+                    else:
+                        response = await acompletion(
+                            model=api_details["model"],
+                            messages=messages,
+                            api_key=api_details["api_key"],
+                        )
+                    span.attributes["input_tokens"] = response.usage.prompt_tokens
+                    span.attributes["output_tokens"] = response.usage.completion_tokens
+            except Exception as e:
+                if "tokens" in costs:
+                    # A failed request uses no tokens; give the estimate back
+                    await settle_tokens(model_name, limits, -costs["tokens"])
+                if attempt == LLM_MAX_ATTEMPTS or not is_transient(e):
+                    raise
+                delay = retry_delay(attempt, e)
+                LLM_RETRIES.labels(model_name, type(e).__name__).inc()
+                print(f"{model_name} request failed ({type(e).__name__}: {e}); attempt {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if "tokens" in costs:
+                await settle_tokens(model_name, limits, response.usage.total_tokens - costs["tokens"])
+            LLM_TOKENS.labels(model_name, "input").inc(response.usage.prompt_tokens)
+            LLM_TOKENS.labels(model_name, "output").inc(response.usage.completion_tokens)
+            LLM_COST_DOLLARS.labels(model_name).inc(float(completion_cost(completion_response=response)))
+            if model_name in HEDGE_FALLBACK_MODELS:
+                # Streamed requests are hedged on their first token, the others on the whole response
+                kind = "first_token" if stream_to else "response"
+                await save_latency(model_name, kind, latency if latency is not None else span.duration)
+            return response
+
+async def save_latency(model_name, kind, seconds):
+    """ Adds a latency sample to the model's histogram in Redis, from which hedge delays are computed """
+    try:
+        await asyncio.to_thread(record_latency, redis_client, model_name, kind, seconds)
+    except redis.exceptions.RedisError as e:
+        print(f"Could not record latency of {model_name}: {e}")
+
+class HedgeRace:
+    """ The primary and fallback requests of a hedged call; the first to answer wins and the other is cancelled """
+
+    def __init__(self):
+        self.tasks = {}
+        # Models whose request was sent to the provider, so a cancelled request may still be billed
+        self.sent = set()
+        self.winner = None
+
+    def start(self, model_name, coroutine):
+        self.tasks[model_name] = asyncio.ensure_future(coroutine)
+        return self.tasks[model_name]
+
+    def claim(self, model_name):
+        """ Makes a model the winner unless the other one already is, cancelling the other's request """
+        if self.winner is None:
+            self.winner = model_name
+            self.cancel(keep=model_name)
+        return self.winner == model_name
+
+    def cancel(self, keep=None):
+        for model_name, task in self.tasks.items():
+            if model_name != keep and not task.done():
+                task.cancel()
+
+    async def finish(self):
+        """ Waits for the first successful answer and returns the model that gave it and its response """
+        pending = set(self.tasks.values())
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for model_name, task in self.tasks.items():
+                if task not in done or task.cancelled():
+                    continue
+                if task.exception() is not None:
+                    if self.winner == model_name:
+                        # Failed after streaming part of its answer; the other request was already cancelled
+                        raise task.exception()
+                    error = error or task.exception()
+                    continue
+                self.claim(model_name)
+                return model_name, task.result()
+        raise error
+
+    def loser_cost(self, model_name, messages):
+        """ Returns what the losing request cost: its actual cost if it completed, else its prompt if it was sent """
+        task = self.tasks.get(model_name)
+        if task is None:
+            return 0.0
+        if task.done() and not task.cancelled():
+            if task.exception() is not None:
+                # Failed requests aren't billed
+                return 0.0
+            # Already counted in the cost metrics when it completed
+            return float(completion_cost(completion_response=task.result()))
+        if model_name not in self.sent:
+            return 0.0
+        try:
+            provider_model = MODEL_API_KEYS[model_name]["model"]
+            prompt_tokens = token_counter(model=provider_model, messages=messages)
+            cost = cost_per_token(model=provider_model, prompt_tokens=prompt_tokens, completion_tokens=0)[0]
+        except Exception as e:
+            print(f"Could not estimate the cost of the cancelled {model_name} request: {e}")
+            return 0.0
+        LLM_COST_DOLLARS.labels(model_name).inc(cost)
+        return cost
+
+async def call_model(model_name, messages, stream_to=None, trace=None, priority=0, calls=None):
+    """
+    Sends a completion request (see request_model) and returns its response.
+    If the model has a fallback in HEDGE_FALLBACK_MODELS and hasn't answered within its hedge delay,
+    the request is also sent to the fallback; the first answer wins and the other request is cancelled.
+    With calls, the model that answered is appended to it, with the cost of the losing request if hedged.
+    """
+    fallback = HEDGE_FALLBACK_MODELS.get(model_name)
+    delay = None
+    if fallback:
+        kind = "first_token" if stream_to else "response"
+        try:
+            delay = await asyncio.to_thread(hedge_delay, redis_client, model_name, kind)
+        except redis.exceptions.RedisError as e:
+            print(f"Could not read latency of {model_name}: {e}")
+    if delay is None:
+        response = await request_model(model_name, messages, stream_to, trace, priority)
+        if calls is not None:
+            calls.append({"model": model_name})
+        return response
+
+    race = HedgeRace()
+    started = time.perf_counter()
+    try:
+        primary = race.start(model_name, request_model(model_name, messages, stream_to, trace, priority, race))
+        await asyncio.wait([primary], timeout=delay)
+        if primary.done() or race.winner:
+            # Answered (or started streaming) in time; no hedge
+            response = await primary
+            if calls is not None:
+                calls.append({"model": model_name})
+            return response
+
+        attributes = {"model": model_name, "fallback": fallback, "delay_s": round(delay, 6)}
+        span = trace.span("hedge", **attributes) if trace else Span("hedge", "worker", **attributes)
+        with span:
+            race.start(fallback, request_model(fallback, messages, stream_to, trace, priority, race))
+            winner, response = await race.finish()
+            loser = fallback if winner == model_name else model_name
+            hedge_cost = race.loser_cost(loser, messages)
+            span.attributes["winner"] = winner
+            span.attributes["hedge_cost"] = hedge_cost
+    finally:
+        race.cancel(keep=race.winner)
+
+    LLM_HEDGES.labels(model_name, "primary" if winner == model_name else "fallback").inc()
+    if winner != model_name:
+        # The primary was cut off, so its latency is only known to exceed this; counting it keeps the
+        # histogram from forgetting the slow tail that hedging hides
+        await save_latency(model_name, kind, time.perf_counter() - started)
+    if calls is not None:
+        calls.append({"model": winner, "hedge_cost": hedge_cost})
+    return response
+
+def build_result(responses, calls=None):
+    """
+    Builds a task result from its provider responses: the last one's text, with usage and cost summed over all calls.
+    With calls (see call_model), the result also names the model that served the answer and, if any call was
+    hedged, what the losing requests cost; that cost is included in the total.
+    """
+    input_tokens = sum(response.usage.prompt_tokens for response in responses)
+    output_tokens = sum(response.usage.completion_tokens for response in responses)
+    hedged = [call for call in calls or [] if "hedge_cost" in call]
+    hedge_cost = sum(call["hedge_cost"] for call in hedged)
+    cost = sum(float(completion_cost(completion_response=response)) for response in responses) + hedge_cost
+
+    result_data = {
+        "result": responses[-1]["choices"][0]["message"]["content"],
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost": f"${cost:.10f}",
+        "cost_value": cost,
+        "llm_calls": len(responses)
+    }
+    if calls:
+        result_data["served_by"] = calls[-1]["model"]
+    if hedged:
+        result_data["hedged_calls"] = len(hedged)
+        result_data["hedge_cost"] = f"${hedge_cost:.10f}"
+    return result_data
+
+def write_result(task_id, result_data):
+    """ Stores a task's result where /get_result reads it and notifies anyone waiting for it """
+    # One expiring key per task keeps Redis memory bounded
+    redis_client.set(result_key(task_id), encode_result(result_data), ex=RESULT_TTL_SECONDS)
+    # Ends the token stream, including for cached results that never streamed any tokens
+    token_key = f"{TASK_TOKENS_PREFIX}{task_id}"
+    redis_client.xadd(token_key, {"event": "done"})
+    redis_client.expire(token_key, TASK_TOKENS_TTL_SECONDS)
+    redis_client.publish(f"{TASK_EVENTS_CHANNEL_PREFIX}{task_id}", "done")
+
+def reset_token_stream(task_id):
+    """ Starts a restarted task's token stream over, so clients don't get the earlier attempt's partial answer """
+    token_key = f"{TASK_TOKENS_PREFIX}{task_id}"
+    pipe = redis_client.pipeline()
+    pipe.delete(token_key)
+    # Clients already relaying the stream discard what they have on this entry
+    pipe.xadd(token_key, {"event": "reset"})
+    pipe.expire(token_key, TASK_TOKENS_TTL_SECONDS)
+    pipe.execute()
+
+def dead_letter_task(task, error):
+    """ Moves a task that can't be completed to the dead-letter stream and writes an error result for its client """
+    fields = {key: value for key, value in task.items() if key != "id"}
+    redis_client.xadd(
+        DEAD_LETTER_STREAM,
+        {**fields, "task_id": task["id"], "error": error, "failed_at": repr(time.time())},
+        maxlen=DEAD_LETTER_MAXLEN,
+        approximate=True,
+    )
+    # Clients waiting on the task get the error right away instead of polling until they give up
+    write_result(task["id"], {"result": f"The request could not be completed: {error}", "error": error})
+
+async def generate_responses(task, model_name, document_hash, trace, calls):
+    """ Runs the provider calls for a task and returns their responses; the last one holds the answer. Each call is logged in calls """
+    document_key = task.get("document_key")
+    priority = lane_priority(task.get("lane"))
+
+    async def document_content():
+        # Models are sent the compact markdown: no image references, running headers or table padding
+        if task.get("document_content"):
+            return compact_markdown(task["document_content"])
+        # Tasks reference the markdown in S3; bodies are resolved through the local document caches
+        with trace.span("load_document"):
+            return await asyncio.to_thread(load_compact_document, document_key, document_hash)
 
-# Redis stream keys
-TASK_STREAM = "task_stream"
-RESULT_STREAM = "result_stream"
+    if task["task_type"] == "summarize":
+        # Long documents are summarized chunk by chunk, sized to the model's context window
+        max_chars = chunk_chars_for_model(MODEL_API_KEYS[model_name]["model"])
+        return await summarize_document(
+            await document_content(),
+            lambda messages: call_model(model_name, messages, trace=trace, priority=priority, calls=calls),
+            max_chars,
+            final_call=lambda messages: call_model(
+                model_name, messages, stream_to=task["id"], trace=trace, priority=priority, calls=calls
+            ),
+        )
 
-def process_task(task):
+    question = task["question"]
+    index = None
+    if document_key:
+        with trace.span("load_index"):
+            index = await asyncio.to_thread(load_index, document_key, document_hash)
+    if index:
+        # Only the passages most relevant to the question are sent, not the whole document
+        excerpts = "\n\n---\n\n".join(top_chunks(index, question, RETRIEVAL_TOP_K))
+        system_prompt = f"These are the most relevant excerpts of a document:\n{excerpts}"
+    else:
+        system_prompt = f"This is a document:\n{await document_content()}"
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question},
+    ]
+    return [await call_model(model_name, messages, stream_to=task["id"], trace=trace, priority=priority, calls=calls)]
+
+async def process_task(task):
     task_type = task.get("task_type")
     model_name = task.get("model_name")
+    document_key = task.get("document_key")
     document_content = task.get("document_content")
+    # Only known task types become label values, so malformed tasks can't create new series
+    task_label = task_type if task_type in ("summarize", "ask_question") else "unknown"
+    started = time.perf_counter()
+    dequeued_at = time.time()
+    # Tasks carry their enqueue time from the API; task ids start with it in milliseconds otherwise
+    enqueued_at = float(task.get("enqueued_at") or int(task["id"].split("-")[0]) / 1000)
+    TASK_QUEUE_WAIT_SECONDS.labels(task_label).observe(max(0.0, dequeued_at - enqueued_at))
+    # Continues the trace started by the API, so /trace/{task_id} shows both sides
+    trace = Trace("worker", task.get("trace_id") or new_trace_id(), task["id"])
+    trace.add_span("queue_wait", enqueued_at, dequeued_at)
+
+    async def reject(reason):
+        # Invalid tasks can never succeed, so they go straight to the dead-letter stream
+        print(reason)
+        TASKS.labels(task_label, "invalid").inc()
+        await asyncio.to_thread(dead_letter_task, task, reason)
     
-    if not model_name or not document_content:
-        print("Invalid task data")
-        return
+    if not model_name or not (document_key or document_content):
+        return await reject("Invalid task data")
     
-    api_details = MODEL_API_KEYS.get(model_name)
-    if not api_details:
-        print(f"Invalid model name: {model_name}")
-        return
-    model = api_details["model"]
-    api_key = api_details["api_key"]
+    if model_name not in MODEL_API_KEYS:
+        return await reject(f"Invalid model name: {model_name}")
     
     try:
-        if task_type == "summarize":
-            response = completion(
-                model=model,
-                messages=[{"role": "user", "content": f"Summarize this document:\n{document_content}"}],
-                api_key=api_key,
-            )
-
-            summarize_usage = response.usage
-            input_tokens = summarize_usage.prompt_tokens 
-            output_tokens = summarize_usage.completion_tokens  
-            summarize_cost = completion_cost(completion_response=response)
-            formatted_string = f"${float(summarize_cost):.10f}"
-            summary = response["choices"][0]["message"]["content"]
-
-       
-            result_data = {
-                "result": summary,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "cost": formatted_string
-            }
-            redis_client.hset(RESULT_STREAM, task["id"], str(result_data))
+        document_hash = task.get("document_hash") or content_hash(document_content)
 
-            print(f"Summary processed for Task ID {task['id']}")
-            print(f"Input Tokens: {input_tokens}, Output Tokens: {output_tokens}, Total Cost: {formatted_string}")
+        if task_type == "summarize":
+            label = "Summary"
      
         elif task_type == "ask_question":
-            question = task.get("question")
-            if not question:
-                print("Invalid question data")
-                return
+            if not task.get("question"):
+                return await reject("Invalid question data")
             
-            response = completion(
-                model=model,
-                messages=[
-                    {"role": "system", "content": f"This is a document:\n{document_content}"},
-                    {"role": "user", "content": question},
-                ],
-                api_key=api_key,
-            )
-
-            qa_usage = response.usage
-            input_tokens = qa_usage.prompt_tokens
-            output_tokens = qa_usage.completion_tokens
-            qa_cost = completion_cost(completion_response=response)
-            formatted_string = f"${float(qa_cost):.10f}"
-            answer = response["choices"][0]["message"]["content"]
-
-            result_data = {
-                "result": answer,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "cost": formatted_string
-            }
-            redis_client.hset(RESULT_STREAM, task["id"], str(result_data))
+            label = "Answer"
 
-            print(f"Answer processed for Task ID {task['id']}")
-            print(f"Input Tokens: {input_tokens}, Output Tokens: {output_tokens}, Total Cost: {formatted_string}")
+        else:
+            return await reject(f"Unknown task type: {task_type}")
 
+        # Identical requests on the same document are answered from the cache without calling the provider
+        key = cache_key(model_name, task_type, document_hash, task.get("question"))
+        with trace.span("cache_lookup") as span:
+            result_data = await asyncio.to_thread(get_cached_result, redis_client, key)
+            span.attributes["hit"] = bool(result_data)
+        if result_data:
+            result_data["cached"] = True
         else:
-            print(f"Unknown task type: {task_type}")
+            # Token and cost metrics are counted per provider call, under the model that made it
+            calls = []
+            responses = await generate_responses(task, model_name, document_hash, trace, calls)
+            result_data = build_result(responses, calls)
+            await asyncio.to_thread(store_cached_result, redis_client, key, result_data)
+        with trace.span("write_result"):
+            await asyncio.to_thread(write_result, task["id"], result_data)
+        TASKS.labels(task_label, "cached" if result_data.get("cached") else "success").inc()
+        TASK_SECONDS.labels(task_label).observe(time.perf_counter() - started)
+
+        print(f"{label} processed for Task ID {task['id']}{' from cache' if result_data.get('cached') else ''}")
+        print(f"Input Tokens: {result_data['input_tokens']}, Output Tokens: {result_data['output_tokens']}, Total Cost: {result_data['cost']}")
     
     except Exception as e:
+        TASKS.labels(task_label, "error").inc()
+        failed_at = time.time()
+        trace.add_span("error", failed_at, failed_at, error=str(e))
         print(f"Error processing Task ID {task['id']}: {str(e)}")
+        try:
+            # Transient provider errors were already retried in call_model; this failure is final
+            await asyncio.to_thread(dead_letter_task, task, f"{type(e).__name__}: {e}"[:500])
+        except Exception as dead_letter_error:
+            print(f"Could not dead-letter Task ID {task['id']}: {str(dead_letter_error)}")
 
-# Listen for new tasks in the stream
-while True:
     try:
-        entries = redis_client.xread({TASK_STREAM: "$"}, block=10000)
-        for stream_name, messages in entries:
-            for message_id, message_data in messages:
-                print(f"Processing Task ID {message_id}")
-                process_task({"id": message_id, **message_data})
-    
-    except redis.exceptions.ConnectionError as e:
-        print("Reconnecting to Redis...")
-        redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT,password=REDIS_PASSWORD, decode_responses=True)
-    
+        await asyncio.to_thread(store_trace, redis_client, trace)
     except Exception as e:
-        print(f"Unexpected error in the loop: {e}")
-        time.sleep(2)  # Prevent crash loops
+        print(f"Could not store trace for Task ID {task['id']}: {str(e)}")
+
+def run_sync(coroutine):
+    """ Runs a coroutine to completion on this process's event loop (sync mode) """
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coroutine)
+
+def ensure_consumer_group():
+    """ Creates the consumer group (and the stream) of every lane if they don't exist yet; see storage.task_queue """
+    create_consumer_groups(redis_client)
+
+def is_legacy_entry(lane, message_data):
+    """ Entries on the original task stream without an API-assigned task id were queued, and answered, before consumer groups existed """
+    return TASK_STREAMS[lane] == LEGACY_TASK_STREAM and "task_id" not in message_data
+
+def task_from_entry(lane, message_id, message_data):
+    """ Builds the task a stream entry describes; tasks queued without an API-assigned id use the entry ID """
+    return {**message_data, "id": message_data.get("task_id") or message_id, "lane": lane}
+
+def read_entries(entries):
+    """ Flattens an XREADGROUP reply into (lane, message_id, message_data) tuples, highest-priority lane first """
+    messages = [
+        (STREAM_LANES[stream_name], message_id, message_data)
+        for stream_name, stream_messages in entries or []
+        for message_id, message_data in stream_messages
+    ]
+    return sorted(messages, key=lambda message: lane_priority(message[0]))
+
+async def run_with_heartbeat(lane, message_id, consumer_name, coroutine):
+    """
+    Runs a task's coroutine, re-claiming its stream entry every TASK_HEARTBEAT_SECONDS meanwhile
+    so other consumers don't take over a task that is still running
+    """
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(TASK_HEARTBEAT_SECONDS)
+            try:
+                # JUSTID resets the entry's idle time without counting another delivery
+                await asyncio.to_thread(
+                    redis_client.xclaim, TASK_STREAMS[lane], CONSUMER_GROUP, consumer_name, 0, [message_id], justid=True
+                )
+            except redis.exceptions.RedisError as e:
+                print(f"Could not refresh the claim on {message_id}: {e}")
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        return await coroutine
+    finally:
+        beat.cancel()
+
+def handle_message(lane, message_id, message_data, consumer_name):
+    """ Processes one stream entry and acknowledges it so it isn't delivered again """
+    if is_legacy_entry(lane, message_data):
+        redis_client.xack(TASK_STREAMS[lane], CONSUMER_GROUP, message_id)
+        return
+    task = task_from_entry(lane, message_id, message_data)
+    print(f"Processing Task ID {task['id']}")
+    run_sync(run_with_heartbeat(lane, message_id, consumer_name, process_task(task)))
+    redis_client.xack(TASK_STREAMS[lane], CONSUMER_GROUP, message_id)
+
+def trim_task_streams():
+    """ Drops stream entries older than TASK_STREAM_RETENTION_MS """
+    min_id = f"{int(time.time() * 1000) - TASK_STREAM_RETENTION_MS}-0"
+    for stream in TASK_STREAMS.values():
+        redis_client.xtrim(stream, minid=min_id, approximate=True)
+
+def reclaim_stale_entries(lane, consumer_name, start_id="0-0", count=CLAIM_BATCH_SIZE):
+    """
+    Takes over up to count entries of a lane left pending by consumers that crashed or were restarted mid-task.
+    Entries trimmed from the stream meanwhile are acknowledged, and tasks already delivered TASK_MAX_DELIVERIES
+    times are dead-lettered rather than run again.
+    Returns the start id of the next call ("0-0" once the lane is done) and the (message_id, message_data) pairs to process.
+    """
+    stream = TASK_STREAMS[lane]
+    start_id, messages, *_ = redis_client.xautoclaim(
+        stream, CONSUMER_GROUP, consumer_name, min_idle_time=CLAIM_IDLE_MS, start_id=start_id, count=count,
+    )
+    if not messages:
+        return start_id, []
+    # XAUTOCLAIM counts a delivery, so a task that crashed its worker every time shows up here with a growing count
+    deliveries = {
+        entry["message_id"]: entry["times_delivered"]
+        for entry in redis_client.xpending_range(
+            stream, CONSUMER_GROUP, min=messages[0][0], max=messages[-1][0], count=len(messages), consumername=consumer_name
+        )
+    }
+    reclaimed = []
+    for message_id, message_data in messages:
+        if not message_data:
+            # Entry was trimmed from the stream while pending; nothing left to process
+            redis_client.xack(stream, CONSUMER_GROUP, message_id)
+        elif deliveries.get(message_id, 0) > TASK_MAX_DELIVERIES:
+            task = task_from_entry(lane, message_id, message_data)
+            print(f"Task ID {task['id']} was delivered {deliveries[message_id]} times without finishing; dead-lettering it")
+            dead_letter_task(task, f"The worker stopped while processing the task {deliveries[message_id] - 1} times")
+            redis_client.xack(stream, CONSUMER_GROUP, message_id)
+        else:
+            print(f"Reclaimed stale Task ID {message_id}")
+            # The earlier attempt may have streamed part of its answer before it stopped
+            reset_token_stream(task_from_entry(lane, message_id, message_data)["id"])
+            reclaimed.append((message_id, message_data))
+    return start_id, reclaimed
+
+def claim_stale_tasks(consumer_name):
+    """ Takes over tasks left pending by consumers that crashed or were restarted mid-task """
+    for lane in LANES_BY_PRIORITY:
+        start_id = "0-0"
+        while True:
+            start_id, messages = reclaim_stale_entries(lane, consumer_name, start_id)
+            for message_id, message_data in messages:
+                handle_message(lane, message_id, message_data, consumer_name)
+            if start_id == "0-0":
+                break
+
+def run_worker(consumer_name):
+    """ Consumes tasks from the consumer group until the process is stopped """
+    global redis_client
+
+    ensure_consumer_group()
+    scheduler = LaneScheduler(LANE_WEIGHTS)
+    last_claim = 0.0
+    print(f"Worker {consumer_name} consuming {', '.join(TASK_STREAMS.values())} as part of group {CONSUMER_GROUP}")
+
+    # Listen for new tasks in the streams
+    while True:
+        try:
+            if time.monotonic() - last_claim >= CLAIM_INTERVAL_SECONDS:
+                claim_stale_tasks(consumer_name)
+                trim_task_streams()
+                last_claim = time.monotonic()
+
+            # The lane whose turn it is goes first, then the others by priority
+            first_lane = scheduler.next_lane()
+            messages = []
+            for lane in [first_lane] + [lane for lane in LANES_BY_PRIORITY if lane != first_lane]:
+                messages = read_entries(redis_client.xreadgroup(
+                    CONSUMER_GROUP, consumer_name, {TASK_STREAMS[lane]: ">"}, count=1
+                ))
+                if messages:
+                    break
+            if not messages:
+                # Every lane is empty; wait for the next task on any of them
+                messages = read_entries(redis_client.xreadgroup(
+                    CONSUMER_GROUP, consumer_name, {stream: ">" for stream in TASK_STREAMS.values()},
+                    count=1, block=10000,
+                ))
+            for lane, message_id, message_data in messages:
+                handle_message(lane, message_id, message_data, consumer_name)
+        
+        except redis.exceptions.ConnectionError:
+            print("Reconnecting to Redis...")
+            redis_client = get_redis_client()
+            time.sleep(1)
+
+        except redis.exceptions.ResponseError as e:
+            if "NOGROUP" in str(e):
+                # Stream or group was deleted; recreate them and carry on
+                ensure_consumer_group()
+            else:
+                print(f"Unexpected Redis error in the loop: {e}")
+                time.sleep(2)
+        
+        except Exception as e:
+            print(f"Unexpected error in the loop: {e}")
+            time.sleep(2)  # Prevent crash loops
+
+async def run_async_worker(consumer_name, max_in_flight=ASYNC_MAX_IN_FLIGHT):
+    """
+    Consumes tasks concurrently, keeping up to max_in_flight of them running on one event loop.
+    Free slots are shared between the lanes by LANE_WEIGHTS, slots one lane leaves unused go to
+    the others, and the last INTERACTIVE_RESERVED_SLOTS slots are kept for the interactive lane.
+    """
+    async_redis_client = get_async_redis_client()
+    await asyncio.to_thread(ensure_consumer_group)
+    scheduler = LaneScheduler(LANE_WEIGHTS)
+    reserved_slots = min(INTERACTIVE_RESERVED_SLOTS, max_in_flight - 1)
+    in_flight = set()
+    last_claim = 0.0
+    print(f"Async worker {consumer_name} consuming {', '.join(TASK_STREAMS.values())} with up to {max_in_flight} tasks in flight")
+
+    async def handle_message_async(lane, message_id, message_data):
+        if is_legacy_entry(lane, message_data):
+            await async_redis_client.xack(TASK_STREAMS[lane], CONSUMER_GROUP, message_id)
+            return
+        task = task_from_entry(lane, message_id, message_data)
+        print(f"Processing Task ID {task['id']}")
+        await run_with_heartbeat(lane, message_id, consumer_name, process_task(task))
+        await async_redis_client.xack(TASK_STREAMS[lane], CONSUMER_GROUP, message_id)
+
+    def dispatch(lane, message_id, message_data):
+        in_flight_task = asyncio.create_task(handle_message_async(lane, message_id, message_data))
+        in_flight.add(in_flight_task)
+        in_flight_task.add_done_callback(in_flight.discard)
+
+    def lane_slots(lane, free_slots):
+        # Lanes below the top one can't take the reserved slots
+        return free_slots if lane == LANES_BY_PRIORITY[0] else free_slots - reserved_slots
+
+    async def read_lane(lane, count):
+        return read_entries(await async_redis_client.xreadgroup(
+            CONSUMER_GROUP, consumer_name, {TASK_STREAMS[lane]: ">"}, count=count
+        ))
+
+    while True:
+        try:
+            free_slots = max_in_flight - len(in_flight)
+            if free_slots <= 0:
+                await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            if time.monotonic() - last_claim >= CLAIM_INTERVAL_SECONDS:
+                for lane in LANES_BY_PRIORITY:
+                    # Reclaimed tasks take slots like new ones, so no more than are free are claimed
+                    free_slots = max_in_flight - len(in_flight)
+                    if free_slots <= 0:
+                        break
+                    _, messages = await asyncio.to_thread(
+                        reclaim_stale_entries, lane, consumer_name, "0-0", min(CLAIM_BATCH_SIZE, free_slots)
+                    )
+                    for message_id, message_data in messages:
+                        dispatch(lane, message_id, message_data)
+                await asyncio.to_thread(trim_task_streams)
+                last_claim = time.monotonic()
+                continue
+
+            # Each lane first reads up to its weighted share of the free slots; what a lane leaves
+            # unused goes to the lanes that still have tasks waiting, highest priority first
+            messages = []
+            drained = set()
+            quotas = scheduler.quotas(free_slots)
+            for extra_pass in (False, True):
+                for lane in LANES_BY_PRIORITY:
+                    if lane in drained:
+                        continue
+                    available = lane_slots(lane, free_slots - len(messages))
+                    count = available if extra_pass else min(quotas[lane], available)
+                    if count <= 0:
+                        continue
+                    lane_messages = await read_lane(lane, count)
+                    if len(lane_messages) < count:
+                        drained.add(lane)
+                    messages += lane_messages
+
+            if not messages:
+                # Every lane is empty. Short block so slots freed by finished tasks are refilled
+                # promptly; one entry per lane may arrive at once, briefly going over max_in_flight.
+                streams = {
+                    TASK_STREAMS[lane]: ">" for lane in LANES_BY_PRIORITY if lane_slots(lane, free_slots) > 0
+                }
+                messages = read_entries(await async_redis_client.xreadgroup(
+                    CONSUMER_GROUP, consumer_name, streams, count=1, block=1000
+                ))
+            for lane, message_id, message_data in messages:
+                dispatch(lane, message_id, message_data)
+
+        except redis.exceptions.ConnectionError:
+            print("Reconnecting to Redis...")
+            await asyncio.sleep(1)
+
+        except redis.exceptions.ResponseError as e:
+            if "NOGROUP" in str(e):
+                await asyncio.to_thread(ensure_consumer_group)
+            else:
+                print(f"Unexpected Redis error in the loop: {e}")
+                await asyncio.sleep(2)
+
+        except Exception as e:
+            print(f"Unexpected error in the loop: {e}")
+            await asyncio.sleep(2)  # Prevent crash loops
+
+def start_worker(consumer_name):
+    """ Runs one consumer in the configured WORKER_MODE """
+    if WORKER_MODE == "async":
+        asyncio.run(run_async_worker(consumer_name))
+    else:
+        run_worker(consumer_name)
+
+def main():
+    threading.Thread(target=start_flask_server, daemon=True).start()
+
+    if WORKER_PROCESSES <= 1:
+        start_worker(CONSUMER_NAME)
+        return
+
+    # Each process is an independent consumer in the same group
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=start_worker, args=(f"{CONSUMER_NAME}-{index}",))
+        for index in range(WORKER_PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import time
+
+# How long a cached completion stays valid
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+# Least recently used entries are evicted beyond this many cached completions
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10000))
+
+LLM_CACHE_PREFIX = "llm_cache:"
+LLM_CACHE_INDEX = "llm_cache:index"  # Sorted set of cache keys scored by last use
+LLM_CACHE_STATS = "llm_cache:stats"
+
+
+def content_hash(text):
+    """ Returns the SHA-256 hex digest of a document's text """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question):
+    """ Lowercases and collapses whitespace so trivially different phrasings share a cache entry """
+    return " ".join((question or "").lower().split())
+
+
+def cache_key(model_name, task_type, document_hash, question=None):
+    """ Builds the cache key for a (model, task type, document, question) combination """
+    question_hash = content_hash(normalize_question(question))[:16]
+    return f"{LLM_CACHE_PREFIX}{model_name}:{task_type}:{document_hash}:{question_hash}"
+
+
+def get_cached_result(redis_client, key):
+    """ Returns the cached result for a key (or None) and updates the hit/miss counters """
+    cached = redis_client.get(key)
+    if cached is None:
+        redis_client.hincrby(LLM_CACHE_STATS, "misses", 1)
+        return None
+
+    result_data = json.loads(cached)
+    redis_client.zadd(LLM_CACHE_INDEX, {key: time.time()})
+    redis_client.hincrby(LLM_CACHE_STATS, "hits", 1)
+    redis_client.hincrbyfloat(LLM_CACHE_STATS, "saved_cost", float(result_data.get("cost_value", 0.0)))
+    return result_data
+
+
+def store_cached_result(redis_client, key, result_data):
+    """ Caches a result with a TTL and evicts the least recently used entries above LLM_CACHE_MAX_ENTRIES """
+    redis_client.set(key, json.dumps(result_data), ex=LLM_CACHE_TTL)
+    redis_client.zadd(LLM_CACHE_INDEX, {key: time.time()})
+
+    # Entries that expired through their TTL are dropped from the index here as well
+    redis_client.zremrangebyscore(LLM_CACHE_INDEX, "-inf", time.time() - LLM_CACHE_TTL)
+    excess = redis_client.zcard(LLM_CACHE_INDEX) - LLM_CACHE_MAX_ENTRIES
+    if excess > 0:
+        evicted = [member for member, _score in redis_client.zpopmin(LLM_CACHE_INDEX, excess)]
+        if evicted:
+            redis_client.delete(*evicted)
+
+
+def get_cache_stats(redis_client):
+    """ Returns cache hits, misses, hit rate and the provider cost saved by hits """
+    stats = redis_client.hgetall(LLM_CACHE_STATS)
+    hits = int(stats.get("hits", 0))
+    misses = int(stats.get("misses", 0))
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "saved_cost": f"${float(stats.get('saved_cost', 0.0)):.10f}",
+        "entries": redis_client.zcard(LLM_CACHE_INDEX),
+    }
@@ -0,0 +1,75 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+
+
+class LaneScheduler:
+    """
+    Smooth weighted round robin over the task lanes: over any run of picks, each lane is picked
+    in proportion to its weight, and picks of different lanes are interleaved rather than bunched.
+    """
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self._credit = dict.fromkeys(self.weights, 0)
+
+    def next_lane(self):
+        """ Returns the lane whose turn it is """
+        total = sum(self.weights.values())
+        for lane, weight in self.weights.items():
+            self._credit[lane] += weight
+        lane = max(self._credit, key=self._credit.get)
+        self._credit[lane] -= total
+        return lane
+
+    def quotas(self, slots):
+        """ Splits a number of free worker slots between the lanes by weight """
+        quotas = dict.fromkeys(self.weights, 0)
+        for _ in range(slots):
+            quotas[self.next_lane()] += 1
+        return quotas
+
+
+class PrioritySemaphore:
+    """
+    Semaphore whose waiters get a free slot in priority order (lowest value first), and in arrival
+    order within one priority, so interactive requests don't queue behind bulk ones.
+    """
+
+    def __init__(self, value):
+        self._value = value
+        self._waiters = []
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority=0):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot and cancelled in the same step: pass the slot on
+                self.release()
+            raise
+
+    def release(self):
+        self._value += 1
+        self._wake()
+
+    def _wake(self):
+        while self._value > 0 and self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # Skips waiters that were cancelled
+                self._value -= 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority=0):
+        """ Holds one slot for the duration of the block """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
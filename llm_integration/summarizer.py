@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+import litellm
+
+from backend.markdown_chunks import chunk_markdown
+
+# Share of a model's input context used for one chunk, leaving room for the prompt and the output
+SUMMARY_CONTEXT_FRACTION = float(os.getenv("SUMMARY_CONTEXT_FRACTION", 0.5))
+# Upper bound on chunk size; smaller chunks mean more of a long document is summarized in parallel
+SUMMARY_MAX_CHUNK_TOKENS = int(os.getenv("SUMMARY_MAX_CHUNK_TOKENS", 16000))
+DEFAULT_CONTEXT_TOKENS = 8192
+CHARS_PER_TOKEN = 4  # Rough average for English prose
+
+
+def chunk_chars_for_model(model):
+    """ Returns the chunk size in characters for a LiteLLM model, derived from its context window """
+    try:
+        context_tokens = litellm.get_model_info(model).get("max_input_tokens") or DEFAULT_CONTEXT_TOKENS
+    except Exception:
+        context_tokens = DEFAULT_CONTEXT_TOKENS
+    chunk_tokens = min(int(context_tokens * SUMMARY_CONTEXT_FRACTION), SUMMARY_MAX_CHUNK_TOKENS)
+    return chunk_tokens * CHARS_PER_TOKEN
+
+
+def _reduce_groups(summaries, max_chars):
+    # Greedily group partial summaries so each reduce prompt fits in one chunk, at least two per group
+    groups = []
+    current = []
+    current_chars = 0
+    for summary in summaries:
+        if len(current) >= 2 and current_chars + len(summary) > max_chars:
+            groups.append(current)
+            current = []
+            current_chars = 0
+        current.append(summary)
+        current_chars += len(summary)
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def summarize_document(document, call, max_chars, final_call=None):
+    """
+    Summarizes a document, map-reducing over chunks when it doesn't fit in one prompt.
+
+    Chunks are summarized concurrently, then partial summaries are combined level by level
+    in a tree until one summary remains. ``call`` sends one list of messages to the model
+    and returns the provider response; ``final_call``, if given, is used instead for the
+    request that produces the final summary (e.g. to stream it).
+
+    Returns the list of provider responses; the last one holds the final summary.
+    """
+    final_call = final_call or call
+    if len(document) <= max_chars:
+        response = await final_call([{"role": "user", "content": f"Summarize this document:\n{document}"}])
+        return [response]
+
+    chunks = chunk_markdown(document, max_chars)
+    responses = await asyncio.gather(*(
+        call([{
+            "role": "user",
+            "content": (
+                f"Summarize part {index} of {len(chunks)} of a longer document. "
+                f"Keep the key facts, figures and names:\n{chunk}"
+            ),
+        }])
+        for index, chunk in enumerate(chunks, start=1)
+    ))
+    all_responses = list(responses)
+    summaries = [response["choices"][0]["message"]["content"] for response in responses]
+
+    while True:
+        groups = _reduce_groups(summaries, max_chars)
+        reduce_call = final_call if len(groups) == 1 else call
+        level = await asyncio.gather(*(
+            reduce_call([{
+                "role": "user",
+                "content": (
+                    "Combine these partial summaries of one document into a single coherent summary:\n\n"
+                    + "\n\n---\n\n".join(group)
+                ),
+            }])
+            for group in groups
+        ))
+        all_responses.extend(level)
+        summaries = [response["choices"][0]["message"]["content"] for response in level]
+        if len(summaries) == 1:
+            return all_responses
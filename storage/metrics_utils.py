@@ -0,0 +1,96 @@
+import glob
+import multiprocessing
+import os
+
+import redis.exceptions
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# Directory shared by every process of one service (API plus ingest workers, or all worker
+# processes) so /metrics aggregates their samples; unset means single-process metrics
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or None
+
+# Histogram buckets in seconds, from fast Redis/S3 calls up to long PDF conversions
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    # The service's main process starts from an empty directory; samples left by a previous run
+    # would otherwise be added to this one. Child processes must keep their siblings' files; their
+    # name is already set while a spawned child re-imports the main module.
+    if multiprocessing.current_process().name == "MainProcess":
+        for stale_file in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+            os.remove(stale_file)
+
+
+class StreamBacklogCollector:
+    """
+    Reports the length of a Redis stream and, per consumer group, how many entries are
+    pending (delivered but not acknowledged) and how many have not been delivered yet (lag).
+
+    Values are read from Redis at scrape time, so every scrape sees the current backlog.
+    """
+
+    def __init__(self, redis_client, stream: str):
+        self.redis_client = redis_client
+        self.stream = stream
+
+    def collect(self):
+        length = GaugeMetricFamily("redis_stream_length", "Entries in the Redis stream", labels=["stream"])
+        pending = GaugeMetricFamily(
+            "redis_stream_pending", "Entries delivered to a consumer group but not acknowledged",
+            labels=["stream", "group"],
+        )
+        lag = GaugeMetricFamily(
+            "redis_stream_lag", "Entries not yet delivered to a consumer group", labels=["stream", "group"]
+        )
+        try:
+            length.add_metric([self.stream], self.redis_client.xlen(self.stream))
+            groups = self.redis_client.xinfo_groups(self.stream)
+        except redis.exceptions.ResponseError:
+            # The stream doesn't exist until the first task is queued
+            groups = []
+        except redis.exceptions.RedisError:
+            return
+        for group in groups:
+            pending.add_metric([self.stream, group["name"]], group["pending"])
+            # Redis reports no lag (before 7.0, or after entries were trimmed) when it can't compute it
+            if group.get("lag") is not None:
+                lag.add_metric([self.stream, group["name"]], group["lag"])
+        yield length
+        yield pending
+        yield lag
+
+
+def build_metrics_registry(collectors: list = None) -> CollectorRegistry:
+    """
+    Build the registry a service's /metrics endpoint renders.
+
+    Args:
+        collectors (list): Extra collectors evaluated at scrape time, e.g. a StreamBacklogCollector.
+
+    Returns:
+        CollectorRegistry: The samples of every process sharing PROMETHEUS_MULTIPROC_DIR, or of
+        this process alone when it is unset, plus the extra collectors.
+    """
+    registry = CollectorRegistry(auto_describe=False)
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    for collector in collectors or []:
+        registry.register(collector)
+    return registry
+
+
+def render_metrics(registry: CollectorRegistry) -> tuple:
+    """
+    Render a registry in the Prometheus text format.
+
+    Args:
+        registry (CollectorRegistry): The registry to render.
+
+    Returns:
+        tuple: The response body and its content type.
+    """
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,57 @@
+import os
+
+import redis
+import redis.asyncio
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
+
+# Connections an asyncio client may open; SSE streams hold one per blocking read, so leave headroom
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 200))
+# Seconds a command waits for a free pooled connection before failing
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 10))
+
+
+def get_redis_client() -> redis.Redis:
+    """
+    Create a Redis client from the REDIS_* environment variables.
+
+    Returns:
+        redis.Redis: A client that decodes responses to str.
+    """
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, decode_responses=True)
+
+
+def get_async_redis_client(max_connections: int = None) -> redis.asyncio.Redis:
+    """
+    Create an asyncio Redis client from the REDIS_* environment variables.
+
+    Args:
+        max_connections (int): Bound the client's connection pool to this many connections;
+            commands then wait up to REDIS_POOL_TIMEOUT seconds for a free one instead of
+            opening a new connection. None leaves the pool unbounded.
+
+    Returns:
+        redis.asyncio.Redis: A client that decodes responses to str.
+    """
+    if max_connections is None:
+        return redis.asyncio.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, decode_responses=True)
+    pool = redis.asyncio.BlockingConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        decode_responses=True,
+        max_connections=max_connections,
+        timeout=REDIS_POOL_TIMEOUT,
+    )
+    # The client owns the pool, so closing the client closes its connections
+    return redis.asyncio.Redis.from_pool(pool)
+
+
+# Shared Redis client for this process
+redis_client = get_redis_client()
@@ -0,0 +1,60 @@
+import base64
+import json
+import os
+import zlib
+
+# How long a task's result can be fetched after the worker writes it
+RESULT_TTL_SECONDS = int(os.getenv("RESULT_TTL_SECONDS", 24 * 60 * 60))
+# Results whose JSON is at least this many bytes are stored zlib-compressed
+RESULT_COMPRESS_MIN_BYTES = int(os.getenv("RESULT_COMPRESS_MIN_BYTES", 4096))
+
+RESULT_KEY_PREFIX = "result:"
+COMPRESSED_MARKER = "z:"  # JSON objects start with "{", so the marker can't be mistaken for one
+
+
+def result_key(task_id: str) -> str:
+    """
+    Build the Redis key holding a task's result.
+
+    Args:
+        task_id (str): The task's id.
+
+    Returns:
+        str: The key, e.g. ``result:1712345678901-0``.
+    """
+    return f"{RESULT_KEY_PREFIX}{task_id}"
+
+
+def encode_result(result_data: dict) -> str:
+    """
+    Serialize a task result for storage in Redis.
+
+    Args:
+        result_data (dict): The result built by the worker.
+
+    Returns:
+        str: Compact JSON, or base64-encoded zlib-compressed JSON prefixed with ``z:``
+        when the JSON is large and compression actually makes it smaller.
+    """
+    encoded = json.dumps(result_data, separators=(",", ":"), ensure_ascii=False)
+    raw = encoded.encode("utf-8")
+    if len(raw) >= RESULT_COMPRESS_MIN_BYTES:
+        compressed = COMPRESSED_MARKER + base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+        if len(compressed) < len(raw):
+            return compressed
+    return encoded
+
+
+def decode_result(stored: str) -> dict:
+    """
+    Deserialize a task result read from Redis.
+
+    Args:
+        stored (str): A value written by ``encode_result``.
+
+    Returns:
+        dict: The result.
+    """
+    if stored.startswith(COMPRESSED_MARKER):
+        stored = zlib.decompress(base64.b64decode(stored[len(COMPRESSED_MARKER):])).decode("utf-8")
+    return json.loads(stored)
@@ -1,21 +1,67 @@
 import boto3
+import mimetypes
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from dotenv import load_dotenv
-from botocore.exceptions import NoCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, NoCredentialsError
+from prometheus_client import Counter, Histogram
+
+from storage.metrics_utils import LATENCY_BUCKETS
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Connection pool size; should be at least the number of concurrent upload threads
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+# Number of threads used by bulk uploads
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", 16))
+# Objects larger than this are sent as multipart uploads
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", 8)) * 1024 * 1024
+
+# Optional S3-compatible endpoint (e.g. MinIO or a local moto server); unset means AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+
 # Initialize the S3 client
 s3_client = boto3.client(
     "s3",
+    endpoint_url=S3_ENDPOINT_URL,
     aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
     aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
     region_name=os.getenv("AWS_DEFAULT_REGION"),
+    config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={"max_attempts": 5, "mode": "standard"}),
 )
 
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_THRESHOLD,
+)
+
+S3_UPLOAD_SECONDS = Histogram(
+    "s3_upload_seconds", "Time to upload one object to S3", ["file_type"], buckets=LATENCY_BUCKETS
+)
+S3_IMAGE_ENCODE_SECONDS = Histogram(
+    "s3_image_encode_seconds", "Time to encode one extracted image before upload", buckets=LATENCY_BUCKETS
+)
+S3_BYTES = Counter("s3_bytes", "Bytes transferred to and from S3", ["direction", "file_type"])
+
+# File type folder for each extension
+EXTENSION_TO_TYPE = {
+    ".md": "markdown",
+    ".txt": "text",
+    ".png": "images",
+    ".jpg": "images",
+    ".jpeg": "images",
+    ".pdf": "pdfs",
+    ".html": "html",
+    ".json": "index"
+}
+
 def generate_s3_object_key(pdf_filename: str, file_type: str, file_name: str) -> str:
     """
     Generate a structured S3 object key.
@@ -30,7 +76,143 @@ def generate_s3_object_key(pdf_filename: str, file_type: str, file_name: str) ->
     """
     return f"{pdf_filename}/{file_type}/{file_name}"  # Flat, easy-to-navigate structure
 
-    
+
+def file_type_for_name(file_name: str) -> str:
+    """
+    Infer the type folder of a file from its extension.
+
+    Args:
+        file_name (str): The file name.
+
+    Returns:
+        str: The type folder, e.g. 'markdown' or 'images'; 'other' for unknown extensions.
+    """
+    return EXTENSION_TO_TYPE.get(os.path.splitext(file_name)[1].lower(), "other")
+
+
+def object_key_for_file(source: str, file_name: str) -> str:
+    """
+    Build the object key for a file, inferring its type folder from the extension.
+
+    Args:
+        source (str): The PDF filename (used as the main folder).
+        file_name (str): The file name.
+
+    Returns:
+        str: A structured S3 object key.
+    """
+    return generate_s3_object_key(source, file_type_for_name(file_name), file_name)
+
+
+def s3_object_url(object_key: str) -> str:
+    """
+    Build the public URL of an object in the bucket.
+
+    Args:
+        object_key (str): S3 object key.
+
+    Returns:
+        str: Public URL of the object.
+    """
+    return f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{object_key}"
+
+
+def object_key_from_url(url: str) -> str:
+    """
+    Extract the object key from a public or presigned URL of an object in the bucket.
+
+    Args:
+        url (str): The object URL.
+
+    Returns:
+        str: The object key, or None if the URL doesn't point into the bucket.
+    """
+    base_url = s3_object_url("")
+    if not url.startswith(base_url):
+        return None
+    return url[len(base_url):].split("?", 1)[0] or None
+
+
+def get_object_content_hash(object_key: str) -> str:
+    """
+    Identify an object's content without downloading it.
+
+    Args:
+        object_key (str): S3 object key.
+
+    Returns:
+        str: The SHA-256 recorded in the object's metadata at upload, or its ETag for older objects.
+    """
+    response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=object_key)
+    metadata = response.get("Metadata", {})
+    # Objects uploaded before the key was hyphenated carry it as content_sha256
+    return metadata.get("content-sha256") or metadata.get("content_sha256") or response["ETag"].strip('"')
+
+
+def get_object_metadata(object_key: str) -> dict:
+    """
+    Read an object's user metadata without downloading it.
+
+    Args:
+        object_key (str): S3 object key.
+
+    Returns:
+        dict: The metadata recorded at upload, or None if the object doesn't exist.
+    """
+    try:
+        response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=object_key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return response.get("Metadata", {})
+
+
+def download_bytes(object_key: str) -> bytes:
+    """
+    Download an object.
+
+    Args:
+        object_key (str): S3 object key.
+
+    Returns:
+        bytes: The object's content.
+    """
+    response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=object_key)
+    body = response["Body"].read()
+    S3_BYTES.labels("download", file_type_for_name(object_key)).inc(len(body))
+    return body
+
+
+def download_text(object_key: str) -> str:
+    """
+    Download a UTF-8 text object.
+
+    Args:
+        object_key (str): S3 object key.
+
+    Returns:
+        str: The object's content.
+    """
+    return download_bytes(object_key).decode("utf-8")
+
+
+def _extra_args(file_name: str, metadata: dict = None) -> dict:
+    extra_args = {"Metadata": metadata or {}, "ServerSideEncryption": "AES256"}
+    content_type = mimetypes.guess_type(file_name)[0]
+    if content_type:
+        extra_args["ContentType"] = content_type
+    return extra_args
+
+
+def _remaining_size(fileobj) -> int:
+    # Bytes between the current position and the end, without consuming the file object
+    position = fileobj.tell()
+    size = fileobj.seek(0, os.SEEK_END) - position
+    fileobj.seek(position)
+    return size
+
+
 def upload_file_to_s3(file_path: str, source: str, metadata: dict = None) -> str:
     """
     Upload a file to S3 with structured naming.
@@ -47,36 +229,83 @@ def upload_file_to_s3(file_path: str, source: str, metadata: dict = None) -> str
     # Extract the actual file name
     file_name = os.path.basename(file_path)
 
-    # Extract the file extension
-    file_extension = os.path.splitext(file_name)[1].lower()
-
-    # Determine file type based on extension
-    extension_to_type = {
-        ".md": "markdown",
-        ".txt": "text",
-        ".png": "images",
-        ".jpg": "images",
-        ".jpeg": "images",
-        ".pdf": "pdfs",
-        ".html": "html"
-    }
-    
-    # Infer file type automatically
-    file_type = extension_to_type.get(file_extension, "other")
-
     # Generate a structured S3 object key
-    object_key = f"{source}/{file_type}/{file_name}"
+    file_type = file_type_for_name(file_name)
+    object_key = generate_s3_object_key(source, file_type, file_name)
 
     try:
         # Upload file to S3
-        s3_client.upload_file(
-            file_path, S3_BUCKET_NAME, object_key,
-            ExtraArgs={"Metadata": metadata or {}, "ServerSideEncryption": "AES256"}
-        )
-        return f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{object_key}"
+        with S3_UPLOAD_SECONDS.labels(file_type).time():
+            s3_client.upload_file(
+                file_path, S3_BUCKET_NAME, object_key,
+                ExtraArgs=_extra_args(file_name, metadata),
+                Config=TRANSFER_CONFIG
+            )
+        S3_BYTES.labels("upload", file_type).inc(os.path.getsize(file_path))
+        return s3_object_url(object_key)
     except Exception as e:
         raise RuntimeError(f"Error uploading {file_path} to S3: {str(e)}")
-    
+
+
+def upload_fileobj_to_s3(fileobj, source: str, file_name: str, metadata: dict = None) -> str:
+    """
+    Upload an in-memory file object to S3 with structured naming.
+
+    Args:
+        fileobj: A readable binary file object (e.g. BytesIO), positioned at the start.
+        source (str): The PDF filename (used as the main folder).
+        file_name (str): Name the object is stored under; its extension picks the type folder.
+        metadata (dict): Optional metadata tags for the object.
+
+    Returns:
+        str: Public URL of the uploaded file.
+    """
+    file_type = file_type_for_name(file_name)
+    object_key = generate_s3_object_key(source, file_type, file_name)
+
+    try:
+        size = _remaining_size(fileobj)
+        with S3_UPLOAD_SECONDS.labels(file_type).time():
+            s3_client.upload_fileobj(
+                fileobj, S3_BUCKET_NAME, object_key,
+                ExtraArgs=_extra_args(file_name, metadata),
+                Config=TRANSFER_CONFIG
+            )
+        S3_BYTES.labels("upload", file_type).inc(size)
+        return s3_object_url(object_key)
+    except Exception as e:
+        raise RuntimeError(f"Error uploading {file_name} to S3: {str(e)}")
+
+
+def bulk_upload_images_to_s3(images: list, source: str, metadata: dict = None, image_format: str = "PNG",
+                             max_workers: int = S3_UPLOAD_WORKERS) -> list:
+    """
+    Encode images in memory and upload them to S3 concurrently.
+
+    Args:
+        images (list): (file_name, image) pairs, where image is a PIL image (anything with ``save(fp, format)``).
+        source (str): The PDF filename (used as the main folder).
+        metadata (dict): Optional metadata tags applied to every object.
+        image_format (str): Encoding passed to ``image.save``.
+        max_workers (int): Maximum number of concurrent uploads.
+
+    Returns:
+        list: Public URLs of the uploaded images, in the same order as ``images``.
+    """
+    def encode_and_upload(item):
+        file_name, image = item
+        buffer = BytesIO()
+        started = time.perf_counter()
+        image.save(buffer, image_format)
+        S3_IMAGE_ENCODE_SECONDS.observe(time.perf_counter() - started)
+        buffer.seek(0)
+        return upload_fileobj_to_s3(buffer, source, file_name, metadata)
+
+    if not images:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(images)))) as executor:
+        return list(executor.map(encode_and_upload, images))
+
 
 def generate_presigned_url(object_key, expiration=3600):
     """
@@ -98,4 +327,4 @@ def generate_presigned_url(object_key, expiration=3600):
         return url
     except NoCredentialsError:
         print("Credentials not available.")
-        return None
\ No newline at end of file
+        return None
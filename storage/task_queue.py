@@ -0,0 +1,118 @@
+import os
+import time
+from uuid import uuid4
+
+import redis.exceptions
+
+# Tasks are queued on one Redis stream per lane, so short interactive questions don't wait behind
+# bulk summaries of large documents. The bulk lane keeps the original stream name, so tasks queued
+# before lanes existed are still processed.
+INTERACTIVE_LANE = "interactive"
+BULK_LANE = "bulk"
+TASK_STREAMS = {INTERACTIVE_LANE: "task_stream:interactive", BULK_LANE: "task_stream"}
+# Lanes in priority order, highest first
+LANES_BY_PRIORITY = [INTERACTIVE_LANE, BULK_LANE]
+# Lane each task type is queued on; unknown types go to the bulk lane
+TASK_LANES = {"ask_question": INTERACTIVE_LANE, "summarize": BULK_LANE}
+
+# Consumer group shared by all workers; each task is delivered to exactly one of them
+CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", "llm_workers")
+
+# Workers publish on task_events:{task_id} when a task's result has been written
+TASK_EVENTS_CHANNEL_PREFIX = "task_events:"
+# Workers append generated token deltas to task_tokens:{task_id}, ending with a "done" entry;
+# a "reset" entry means the task restarted and the deltas before it are void
+TASK_TOKENS_PREFIX = "task_tokens:"
+
+# Tasks that failed for good, with their error, kept for inspection and replay
+DEAD_LETTER_STREAM = "task_stream:dead"
+# Approximate cap on the dead-letter stream's length
+DEAD_LETTER_MAXLEN = int(os.getenv("DEAD_LETTER_MAXLEN", 10000))
+
+
+def parse_lane_settings(env_name: str, defaults: dict) -> dict:
+    """
+    Read per-lane integers such as "interactive=4,bulk=1" from an environment variable.
+
+    Args:
+        env_name (str): The environment variable to read.
+        defaults (dict): Values of the lanes the variable doesn't mention.
+
+    Returns:
+        dict: One value per lane.
+    """
+    settings = dict(defaults)
+    for item in os.getenv(env_name, "").split(","):
+        if "=" in item:
+            lane, value = item.split("=", 1)
+            if lane.strip() in TASK_STREAMS:
+                settings[lane.strip()] = int(value.strip())
+    return settings
+
+
+# Share of worker capacity each lane gets while both have tasks waiting; every lane gets at least 1
+LANE_WEIGHTS = {
+    lane: max(1, weight)
+    for lane, weight in parse_lane_settings("LANE_WEIGHTS", {INTERACTIVE_LANE: 4, BULK_LANE: 1}).items()
+}
+# Tasks waiting or running in a lane at which the API stops accepting more and answers 429
+LANE_MAX_BACKLOG = parse_lane_settings("LANE_MAX_BACKLOG", {INTERACTIVE_LANE: 1000, BULK_LANE: 200})
+
+
+def lane_for_task(task_type: str) -> str:
+    """
+    Pick the lane a task is queued on.
+
+    Args:
+        task_type (str): The task type, e.g. "ask_question".
+
+    Returns:
+        str: The lane name.
+    """
+    return TASK_LANES.get(task_type, BULK_LANE)
+
+
+def lane_priority(lane: str) -> int:
+    """
+    Rank a lane for scheduling; lower runs first.
+
+    Args:
+        lane (str): The lane name; unknown lanes rank last.
+
+    Returns:
+        int: The lane's position in LANES_BY_PRIORITY.
+    """
+    return LANES_BY_PRIORITY.index(lane) if lane in LANES_BY_PRIORITY else len(LANES_BY_PRIORITY)
+
+
+def create_consumer_groups(redis_client):
+    """
+    Create the consumer group (and the stream) of every lane if they don't exist yet.
+
+    Groups start at the beginning of their stream, so tasks queued before any worker started are
+    delivered. The API calls this at startup, before it queues anything, and workers call it when
+    they start or find a group gone (e.g. after Redis was flushed).
+
+    Args:
+        redis_client: A synchronous Redis client.
+    """
+    for stream in TASK_STREAMS.values():
+        try:
+            redis_client.xgroup_create(stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+
+def new_task_id() -> str:
+    """
+    Create the id clients use to fetch a task's result.
+
+    Stream entry IDs can't serve as task ids once tasks are spread over several streams, since two
+    streams can hand out the same ID. Task ids keep their shape: they start with the enqueue time
+    in milliseconds.
+
+    Returns:
+        str: A unique task id.
+    """
+    return f"{int(time.time() * 1000)}-{uuid4().hex[:16]}"
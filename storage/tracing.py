@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from uuid import uuid4
+
+from storage.result_store import RESULT_TTL_SECONDS
+
+TRACE_KEY_PREFIX = "trace:"
+# Spans are kept as long as the result they describe
+TRACE_TTL_SECONDS = int(os.getenv("TRACE_TTL_SECONDS", RESULT_TTL_SECONDS))
+# Optional JSON Lines file every stored span is also appended to, for a log shipper or collector to pick up
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH") or None
+
+_export_lock = threading.Lock()
+
+
+def new_trace_id() -> str:
+    """
+    Create the id shared by all spans of one request, across services.
+
+    Returns:
+        str: A random 32-character hex id.
+    """
+    return uuid4().hex
+
+
+def trace_key(task_id: str) -> str:
+    """
+    Build the Redis key holding a task's spans.
+
+    Args:
+        task_id (str): The task's id.
+
+    Returns:
+        str: The list key the spans are appended to.
+    """
+    return f"{TRACE_KEY_PREFIX}{task_id}"
+
+
+class Span:
+    """
+    One timed operation. Use it as a context manager; the start is wall-clock time so spans from
+    different processes line up, the duration is measured with a monotonic clock.
+    """
+
+    def __init__(self, name: str, service: str, **attributes):
+        self.name = name
+        self.service = service
+        self.attributes = attributes
+        self.start = None
+        self.duration = None
+        self._started = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self._started
+        if exc_value is not None:
+            # Cancellations carry no message, e.g. the losing request of a hedged call
+            self.attributes["error"] = str(exc_value) or type(exc_value).__name__
+        return False
+
+    def to_dict(self, trace_id: str, task_id: str) -> dict:
+        return {
+            "trace_id": trace_id,
+            "task_id": task_id,
+            "service": self.service,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_s": round(self.duration or 0.0, 6),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """
+    The spans one service records for one task, stored together once the service is done with it.
+    """
+
+    def __init__(self, service: str, trace_id: str = None, task_id: str = None):
+        self.service = service
+        self.trace_id = trace_id
+        self.task_id = task_id
+        self.spans = []
+
+    def span(self, name: str, **attributes) -> Span:
+        """
+        Start a span, to be used as a context manager.
+
+        Args:
+            name (str): Operation name, e.g. "llm_call".
+            **attributes: Extra fields stored with the span; more can be set on ``span.attributes``.
+
+        Returns:
+            Span: The span, recorded in this trace.
+        """
+        span = Span(name, self.service, **attributes)
+        self.spans.append(span)
+        return span
+
+    def add_span(self, name: str, start: float, end: float, **attributes) -> Span:
+        """
+        Record a span that wasn't measured in this process, such as the wait in a task lane.
+
+        Args:
+            name (str): Operation name.
+            start (float): Start as a Unix timestamp.
+            end (float): End as a Unix timestamp.
+            **attributes: Extra fields stored with the span.
+
+        Returns:
+            Span: The span, recorded in this trace.
+        """
+        span = Span(name, self.service, **attributes)
+        span.start = start
+        span.duration = max(0.0, end - start)  # Clocks of different hosts may disagree slightly
+        self.spans.append(span)
+        return span
+
+
+def _span_lines(trace: Trace) -> list:
+    spans = [span.to_dict(trace.trace_id, trace.task_id) for span in trace.spans if span.duration is not None]
+    return [json.dumps(span, separators=(",", ":")) for span in spans]
+
+
+def _export_lines(lines: list):
+    with _export_lock, open(TRACE_EXPORT_PATH, "a") as export_file:
+        export_file.write("".join(f"{line}\n" for line in lines))
+
+
+def store_trace(redis_client, trace: Trace) -> bool:
+    """
+    Append a trace's finished spans to its task's span list, and to TRACE_EXPORT_PATH if set.
+
+    Args:
+        redis_client: A synchronous Redis client.
+        trace (Trace): The spans to store; ``task_id`` must be set. Without a ``trace_id`` the spans
+            join the trace already stored for the task, and are dropped if there is none.
+
+    Returns:
+        bool: Whether any spans were stored.
+    """
+    key = trace_key(trace.task_id)
+    if trace.trace_id is None:
+        first_span = redis_client.lindex(key, 0)
+        if first_span is None:
+            return False
+        trace.trace_id = json.loads(first_span)["trace_id"]
+
+    lines = _span_lines(trace)
+    if not lines:
+        return False
+
+    pipeline = redis_client.pipeline()
+    pipeline.rpush(key, *lines)
+    pipeline.expire(key, TRACE_TTL_SECONDS)
+    pipeline.execute()
+
+    if TRACE_EXPORT_PATH:
+        _export_lines(lines)
+    return True
+
+
+async def store_trace_async(redis_client, trace: Trace) -> bool:
+    """
+    Same as ``store_trace``, for code running on an event loop.
+
+    Args:
+        redis_client: A ``redis.asyncio`` client.
+        trace (Trace): The spans to store, as for ``store_trace``.
+
+    Returns:
+        bool: Whether any spans were stored.
+    """
+    key = trace_key(trace.task_id)
+    if trace.trace_id is None:
+        first_span = await redis_client.lindex(key, 0)
+        if first_span is None:
+            return False
+        trace.trace_id = json.loads(first_span)["trace_id"]
+
+    lines = _span_lines(trace)
+    if not lines:
+        return False
+
+    async with redis_client.pipeline() as pipeline:
+        pipeline.rpush(key, *lines)
+        pipeline.expire(key, TRACE_TTL_SECONDS)
+        await pipeline.execute()
+
+    if TRACE_EXPORT_PATH:
+        await asyncio.to_thread(_export_lines, lines)
+    return True
+
+
+def trace_breakdown(task_id: str, stored_spans: list) -> dict:
+    """
+    Summarize where the time of one request went.
+
+    Args:
+        task_id (str): The task the spans belong to.
+        stored_spans (list): The JSON-encoded spans read from the task's span list.
+
+    Returns:
+        dict: The trace id, the end-to-end duration, seconds per "service.name" stage (summed when a
+        stage ran several times), the time between the worker storing the result and a client
+        receiving it, and the spans in start order with offsets from the first one. None if
+        there are no spans.
+    """
+    spans = sorted((json.loads(span) for span in stored_spans), key=lambda span: span["start"])
+    if not spans:
+        return None
+
+    first_start = spans[0]["start"]
+    stages = {}
+    for span in spans:
+        stage = f"{span['service']}.{span['name']}"
+        stages[stage] = round(stages.get(stage, 0.0) + span["duration_s"], 6)
+        span["offset_s"] = round(span["start"] - first_start, 6)
+
+    def first_end(name):
+        ends = [span["start"] + span["duration_s"] for span in spans if span["name"] == name]
+        return min(ends) if ends else None
+
+    result_stored, delivered = first_end("write_result"), first_end("deliver")
+    return {
+        "task_id": task_id,
+        "trace_id": spans[0]["trace_id"],
+        "total_s": round(max(span["start"] + span["duration_s"] for span in spans) - first_start, 6),
+        "stages_s": stages,
+        "delivery_delay_s": round(max(0.0, delivered - result_stored), 6) if result_stored and delivered else None,
+        "spans": spans,
+    }
@@ -0,0 +1,62 @@
+from backend.markdown_chunks import PAGE_BREAK_MARKER, split_sections
+from backend.markdown_compaction import compact_markdown, dedupe_running_lines
+
+
+def pages(*blocks_per_page):
+    return f"\n\n{PAGE_BREAK_MARKER}\n\n".join("\n\n".join(blocks) for blocks in blocks_per_page)
+
+
+def test_bare_numbers_and_years_are_kept():
+    markdown = pages(
+        ["Revenue by year", "2021", "Body text of page one.", "12"],
+        ["Revenue by year", "2022", "Body text of page two.", "12"],
+        ["Revenue by year", "2023", "Body text of page three.", "12"],
+    )
+    compact = compact_markdown(markdown)
+    for value in ("2021", "2022", "2023"):
+        assert value in compact
+    assert compact.count("12") == 3
+
+
+def test_repeated_headings_are_kept():
+    markdown = pages(
+        ["### Highlights", "Sales grew in the north."],
+        ["### Highlights", "Sales held in the south."],
+        ["### Highlights", "Sales fell in the west."],
+    )
+    assert compact_markdown(markdown).count("### Highlights") == 3
+
+
+def test_repeated_body_lines_away_from_page_edges_are_kept():
+    body = ["Intro.", "First point.", "Not applicable.", "Second point.", "Closing."]
+    markdown = pages(body, body, body)
+    assert compact_markdown(markdown).count("Not applicable.") == 3
+
+
+def test_running_header_and_page_numbers_are_dropped():
+    markdown = pages(*[
+        ["ACME Corporation - Annual Report", f"Body text of page {page}.", f"Page {page} of 3"]
+        for page in (1, 2, 3)
+    ])
+    compact = compact_markdown(markdown)
+    assert compact.count("ACME Corporation - Annual Report") == 1
+    assert "Page 2 of 3" not in compact
+    for page in (1, 2, 3):
+        assert f"Body text of page {page}." in compact
+
+
+def test_page_breaks_are_kept():
+    markdown = pages(*[["Running title", f"Section {page} body."] for page in range(1, 5)])
+    compact = compact_markdown(markdown)
+    assert compact.count(PAGE_BREAK_MARKER) == 3
+    assert len(split_sections(compact)) == 4
+
+
+def test_markdown_without_page_breaks_is_not_deduped():
+    markdown = "\n\n".join(["ACME Corporation", "Body text."] * 4)
+    assert dedupe_running_lines(markdown) == markdown
+
+
+def test_image_refs_and_table_padding_are_removed():
+    markdown = "Intro.\n\n![Image](../images/report-image-1.png)\n\n| a    | b    |\n|------|------|\n| 1    | 2    |"
+    assert compact_markdown(markdown) == "Intro.\n\n| a | b |\n| --- | --- |\n| 1 | 2 |"